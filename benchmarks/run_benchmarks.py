@@ -0,0 +1,374 @@
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import filter_engine
+
+# Version of the results format, bumped when fields change meaning
+RESULTS_VERSION = 1
+
+# Default share of each kind of line in the synthetic lists
+DEFAULT_MIX = {"network": 0.55, "exception": 0.1, "cosmetic": 0.25, "scriptlet": 0.05, "comment": 0.05}
+
+# Words the synthetic rules are built from, the default keywords use them too
+WORDS = ["ads", "banner", "track", "pixel", "analytics", "promo", "sponsor", "popup", "cookie", "beacon", "metrics", "widget"]
+TLDS = ["com", "net", "org", "io", "de", "co.uk"]
+NETWORK_OPTIONS = ["third-party", "3p", "script", "image", "xhr", "subdocument", "~third-party", "important"]
+
+# Keywords typed one character at a time by the per-keystroke search benchmark
+DEFAULT_KEYWORDS = ["banner", "analytics12.com", "domain:promo3.net", "re:^\\|\\|ads\\d+ AND NOT third-party"]
+
+# A metric is reported as a regression when it is this much slower than the baseline
+REGRESSION_THRESHOLD = 1.2
+
+
+# Request handler that serves the generated files without logging every request
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# Parse a rule mix such as "network=0.6,cosmetic=0.4" into normalised shares
+def parse_mix(text):
+    mix = dict.fromkeys(DEFAULT_MIX, 0.0)
+    for part in text.split(","):
+        name, _, share = part.partition("=")
+        name = name.strip()
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"unknown rule kind {name!r}, expected one of {', '.join(mix)}")
+        mix[name] = float(share)
+    total = sum(mix.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("the rule mix must have a positive share")
+    return {name: share / total for name, share in mix.items()}
+
+
+# Make up a domain name
+def random_domain(rng):
+    return f"{rng.choice(WORDS)}{rng.randrange(1000)}.{rng.choice(TLDS)}"
+
+
+# Make up one line of a filter list of the given kind
+def random_rule(rng, kind):
+    if kind == "comment":
+        return f"! {rng.choice(WORDS)} section {rng.randrange(100)}"
+    if kind == "cosmetic":
+        return f"{random_domain(rng)}##.{rng.choice(WORDS)}-{rng.randrange(10000)}"
+    if kind == "scriptlet":
+        return f"{random_domain(rng)}##+js(set-constant, {rng.choice(WORDS)}.enabled, false)"
+
+    rule = f"||{random_domain(rng)}^"
+    if rng.random() < 0.3:
+        rule = f"||{random_domain(rng)}/{rng.choice(WORDS)}/{rng.randrange(100)}.js"
+    options = rng.sample(NETWORK_OPTIONS, rng.randrange(3))
+    if rng.random() < 0.2:
+        options.append("domain=" + "|".join(random_domain(rng) for _ in range(rng.randrange(1, 4))))
+    if options:
+        rule += "$" + ",".join(options)
+    return ("@@" if kind == "exception" else "") + rule
+
+
+# Write a synthetic catalog with its lists into a directory served as base_url
+def generate_catalog(directory, base_url, list_count, rules_per_list, mix, seed):
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    catalog = []
+    for list_number in range(list_count):
+        filename = f"list{list_number}.txt"
+        with open(os.path.join(directory, filename), "w") as file:
+            file.write(f"[Adblock Plus 2.0]\n! Title: Synthetic list {list_number}\n")
+            for kind in rng.choices(kinds, weights, k=rules_per_list):
+                file.write(random_rule(rng, kind) + "\n")
+        catalog.append({
+            "uuid": f"synthetic-{list_number}",
+            "title": f"Synthetic list {list_number}",
+            "sources": [{"url": f"{base_url}/{filename}", "title": f"synthetic{list_number}"}],
+        })
+    with open(os.path.join(directory, "list_catalog.json"), "w") as file:
+        json.dump(catalog, file)
+    return catalog
+
+
+# Serve a directory over HTTP on a free local port in a background thread
+def start_server(directory):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Peak resident memory of this process so far, in KiB
+def get_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes, Linux KiB
+
+
+# Run one benchmark phase, returning its result with the time taken and memory used
+def run_phase(name, function, trace_memory):
+    print(f"Running {name}...", file=sys.stderr)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function() or {}
+    result["seconds"] = time.perf_counter() - start
+    if trace_memory:
+        result["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    result["peak_rss_kib"] = get_peak_rss()
+    return result
+
+
+# Summarise a list of durations in seconds
+def summarize(durations):
+    ordered = sorted(durations)
+    return {
+        "count": len(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+# Download every list into an empty cache, as on a first start
+def benchmark_cold_fetch(catalog):
+    sources = [source for _, sources in filter_engine.get_selected_lists(catalog, [item["uuid"] for item in catalog]) for source in sources]
+    fetched = filter_engine.prefetch_sources(sources)
+    return {"lists": len(sources), "failed": sum(1 for ok in fetched.values() if not ok)}
+
+
+# Revalidate every saved list, the server answers 304 Not Modified
+def benchmark_revalidate(catalog):
+    max_age = filter_engine.CACHE_MAX_AGE
+    filter_engine.CACHE_MAX_AGE = -1  # Treat every saved list as stale
+    try:
+        return benchmark_cold_fetch(catalog)
+    finally:
+        filter_engine.CACHE_MAX_AGE = max_age
+
+
+# Load the catalog the way the GUI does when it starts: the cached copy first, then a refresh
+def benchmark_startup():
+    start = time.perf_counter()
+    filter_engine.init_local_content()
+    cached = filter_engine.load_cached_catalog()
+    cached_seconds = time.perf_counter() - start
+    catalog = filter_engine.load_catalog(refresh=True)
+    return {"cached_catalog_seconds": cached_seconds, "lists": len(catalog or cached or [])}
+
+
+# Search every prefix of each keyword, as the debounced GUI search does while typing
+def benchmark_keystrokes(catalog, keywords, workers):
+    uuids = [item["uuid"] for item in catalog]
+    per_keyword = {}
+    all_durations = []
+    for keyword in keywords:
+        filter_engine.last_search = None
+        durations = []
+        hits = 0
+        for length in range(1, len(keyword) + 1):
+            start = time.perf_counter()
+            hits = 0
+            for event in filter_engine.iter_search_results(catalog, keyword[:length], uuids, workers=workers, interactive=True):
+                if event[0] == "source":
+                    hits += len(event[3])
+            durations.append(time.perf_counter() - start)
+        per_keyword[keyword] = dict(summarize(durations), hits=hits)
+        all_durations.extend(durations)
+    return {"keystrokes": summarize(all_durations), "keywords": per_keyword}
+
+
+# Make up rules to compare: a third copied from the lists, a third reordered equivalents, a third new
+def make_compare_rules(existing_filters, count, seed):
+    rng = random.Random(seed)
+    rules = []
+    network_rules = [rule for rule in existing_filters if "$" in rule and "," in rule.split("$")[-1]]
+    for number in range(count):
+        if number % 3 == 0 and existing_filters:
+            rules.append(rng.choice(existing_filters))
+        elif number % 3 == 1 and network_rules:
+            pattern, _, options = rng.choice(network_rules).rpartition("$")
+            rules.append(pattern + "$" + ",".join(reversed(options.split(","))))
+        else:
+            rules.append(random_rule(rng, "network"))
+    return rules
+
+
+# Compare rules against the search results, as Compare Filters does
+def benchmark_compare(catalog, rule_count, seed, workers):
+    uuids = [item["uuid"] for item in catalog]
+    existing_filters = [hit["rule"] for hit in filter_engine.iter_hits(catalog, "", uuids, workers=workers)]
+    rules = make_compare_rules(existing_filters, rule_count, seed)
+    start = time.perf_counter()
+    index = filter_engine.build_filter_index(existing_filters)
+    statuses = {}
+    for rule in rules:
+        status, _ = filter_engine.classify_rule(index, rule)
+        statuses[status] = statuses.get(status, 0) + 1
+    return {"existing_filters": len(existing_filters), "rules": len(rules), "classify_seconds": time.perf_counter() - start, "statuses": statuses}
+
+
+# Compare rules against the whole catalog through the membership index, building it first
+def benchmark_catalog_compare(catalog, rule_count, seed):
+    uuids = [item["uuid"] for item in catalog]
+    existing_filters = [hit["rule"] for hit in filter_engine.iter_hits(catalog, "", uuids)]
+    rules = make_compare_rules(existing_filters, rule_count, seed)
+    start = time.perf_counter()
+    index = filter_engine.load_catalog_membership_index(catalog)
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    duplicates = sum(1 for _, sources in filter_engine.iter_catalog_comparison(catalog, rules) if sources)
+    return {
+        "indexed_rules": len(index["hashes"]) if index else 0,
+        "index_seconds": build_seconds,
+        "lookup_seconds": time.perf_counter() - start,
+        "rules": len(rules),
+        "duplicates": duplicates,
+    }
+
+
+# Collect and render the results of a search in the GUI's result view, needs a display
+def benchmark_render(catalog, keyword):
+    try:
+        import tkinter as tk
+        import filter_search_app
+        root = tk.Tk()
+    except Exception as e:  # No tkinter or no display
+        return {"skipped": str(e)}
+    try:
+        root.withdraw()
+        filter_search_app.data = catalog
+        start = time.perf_counter()
+        blocks, filters = filter_search_app.collect_results(keyword, [item["uuid"] for item in catalog], False)
+        collect_seconds = time.perf_counter() - start
+
+        view = filter_search_app.ResultView(tk.Frame(root), width=80, height=40)
+        start = time.perf_counter()
+        view.set_blocks(blocks)
+        root.update_idletasks()
+        render_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(100):
+            view.scroll(1, "pages")
+            root.update_idletasks()
+        scroll_seconds = (time.perf_counter() - start) / 100
+        return {"rows": view.total, "filters": len(filters), "collect_seconds": collect_seconds, "render_seconds": render_seconds, "page_scroll_seconds": scroll_seconds}
+    finally:
+        root.destroy()
+
+
+# Get the seconds of every timing in a results document, keyed by dotted path
+def flatten_timings(results, prefix=""):
+    timings = {}
+    for name, value in results.items():
+        path = f"{prefix}{name}"
+        if isinstance(value, dict):
+            timings.update(flatten_timings(value, path + "."))
+        elif isinstance(value, (int, float)) and (name.endswith("seconds") or name in ("median", "p95", "max")):
+            timings[path] = value
+    return timings
+
+
+# Print the timings that got slower than in a baseline results file, returns how many did
+def report_regressions(document, baseline_filename):
+    with open(baseline_filename) as file:
+        baseline_document = json.load(file)
+    if baseline_document["config"] != document["config"]:
+        print("Warning: the baseline was run with a different configuration", file=sys.stderr)
+    baseline = flatten_timings(baseline_document["results"])
+    regressions = 0
+    for path, seconds in flatten_timings(document["results"]).items():
+        previous = baseline.get(path)
+        if previous and seconds > previous * REGRESSION_THRESHOLD:
+            print(f"Regression in {path}: {previous:.4f}s -> {seconds:.4f}s", file=sys.stderr)
+            regressions += 1
+    return regressions
+
+
+# Generate the catalog, run every benchmark phase and write the results as JSON
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the filter engine against a generated catalog served over local HTTP.")
+    parser.add_argument("--lists", type=int, default=10, help="number of generated lists (default 10)")
+    parser.add_argument("--rules", type=int, default=20000, help="rules per list (default 20000)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="share of each kind of line, e.g. network=0.6,cosmetic=0.3,comment=0.1")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the generated lists and rules (default 1)")
+    parser.add_argument("--keyword", action="append", help="keyword typed one character at a time, can be repeated")
+    parser.add_argument("--compare-rules", type=int, default=3000, help="rules compared in the compare benchmarks (default 3000)")
+    parser.add_argument("-j", "--workers", type=int, help="search worker processes (default one per CPU core)")
+    parser.add_argument("--trace-memory", action="store_true", help="also record the peak Python allocations of each phase, slows the timings down")
+    parser.add_argument("--baseline", help="earlier results file, slower timings are reported and make the exit status 1")
+    parser.add_argument("-o", "--output", help="file to write the results to, stdout by default")
+    args = parser.parse_args(argv)
+
+    config = {
+        "lists": args.lists,
+        "rules_per_list": args.rules,
+        "mix": args.mix,
+        "seed": args.seed,
+        "keywords": args.keyword or DEFAULT_KEYWORDS,
+        "compare_rules": args.compare_rules,
+        "workers": args.workers if args.workers is not None else filter_engine.SEARCH_WORKERS,
+    }
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    with tempfile.TemporaryDirectory() as served, tempfile.TemporaryDirectory() as work:
+        server = start_server(served)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        catalog = generate_catalog(served, base_url, args.lists, args.rules, args.mix, args.seed)
+        filter_engine.CATALOG_URL = f"{base_url}/list_catalog.json"
+
+        # The engine keeps its cache in local_content/ under the working directory
+        previous_directory = os.getcwd()
+        os.chdir(work)
+        try:
+            results = {}
+            results["startup_cold"] = run_phase("cold startup", benchmark_startup, args.trace_memory)
+            results["fetch_cold"] = run_phase("cold fetch", lambda: benchmark_cold_fetch(catalog), args.trace_memory)
+            results["fetch_revalidate"] = run_phase("revalidation", lambda: benchmark_revalidate(catalog), args.trace_memory)
+            results["startup_warm"] = run_phase("warm startup", benchmark_startup, args.trace_memory)
+            results["search"] = run_phase("per-keystroke search", lambda: benchmark_keystrokes(catalog, config["keywords"], args.workers), args.trace_memory)
+            results["compare"] = run_phase("compare", lambda: benchmark_compare(catalog, args.compare_rules, args.seed, args.workers), args.trace_memory)
+            results["compare_catalog"] = run_phase("catalog compare", lambda: benchmark_catalog_compare(catalog, args.compare_rules, args.seed), args.trace_memory)
+            results["render"] = run_phase("render", lambda: benchmark_render(catalog, config["keywords"][0]), args.trace_memory)
+        finally:
+            filter_engine.cleanup_local_content()
+            os.chdir(previous_directory)
+            server.shutdown()
+
+    document = {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as file:
+            json.dump(document, file, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+
+    if baseline and report_regressions(document, baseline):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
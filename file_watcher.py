@@ -0,0 +1,119 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# Seconds between checks of a watched file, the only checks there are when inotify is not available
+POLL_INTERVAL = 2.0
+
+# Seconds a file must stay quiet after an inotify event before it is checked, so a save that writes
+# and renames several times is reported once
+SETTLE_DELAY = 0.2
+
+# inotify events that can mean the watched file changed. They are watched on its directory, since programs
+# like Brave replace a file by renaming a new one over it, which a watch on the file itself would not follow.
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Header of an inotify event: watch descriptor, mask, cookie and length of the name that follows it
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+# Get what tells versions of a file apart, (inode, mtime, size), or None if it does not exist
+def get_file_version(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+# Watch the directory of a file with inotify, returns the non-blocking inotify descriptor,
+# or None where inotify is not available, such as on macOS, or the directory cannot be watched
+def open_inotify(path):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)  # Same values as IN_NONBLOCK and IN_CLOEXEC
+    except (OSError, AttributeError):
+        return None
+    if descriptor < 0:
+        return None
+    directory = os.path.dirname(os.path.abspath(path))
+    if libc.inotify_add_watch(descriptor, os.fsencode(directory), WATCH_MASK) < 0:
+        os.close(descriptor)
+        return None
+    return descriptor
+
+
+# Read the pending events of an inotify descriptor, returns the names of the files they are about
+def read_inotify_names(descriptor):
+    names = set()
+    while True:
+        try:
+            data = os.read(descriptor, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            names.add(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+
+# Watch one file from a daemon thread and call on_change(version) each time it has changed, or was created or
+# removed (version None). Uses inotify where available, and checks the file every interval seconds in any case.
+class FileWatcher:
+    def __init__(self, path, on_change, interval=POLL_INTERVAL):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.version = get_file_version(path)
+        self.stopped = threading.Event()
+        self.mode = None  # "inotify" or "polling" once started
+
+    # Start watching in a daemon thread
+    def start(self):
+        descriptor = open_inotify(self.path)
+        self.mode = "polling" if descriptor is None else "inotify"
+        threading.Thread(target=self.run, args=(descriptor,), daemon=True).start()
+
+    # Stop watching, the thread ends within one interval
+    def stop(self):
+        self.stopped.set()
+
+    # Wait for changes until stopped, closing the inotify descriptor at the end
+    def run(self, descriptor):
+        name = os.fsencode(os.path.basename(self.path))
+        try:
+            while not self.stopped.is_set():
+                if descriptor is None:
+                    self.stopped.wait(self.interval)
+                elif select.select([descriptor], [], [], self.interval)[0] and name in read_inotify_names(descriptor):
+                    # Let a save finish, taking in the events it still causes
+                    while select.select([descriptor], [], [], SETTLE_DELAY)[0]:
+                        read_inotify_names(descriptor)
+                if not self.stopped.is_set():
+                    self.check()
+        finally:
+            if descriptor is not None:
+                os.close(descriptor)
+
+    # Report the file if its version is not the one last seen
+    def check(self):
+        version = get_file_version(self.path)
+        if version != self.version:
+            self.version = version
+            try:
+                self.on_change(version)
+            except Exception as e:
+                print(f"Error handling a change of {self.path}: {e}", file=sys.stderr)
@@ -0,0 +1,1870 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import gzip
+import mmap
+import re
+import zlib
+from collections import OrderedDict
+from itertools import accumulate
+from operator import itemgetter
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from filter_rules import build_rule_index, parse_query, get_rule_candidates, search_rule_index, is_structured_query, canonicalize_rule
+from filter_query import is_pattern_query, compile_pattern_query, match_query, search_buffer
+from filter_metrics import timed, record, profile_call, start_profiling, stop_profiling, export_metrics
+from rule_coverage import build_coverage_index, find_covering_rule
+from url_matcher import build_url_matcher, match_url, is_blocked, REQUEST_TYPES
+from rule_membership import build_membership_index, update_membership_index, save_membership_index, load_membership_index, find_rule_sources, get_rule_lines
+from rule_store import RuleStore
+from file_watcher import FileWatcher, get_file_version
+
+# Directory to store local content, kept between runs as an HTTP cache
+LOCAL_CONTENT_DIR = "local_content"
+
+# File holding the validators and access times of cached downloads, keyed by URL
+CACHE_METADATA_FILE = os.path.join(LOCAL_CONTENT_DIR, "cache_metadata.json")
+
+# Brave's browser-wide settings, holding the enabled lists and the custom filters
+LOCAL_STATE_PATH = os.path.expanduser('~/Library/Application Support/BraveSoftware/Brave-Browser/Local State')
+
+# Number of earlier copies of Local State kept as "Local State.bak1" (newest) to "Local State.bak3"
+LOCAL_STATE_BACKUPS = 3
+
+# Official catalog of Brave's default and optional filter lists
+CATALOG_URL = "https://raw.githubusercontent.com/brave/adblock-resources/master/filter_lists/list_catalog.json"
+
+# Local copy of the catalog, used to build the window before the catalog is refreshed
+CATALOG_CACHE_FILE = os.path.join(LOCAL_CONTENT_DIR, "list_catalog.json.gz")
+
+# Downloads are streamed to gzip files in chunks of this many bytes, so no list is held in memory whole
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+COMPRESS_LEVEL = 6
+
+# Size of the compressed pieces fed to the decompressor by pattern searches over mapped list files
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+# Index of which catalog lists contain each rule, used to compare against every list at once
+MEMBERSHIP_INDEX_FILE = os.path.join(LOCAL_CONTENT_DIR, "membership.idx")
+
+# Seconds a cached list is used without asking the server whether it changed
+CACHE_MAX_AGE = 6 * 60 * 60
+
+# Total bytes of cached lists kept on disk, least recently used lists are removed first
+CACHE_MAX_SIZE = 500 * 1024 * 1024
+
+# Trigram index files are saved gzip-compressed next to the list they index
+TRIGRAM_INDEX_SUFFIX = ".trigram"
+TRIGRAM_INDEX_MAGIC = b"BFSTRIGRAM2\n"
+
+# Suffix of the copy of a list as it was before its last change, kept when a refresh downloads a new version
+SNAPSHOT_SUFFIX = ".prev"
+
+# Suffix of the file recording the rules added and removed by the last change of a list
+CHANGES_SUFFIX = ".changes"
+
+# Formats results can be exported in: one rule per line, CSV with a header row, or one JSON object per line
+EXPORT_FORMATS = ("txt", "csv", "jsonl")
+
+# Fields of an exported search hit, comparison against existing filters, and comparison against the whole catalog
+HIT_FIELDS = ("list", "source", "url", "rule")
+COMPARISON_FIELDS = ("rule", "status", "existing")
+CATALOG_COMPARISON_FIELDS = ("rule", "status", "lists")
+
+# Number of lists whose loaded trigram indexes are kept in memory, the least recently used one is dropped first
+TRIGRAM_INDEX_CACHE_SIZE = 8
+
+# In-memory cache of loaded trigram indexes, keyed by list filename in order of use, guarded by trigram_index_lock
+trigram_index_cache = OrderedDict()
+trigram_index_lock = threading.Lock()
+
+# Held while a trigram index is built, so lists downloaded in parallel are indexed one after another
+trigram_build_lock = threading.Lock()
+
+# Number of lists whose field indexes for structured queries are kept in memory, each search worker process keeps
+# its own. An index takes about as much memory as its list, the least recently used one is dropped first.
+RULE_INDEX_CACHE_SIZE = 4
+
+# In-memory cache of the field indexes used by structured queries, keyed by list filename in order of use,
+# guarded by rule_index_lock
+rule_index_cache = OrderedDict()
+rule_index_lock = threading.Lock()
+
+# Number of lists downloaded at the same time
+FETCH_WORKERS = 8
+
+# Connect and read timeouts in seconds for each request
+FETCH_TIMEOUT = (10, 60)
+
+# Number of times a failed request is retried
+FETCH_RETRIES = 3
+
+# Number of processes searching lists at the same time, 1 searches in this process only
+SEARCH_WORKERS = os.cpu_count() or 1
+
+# Selections whose saved lists add up to fewer bytes than this are searched in this process,
+# starting worker processes would take longer than the search itself
+PARALLEL_SEARCH_MIN_SIZE = 2 * 1024 * 1024
+
+# Pool of search worker processes, started on the first large search, with the number of searches submitted
+# to it that have not finished. Guarded by search_pool_lock.
+search_pool = None
+search_pool_workers = None
+search_pool_pending = 0
+search_pool_lock = threading.Lock()
+
+# Keyword, selection and per-source matches of the last completed search, used to narrow the next one
+last_search = None
+
+# Interactive plain and pattern searches over at least this many lists go through the rule store once it holds them,
+# so a rule that several of them have is checked once
+RULE_STORE_MIN_LISTS = 2
+
+# Distinct lines of the selected lists, each list kept as an array of rule ids, guarded by rule_store_lock.
+# Lists are dropped from it once they are no longer selected.
+rule_store = RuleStore()
+rule_store_lock = threading.Lock()
+
+# Thread filling the rule store with the selected lists in the background and the lists it is to hold next,
+# guarded by rule_store_fill_lock. The filler is None while no fill is running.
+rule_store_filler = None
+rule_store_fill_pending = None
+rule_store_fill_lock = threading.Lock()
+
+# Last parsed Local State, reused while the file's (path, inode, mtime, size) is unchanged,
+# with the active lists and custom filters read from it once they are asked for
+local_state_cache = {"key": None, "document": None, "filters": None}
+local_state_lock = threading.Lock()
+
+# Active lists and custom filters of Local State as last reported by get_local_state_changes
+local_state_seen = {"path": None, "filters": None}
+
+# Watcher reporting changes of Local State, None while not watching
+local_state_watcher = None
+
+# Loaded catalog membership index with the file keys it was built from, guarded by membership_lock
+membership_index_cache = {"files": None, "index": None}
+membership_lock = threading.Lock()
+
+# Coverage index over the analysed lists with the file keys it was built from, guarded by coverage_lock
+coverage_index_cache = {"files": None, "index": None}
+coverage_lock = threading.Lock()
+
+# URL matcher over the tested lists with the file keys it was built from, guarded by url_matcher_lock
+url_matcher_cache = {"files": None, "index": None}
+url_matcher_lock = threading.Lock()
+
+# Metadata of the HTTP cache, guarded by cache_lock since downloads run in parallel
+cache_metadata = {}
+cache_lock = threading.Lock()
+
+# Create the HTTP session shared by all downloads, so connections are kept alive and reused
+def create_http_session():
+    session = requests.Session()
+    retry = Retry(
+        total=FETCH_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+http_session = create_http_session()
+
+# Fetch JSON data from a URL
+def fetch_json_data(url):
+    with timed("fetch_json", url):
+        try:
+            response = http_session.get(url, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            return response.json()
+        except requests.RequestException as e:
+            print(f"Error fetching JSON data: {e}", file=sys.stderr)
+            return []
+
+# Raised when a file changed between being read and being replaced, replacing it would lose that change
+class FileChangedError(OSError):
+    pass
+
+# Load and parse Local State, only reading the file again when it has changed
+def load_local_state(path=LOCAL_STATE_PATH):
+    with timed("local_state") as counters:
+        key = (path,) + (get_file_version(path) or ())
+        with local_state_lock:
+            if local_state_cache["key"] == key:
+                counters["cache_hits"] = 1
+                return local_state_cache["document"]
+
+        with open(path, 'r') as file:
+            raw_content = file.read()
+        json_start_index = raw_content.find('{')
+        if json_start_index == -1:
+            raise ValueError("No valid JSON found in the file.")
+        document = json.loads(raw_content[json_start_index:])
+        counters["bytes"] = len(raw_content)
+
+        with local_state_lock:
+            local_state_cache.update(key=key, document=document, filters=None)
+        return document
+
+# Load the brave.ad_block settings from Local State, callers must not modify the result
+def load_ad_block_state(path=LOCAL_STATE_PATH):
+    return load_local_state(path)['brave']['ad_block']
+
+# Get the uuids of the active lists and the custom filters of Local State as two tuples,
+# read out of the parsed file once per version of it rather than on every search
+def load_local_filters(path=LOCAL_STATE_PATH):
+    document = load_local_state(path)
+    with local_state_lock:
+        if local_state_cache["document"] is document and local_state_cache["filters"] is not None:
+            return local_state_cache["filters"]
+
+    ad_block = document['brave']['ad_block']
+    active_filters = tuple(
+        uuid for uuid, details in ad_block.get('regional_filters', {}).items()
+        if details.get('enabled')
+    )
+    custom_filters = tuple(filter for filter in ad_block.get('custom_filters', '').strip().splitlines() if filter)
+    with local_state_lock:
+        if local_state_cache["document"] is document:
+            local_state_cache["filters"] = (active_filters, custom_filters)
+    return active_filters, custom_filters
+
+# Load the active filters
+def load_active_filters():
+    try:
+        return list(load_local_filters()[0])
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading active filters: {e}", file=sys.stderr)
+        return []
+
+# Load custom filters
+def load_custom_filters():
+    try:
+        return list(load_local_filters()[1])
+    except Exception as e:
+        print(f"Error loading custom filters: {e}", file=sys.stderr)
+        return []
+
+# Get what changed in the active lists and custom filters of Local State since the last call, as a dict of the
+# uuids enabled and disabled and the custom filters added and removed, or None if nothing did.
+# The first call for a path only records them. A missing or unreadable file counts as having neither.
+def get_local_state_changes(path=LOCAL_STATE_PATH):
+    try:
+        active_filters, custom_filters = load_local_filters(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading Local State: {e}", file=sys.stderr)
+        active_filters, custom_filters = (), ()
+
+    with local_state_lock:
+        previous = local_state_seen["filters"] if local_state_seen["path"] == path else None
+        local_state_seen.update(path=path, filters=(active_filters, custom_filters))
+    if previous is None or previous == (active_filters, custom_filters):
+        return None
+
+    previous_active, previous_custom = set(previous[0]), set(previous[1])
+    active, custom = set(active_filters), set(custom_filters)
+    return {
+        "enabled": [uuid for uuid in active_filters if uuid not in previous_active],
+        "disabled": [uuid for uuid in previous[0] if uuid not in active],
+        "custom_added": [filter for filter in custom_filters if filter not in previous_custom],
+        "custom_removed": [filter for filter in previous[1] if filter not in custom],
+    }
+
+# Watch Local State and call on_change with the changes of get_local_state_changes each time Brave changes
+# its active lists or custom filters. on_change runs on the watcher thread. Replaces any earlier watcher.
+def start_local_state_watcher(on_change, path=LOCAL_STATE_PATH):
+    global local_state_watcher
+    stop_local_state_watcher()
+    get_local_state_changes(path)  # Start from the current state
+
+    def on_file_change(version):
+        changes = get_local_state_changes(path)
+        if changes is not None:
+            on_change(changes)
+
+    local_state_watcher = FileWatcher(path, on_file_change)
+    local_state_watcher.start()
+    return local_state_watcher
+
+# Stop watching Local State, if it is watched
+def stop_local_state_watcher():
+    global local_state_watcher
+    if local_state_watcher is not None:
+        local_state_watcher.stop()
+        local_state_watcher = None
+
+# Serialize a JSON document in the layout of the original text: compact as Brave writes it, or indented
+def dump_json_like(document, original):
+    match = re.search(r'\n([ \t]+)"', original)
+    if match is None:
+        content = json.dumps(document, separators=(',', ':'), ensure_ascii=False)
+    else:
+        content = json.dumps(document, indent=match.group(1), ensure_ascii=False)
+    return content + original[len(original.rstrip()):]  # Keep a trailing newline if there was one
+
+# Keep a copy of a file as path.bak1, moving older copies up to LOCAL_STATE_BACKUPS
+def backup_file(path, count=LOCAL_STATE_BACKUPS):
+    if count < 1:
+        return
+    for number in range(count - 1, 0, -1):
+        older = f"{path}.bak{number}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.bak{number + 1}")
+    shutil.copy2(path, f"{path}.bak1")
+
+# Replace a file with new content so readers see either the old or the new file, never a partial one:
+# the content goes to a temporary file in the same directory, is synced to disk and renamed over the file.
+# With expected_version, the version of the file from get_file_version when it was read, raises FileChangedError
+# instead of replacing it if something else wrote it in the meantime. With backups, the file is kept as path.bak1
+# and older copies moved up to that many, only once it is certain to be replaced.
+def write_file_atomically(path, content, expected_version=None, backups=0):
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        # Checked as late as possible, right before the rename
+        if expected_version is not None and get_file_version(path) != expected_version:
+            raise FileChangedError(f"{path} was changed by another program while it was being updated")
+        if backups and os.path.exists(path):
+            backup_file(path, backups)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Sync the directory too, so the rename itself survives a crash
+    if hasattr(os, 'O_DIRECTORY'):
+        directory_descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory_descriptor)
+        finally:
+            os.close(directory_descriptor)
+
+# Add rules to the custom filters in Local State, returns how many of them were new.
+# Local State is read fresh, merged in one pass and written back atomically in its own layout,
+# after keeping a backup of the previous version. Raises FileChangedError without writing when the file
+# changes between being read and being replaced, as it does while Brave is running, and OSError or ValueError
+# on other failures.
+def add_custom_filters(new_filters, path=LOCAL_STATE_PATH):
+    with timed("local_state_write") as counters:
+        version = get_file_version(path)
+        with open(path, 'r', encoding='utf-8') as file:
+            raw_content = file.read()
+        if get_file_version(path) != version:
+            raise FileChangedError(f"{path} was changed by another program while it was being read")
+        json_start_index = raw_content.find('{')
+        if json_start_index == -1:
+            raise ValueError("No valid JSON found in the file.")
+        document = json.loads(raw_content[json_start_index:])
+        ad_block = document['brave']['ad_block']
+
+        # Existing filters stay as they are, the new ones are deduplicated in order with a dict as ordered set
+        existing_filters = ad_block.get('custom_filters', '').strip().splitlines()
+        existing_filter_set = set(existing_filters)
+        additions = dict.fromkeys(
+            new_filter for new_filter in (new_filter.strip() for new_filter in new_filters)
+            if new_filter and new_filter not in existing_filter_set
+        )
+        counters["added"] = len(additions)
+        if not additions:
+            return 0
+
+        ad_block['custom_filters'] = "\n".join(existing_filters + list(additions))
+        content = raw_content[:json_start_index] + dump_json_like(document, raw_content[json_start_index:])
+        write_file_atomically(path, content, version, LOCAL_STATE_BACKUPS)
+        return len(additions)
+
+# Load the HTTP cache metadata saved by a previous run
+def load_cache_metadata():
+    global cache_metadata
+    try:
+        with open(CACHE_METADATA_FILE, 'r', encoding='utf-8') as file:
+            metadata = json.load(file)
+        # Drop entries whose file has gone missing
+        cache_metadata = {url: entry for url, entry in metadata.items() if os.path.exists(entry.get('filename', ''))}
+    except FileNotFoundError:
+        cache_metadata = {}
+    except (OSError, ValueError) as e:
+        print(f"Error loading cache metadata: {e}", file=sys.stderr)
+        cache_metadata = {}
+
+# Save the HTTP cache metadata
+def save_cache_metadata():
+    with cache_lock:
+        content = json.dumps(cache_metadata)
+    try:
+        temp_filename = CACHE_METADATA_FILE + ".part"
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            file.write(content)
+        os.replace(temp_filename, CACHE_METADATA_FILE)
+    except OSError as e:
+        print(f"Error saving cache metadata: {e}", file=sys.stderr)
+
+# Check whether a cached list can be used without revalidating it
+def is_cache_fresh(url, filename):
+    with cache_lock:
+        entry = cache_metadata.get(url)
+    return (
+        entry is not None
+        and entry['filename'] == filename
+        and os.path.exists(filename)
+        and time.time() - entry['validated_at'] < CACHE_MAX_AGE
+    )
+
+# Record a use of a cached list for LRU eviction
+def touch_cache_entry(url):
+    with cache_lock:
+        if url in cache_metadata:
+            cache_metadata[url]['last_access'] = time.time()
+
+# Get the content of a URL as text, from the cache while it is fresh and revalidated otherwise
+def get_url_content(url, filename, build_index=True):
+    if ensure_url_content(url, filename, build_index):
+        return load_local_content(filename)
+    return None
+
+# Make sure a current copy of a URL is saved, returns False if there is none
+def ensure_url_content(url, filename, build_index=True):
+    if is_cache_fresh(url, filename):
+        touch_cache_entry(url)
+        return True
+    return fetch_and_save_url_content(url, filename, build_index)
+
+# Fetch the content from a URL and stream it to a compressed local file, revalidating the saved copy
+# if there is one. Returns True when a current copy is saved.
+def fetch_and_save_url_content(url, filename, build_index=True):
+    headers = {}
+    with cache_lock:
+        entry = cache_metadata.get(url)
+    cached = bool(entry) and entry['filename'] == filename and os.path.exists(filename)
+    if cached:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    # Write to a temporary file first so a search never reads a partly written list
+    temp_filename = f"{filename}.{threading.get_ident()}.part"
+    with timed("fetch", url) as counters:
+        try:
+            with http_session.get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as response:
+                if response.status_code == 304 and headers:
+                    # Not modified, the saved copy is still current
+                    with cache_lock:
+                        entry['validated_at'] = entry['last_access'] = time.time()
+                    counters["not_modified"] = 1
+                    return True
+                response.raise_for_status()  # Raise an exception for HTTP errors
+                content_type = response.headers.get('Content-Type', '')
+                if 'text' not in content_type and 'json' not in content_type:
+                    print(f"Skipping non-text content from {url}", file=sys.stderr)
+                    return False
+                with gzip.open(temp_filename, 'wb', compresslevel=COMPRESS_LEVEL) as file:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        file.write(chunk)
+                        counters["bytes"] = counters.get("bytes", 0) + len(chunk)
+                # Lists keep the version they replace, so what changed can be worked out
+                previous_key = get_file_key(filename) if build_index else None
+                if previous_key is not None:
+                    save_snapshot(filename)
+                os.replace(temp_filename, filename)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+
+            now = time.time()
+            if build_index:
+                build_trigram_index(filename)
+                if previous_key is not None:
+                    added, removed = diff_list_files(filename + SNAPSHOT_SUFFIX, filename)
+                    # Saved even when only comments changed, so the changes always lead to the saved version
+                    save_list_changes(filename, {
+                        "from": list(previous_key),
+                        "to": list(get_file_key(filename)),
+                        "previous_synced_at": entry['validated_at'] if entry and entry['filename'] == filename else None,
+                        "synced_at": now,
+                        "added": added,
+                        "removed": removed,
+                    })
+                    counters["added"] = len(added)
+                    counters["removed"] = len(removed)
+            with cache_lock:
+                cache_metadata[url] = {
+                    'filename': filename,
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'validated_at': now,
+                    'last_access': now,
+                }
+            return True
+        except requests.RequestException as e:
+            print(f"Error fetching {url}: {e}", file=sys.stderr)
+            counters["errors"] = 1
+            # Fall back to the saved copy when the server cannot be reached, with or without validators
+            return cached
+        except OSError as e:
+            print(f"Error saving {url}: {e}", file=sys.stderr)
+            counters["errors"] = 1
+            return False
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+
+# Keep a copy of a saved list as its snapshot, linked rather than copied where the file system allows
+def save_snapshot(filename):
+    snapshot = filename + SNAPSHOT_SUFFIX
+    temp_snapshot = f"{snapshot}.{threading.get_ident()}.part"
+    try:
+        os.link(filename, temp_snapshot)
+    except OSError:
+        shutil.copyfile(filename, temp_snapshot)
+    os.replace(temp_snapshot, snapshot)
+
+# Get the hash of every rule line of a saved list. The hashes only live as long as the process,
+# which is all a diff needs.
+def get_line_hashes(filename):
+    return {hash(line) for line in get_rule_lines(iter_local_lines(filename))}
+
+# Get the rule lines added to and removed from a list between two saved versions, each in file order.
+# Lines are compared by hash, so only the changed lines are kept in memory.
+def diff_list_files(old_filename, new_filename):
+    with timed("diff", new_filename) as counters:
+        old_hashes = get_line_hashes(old_filename)
+        new_hashes = set()
+        added = []
+        for line in iter_local_lines(new_filename):
+            line = line.strip()
+            if not line or line.startswith("!"):
+                continue
+            line_hash = hash(line)
+            if line_hash not in new_hashes:
+                new_hashes.add(line_hash)
+                if line_hash not in old_hashes:
+                    added.append(line)
+        removed = []
+        for line in iter_local_lines(old_filename):
+            line = line.strip()
+            if not line or line.startswith("!"):
+                continue
+            line_hash = hash(line)
+            if line_hash not in new_hashes:
+                new_hashes.add(line_hash)  # Report a removed line once
+                removed.append(line)
+        counters["lines"] = len(new_hashes)
+    return added, removed
+
+# Save the changes of the last refresh of a list next to it
+def save_list_changes(filename, changes):
+    temp_filename = f"{filename}{CHANGES_SUFFIX}.{threading.get_ident()}.part"
+    try:
+        with gzip.open(temp_filename, 'wt', encoding='utf-8', compresslevel=COMPRESS_LEVEL) as file:
+            json.dump(changes, file)
+        os.replace(temp_filename, filename + CHANGES_SUFFIX)
+    except OSError as e:
+        print(f"Error saving changes of {filename}: {e}", file=sys.stderr)
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+# Load the changes of the last refresh that downloaded a new version of a list, or None if there was none since it was first downloaded
+def load_list_changes(filename):
+    try:
+        with gzip.open(filename + CHANGES_SUFFIX, 'rt', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error loading changes of {filename}: {e}", file=sys.stderr)
+        return None
+
+# Load the catalog saved by a previous run, or None if there is none
+def load_cached_catalog():
+    content = load_local_content(CATALOG_CACHE_FILE)
+    if not content:
+        return None
+    try:
+        return json.loads(content) or None
+    except ValueError as e:
+        print(f"Error decoding cached catalog: {e}", file=sys.stderr)
+        return None
+
+# Load the catalog through the HTTP cache, always revalidating it when refresh is set,
+# returns None if it could not be loaded
+def load_catalog(refresh=False):
+    if refresh:
+        saved = fetch_and_save_url_content(CATALOG_URL, CATALOG_CACHE_FILE, build_index=False)
+        content = load_local_content(CATALOG_CACHE_FILE) if saved else None
+    else:
+        content = get_url_content(CATALOG_URL, CATALOG_CACHE_FILE, build_index=False)
+    save_cache_metadata()
+    if not content:
+        return None
+    try:
+        return json.loads(content) or None
+    except ValueError as e:
+        print(f"Error decoding catalog: {e}", file=sys.stderr)
+        return None
+
+# Get the files belonging to a cached list, the list itself and the files derived from it
+def get_cache_files(filename):
+    directory, name = os.path.split(filename)
+    try:
+        return [
+            os.path.join(directory, other) for other in os.listdir(directory)
+            if other == name or other.startswith(name + ".")
+        ]
+    except FileNotFoundError:
+        return []
+
+# Remove the least recently used lists until the cache fits in CACHE_MAX_SIZE
+def enforce_cache_size():
+    with cache_lock:
+        entries = sorted(cache_metadata.items(), key=lambda item: item[1].get('last_access', 0))
+    sizes = {}
+    for url, entry in entries:
+        sizes[url] = sum(os.path.getsize(path) for path in get_cache_files(entry['filename']) if os.path.exists(path))
+    total_size = sum(sizes.values())
+
+    for url, entry in entries:
+        if total_size <= CACHE_MAX_SIZE:
+            break
+        for path in get_cache_files(entry['filename']):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing {path}: {e}", file=sys.stderr)
+        total_size -= sizes[url]
+        with cache_lock:
+            cache_metadata.pop(url, None)
+
+# Download or revalidate the sources that are not fresh in parallel, or all of them when force is set.
+# Returns whether each one is available by filename.
+def prefetch_sources(sources, on_progress=None, force=False):
+    missing = {}
+    for url, title, filename in sources:
+        if filename not in missing and (force or not is_cache_fresh(url, filename)):
+            missing[filename] = (url, title)
+    if not missing:
+        return {}
+
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(missing))) as executor:
+        futures = {
+            executor.submit(fetch_and_save_url_content, url, filename): (filename, title)
+            for filename, (url, title) in missing.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            filename, title = futures[future]
+            fetched[filename] = future.result()
+            if on_progress:
+                on_progress(done, len(missing), title)
+    save_cache_metadata()
+    return fetched
+
+# Get the local filename for a source of a list
+def get_list_filename(uuid, title):
+    return os.path.join(LOCAL_CONTENT_DIR, f"{uuid}_{title}.txt.gz")
+
+# Get the title and (url, title, filename) sources of each selected list, in selection order
+def get_selected_lists(catalog, selected_uuids):
+    selected_lists = []
+    for uuid in selected_uuids:
+        for item in catalog:
+            if item['uuid'] == uuid:
+                sources = []
+                for source in item.get('sources', []):
+                    url = source.get('url')
+                    title = source.get('title', 'No Title')  # Provide a default title if missing
+                    if url:
+                        sources.append((url, title, get_list_filename(uuid, title)))
+                selected_lists.append((item.get('title', 'No Title'), sources))
+    return selected_lists
+
+# Bring a membership index built from other versions of the lists up to date from the changes recorded when
+# the lists were refreshed. Returns None when a list changed in a way the recorded changes do not cover.
+def apply_list_changes(index, saved_files, files, descriptions, sources):
+    if index["sources"] != descriptions or set(saved_files) != set(files):
+        return None
+    for source_number, (_, (_, _, filename)) in enumerate(sources):
+        if saved_files[filename] == files[filename]:
+            continue
+        changes = load_list_changes(filename)
+        if changes is None or changes["from"] != saved_files[filename] or changes["to"] != files[filename]:
+            return None
+        index = update_membership_index(index, source_number, changes["added"], changes["removed"])
+    return index
+
+# Get the membership index over every list in the catalog, downloading lists when needed. Lists changed
+# by a refresh since the index was built are applied to it, it is only rebuilt when that is not possible.
+def load_catalog_membership_index(catalog, on_progress=None):
+    with membership_lock:
+        selected_lists = get_selected_lists(catalog, [item['uuid'] for item in catalog])
+        sources = [(list_title, source) for list_title, list_sources in selected_lists for source in list_sources]
+        prefetch_sources([source for _, source in sources], on_progress)
+
+        files = {filename: list(get_file_key(filename) or ()) for _, (_, _, filename) in sources}
+        if membership_index_cache["files"] == files:
+            return membership_index_cache["index"]
+
+        descriptions = [{"list": list_title, "source": title, "url": url} for list_title, (url, title, _) in sources]
+        if membership_index_cache["index"] is not None:
+            index, saved_files = membership_index_cache["index"], membership_index_cache["files"]
+        else:
+            index, metadata = load_membership_index(MEMBERSHIP_INDEX_FILE)
+            saved_files = metadata.get("files") if index is not None else None
+        if index is not None and saved_files != files:
+            with timed("membership_update") as counters:
+                index = apply_list_changes(index, saved_files or {}, files, descriptions, sources)
+                counters["updated"] = int(index is not None)
+
+        if index is None:
+            def iter_source_lines():
+                for description, (_, (_, _, filename)) in zip(descriptions, sources):
+                    lines = iter_local_lines(filename) if os.path.exists(filename) else []
+                    yield description, lines
+
+            index = build_membership_index(iter_source_lines())
+        if saved_files != files:
+            try:
+                save_membership_index(index, MEMBERSHIP_INDEX_FILE, {"files": files})
+            except OSError as e:
+                print(f"Error saving membership index: {e}", file=sys.stderr)
+
+        membership_index_cache.update(files=files, index=index)
+        return index
+
+# Get the set of distinct trigrams in a string
+def get_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Append a number to a bytearray as a varint: seven bits per byte, lowest first, the high bit set on all but the last
+def append_varint(encoded, number):
+    while number >= 0x80:
+        encoded.append(number & 0x7F | 0x80)
+        number >>= 7
+    encoded.append(number)
+
+# Decode the varint line number deltas of a posting list into sorted line numbers
+def decode_postings(data):
+    if data.isascii():
+        return list(accumulate(data))  # Every delta fits in one byte, as in the postings of common trigrams
+    line_numbers = []
+    line_number = value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            line_number += value
+            line_numbers.append(line_number)
+            value = shift = 0
+    return line_numbers
+
+# Build a trigram index of the non-comment lines of a saved list and save it next to the list file.
+# Each posting list is kept as varint-encoded deltas between line numbers from the start, a few times smaller
+# than plain line numbers. Builds run one at a time, so downloads finishing together do not add up in memory.
+def build_trigram_index(filename):
+    with trigram_build_lock:
+        postings = {}  # trigram -> [encoded line number deltas, last line number, number of lines]
+        line_count = 0
+        with timed("trigram_index", filename) as counters:
+            for line_number, line in enumerate(iter_local_lines(filename)):
+                line_count += 1
+                if line.strip().startswith('!'):
+                    continue
+                for trigram in get_trigrams(line.lower()):
+                    posting = postings.get(trigram)
+                    if posting is None:
+                        posting = postings[trigram] = [bytearray(), 0, 0]
+                    append_varint(posting[0], line_number - posting[1])
+                    posting[1] = line_number
+                    posting[2] += 1
+            counters["lines"] = line_count
+
+        # Postings are stored back to back, the header records where each one starts, its length and line count
+        offsets = {}
+        size = 0
+        for trigram, (encoded, _, count) in postings.items():
+            offsets[trigram] = [size, len(encoded), count]
+            size += len(encoded)
+
+        try:
+            stat = os.stat(filename)
+            header = json.dumps({
+                "source_size": stat.st_size,
+                "source_mtime_ns": stat.st_mtime_ns,
+                "lines": line_count,
+                "postings": offsets,
+            }).encode('utf-8')
+            with gzip.open(filename + TRIGRAM_INDEX_SUFFIX, 'wb', compresslevel=1) as file:
+                file.write(TRIGRAM_INDEX_MAGIC)
+                file.write(len(header).to_bytes(8, 'little'))
+                file.write(header)
+                for encoded, _, _ in postings.values():
+                    file.write(encoded)
+        except OSError as e:
+            print(f"Error saving trigram index for {filename}: {e}", file=sys.stderr)
+
+# Load the trigram index of a list file, or None if it is missing or out of date.
+# Loaded indexes are kept for the TRIGRAM_INDEX_CACHE_SIZE most recently used lists.
+def load_trigram_index(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    with trigram_index_lock:
+        cached = trigram_index_cache.get(filename)
+        if cached and cached[0] == key:
+            trigram_index_cache.move_to_end(filename)
+            return cached[1]
+
+    index = None
+    try:
+        with gzip.open(filename + TRIGRAM_INDEX_SUFFIX, 'rb') as file:
+            raw = file.read()
+        if raw.startswith(TRIGRAM_INDEX_MAGIC):
+            start = len(TRIGRAM_INDEX_MAGIC)
+            header_length = int.from_bytes(raw[start:start + 8], 'little')
+            header = json.loads(raw[start + 8:start + 8 + header_length])
+            if (header["source_size"], header["source_mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+                index = {"lines": header["lines"], "postings": header["postings"], "data": raw[start + 8 + header_length:]}
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, ValueError, KeyError) as e:
+        print(f"Error loading trigram index for {filename}: {e}", file=sys.stderr)
+
+    with trigram_index_lock:
+        trigram_index_cache[filename] = (key, index)
+        trigram_index_cache.move_to_end(filename)
+        while len(trigram_index_cache) > TRIGRAM_INDEX_CACHE_SIZE:
+            trigram_index_cache.popitem(last=False)
+    return index
+
+# Load the trigram index of a list file when it can narrow a search for the keyword, or None. Pattern and
+# structured queries do not use it, and keywords shorter than a trigram have nothing to look up in it.
+def load_keyword_index(filename, keyword):
+    if len(keyword) < 3 or is_pattern_query(keyword) or is_structured_query(keyword):
+        return None
+    return load_trigram_index(filename)
+
+# Get the sorted line numbers that may contain the keyword, or None if the index cannot narrow the search
+def get_trigram_candidates(index, keyword):
+    trigrams = get_trigrams(keyword.lower())
+    if not trigrams:
+        return None
+
+    postings = index["postings"]
+    if any(trigram not in postings for trigram in trigrams):
+        return []
+
+    # Intersect starting from the rarest trigram to keep the candidate set small
+    data = index["data"]
+    candidates = None
+    for trigram in sorted(trigrams, key=lambda t: postings[t][2]):
+        offset, length, _ = postings[trigram]
+        line_numbers = decode_postings(data[offset:offset + length])
+        if candidates is None:
+            candidates = set(line_numbers)
+        else:
+            candidates.intersection_update(line_numbers)
+        if not candidates:
+            return []
+    return sorted(candidates)
+
+# Load the content from a local file
+def load_local_content(filename):
+    with timed("read", filename):
+        try:
+            with gzip.open(filename, 'rt', encoding='utf-8', errors='replace') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Error reading {filename}: {e}", file=sys.stderr)
+            return None
+
+# Yield the lines of a saved list without line endings, decompressing as it goes
+def iter_local_lines(filename):
+    with gzip.open(filename, 'rt', encoding='utf-8', errors='replace') as file:
+        for line in file:
+            yield line.rstrip('\r\n')
+
+# Get the lines with the given sorted line numbers that contain the needle, streaming the saved list
+def select_local_lines(filename, line_numbers, needle):
+    selected = []
+    if not line_numbers:
+        return selected
+    wanted = iter(line_numbers)
+    next_wanted = next(wanted)
+    lines = iter_local_lines(filename)
+    try:
+        for line_number, line in enumerate(lines):
+            if line_number == next_wanted:
+                if needle in line.lower():
+                    selected.append(line)
+                next_wanted = next(wanted, None)
+                if next_wanted is None:
+                    break
+    finally:
+        lines.close()  # Stop reading once the last wanted line is found
+    return selected
+
+# Yield the content of a saved list as bytes buffers that each end on a line boundary.
+# The file is memory-mapped, compressed lists are decompressed a piece at a time from the mapping
+# and plain files are yielded as the mapping itself, so the content is never copied as a whole.
+def iter_local_chunks(filename):
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:2] != b"\x1f\x8b":
+                yield mapped
+                return
+
+            decompressor = zlib.decompressobj(wbits=31)  # 31 expects a gzip header
+            remainder = b""
+            for offset in range(0, len(mapped), SCAN_CHUNK_SIZE):
+                data = remainder + decompressor.decompress(mapped[offset:offset + SCAN_CHUNK_SIZE])
+                # Hold back the last partial line until the rest of it is decompressed
+                end = data.rfind(b"\n") + 1
+                remainder = data[end:]
+                if end:
+                    yield data[:end]
+                while decompressor.eof and decompressor.unused_data:
+                    # Another gzip member follows, as written by appending to a gzip file
+                    unused = decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=31)
+                    remainder += decompressor.decompress(unused)
+            remainder += decompressor.flush()
+            if remainder:
+                yield remainder
+
+# Yield the lines of a saved list matching a boolean or regex pattern query, matching the raw bytes and
+# only decoding the lines that match
+def iter_pattern_file(filename, keyword):
+    query = compile_pattern_query(keyword)
+    for buffer in iter_local_chunks(filename):
+        for line in search_buffer(buffer, query):
+            yield line.decode('utf-8', errors='replace')
+
+# Search a saved list with a boolean or regex pattern query
+def search_pattern_file(filename, keyword):
+    return list(iter_pattern_file(filename, keyword))
+
+# Get the field indexes of a list file for structured queries, building them on first use.
+# Indexes are kept for the RULE_INDEX_CACHE_SIZE most recently used lists.
+def get_rule_index(filename):
+    key = get_file_key(filename)
+    with rule_index_lock:
+        cached = rule_index_cache.get(filename)
+        if cached and cached[0] == key:
+            rule_index_cache.move_to_end(filename)
+            return cached[1]
+
+    index = build_rule_index(iter_local_lines(filename))
+    with rule_index_lock:
+        rule_index_cache[filename] = (key, index)
+        rule_index_cache.move_to_end(filename)
+        while len(rule_index_cache) > RULE_INDEX_CACHE_SIZE:
+            rule_index_cache.popitem(last=False)
+    return index
+
+# Search for the keyword in the content, using the trigram index or field indexes when given
+def search_in_content(content, keyword, index=None, rule_index=None):
+    if not content:
+        return []
+
+    lines = content.splitlines()
+
+    # Structured queries such as "domain:example.com type:cosmetic" are answered from the field indexes
+    fields, text = parse_query(keyword)
+    if fields:
+        if rule_index is None or rule_index["lines"] != len(lines):
+            rule_index = build_rule_index(lines)
+        if is_pattern_query(text):
+            query = compile_pattern_query(text)
+            return [line for line in search_rule_index(lines, rule_index, fields) if match_query(query, line.encode('utf-8'))]
+        return search_rule_index(lines, rule_index, fields, text)
+
+    if is_pattern_query(keyword):
+        query = compile_pattern_query(keyword)
+        return [line.decode('utf-8') for line in search_buffer(content.encode('utf-8'), query)]
+
+    if index is not None and index["lines"] == len(lines):
+        candidates = get_trigram_candidates(index, keyword)
+        if candidates is not None:
+            keyword = keyword.lower()
+            return [lines[n] for n in candidates if keyword in lines[n].lower()]
+
+    filtered_lines = [line for line in lines if keyword.lower() in line.lower() and not line.strip().startswith('!')]
+    return filtered_lines
+
+# Yield the lines of a saved list matching the keyword as it reads them, using the trigram index or field indexes when given
+def iter_file_matches(filename, keyword, index=None, rule_index=None):
+    fields, text = parse_query(keyword)
+    if fields:
+        if rule_index is None:
+            rule_index = build_rule_index(iter_local_lines(filename))
+        if is_pattern_query(text):
+            query = compile_pattern_query(text)
+            lines = select_local_lines(filename, get_rule_candidates(rule_index, fields), "")
+            yield from (line for line in lines if match_query(query, line.encode('utf-8')))
+        else:
+            yield from select_local_lines(filename, get_rule_candidates(rule_index, fields), text.lower())
+        return
+
+    if is_pattern_query(keyword):
+        yield from iter_pattern_file(filename, keyword)
+        return
+
+    if index is not None:
+        candidates = get_trigram_candidates(index, keyword)
+        if candidates is not None:
+            yield from select_local_lines(filename, candidates, keyword.lower())
+            return
+
+    keyword = keyword.lower()
+    for line in iter_local_lines(filename):
+        if keyword in line.lower() and not line.strip().startswith('!'):
+            yield line
+
+# Search a saved list for the keyword line by line, using the trigram index or field indexes when given
+def search_in_file(filename, keyword, index=None, rule_index=None):
+    return list(iter_file_matches(filename, keyword, index, rule_index))
+
+# Get the (mtime, size) of a file, or None if it does not exist
+def get_file_key(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+# Create the local content directory and load the cache metadata saved by a previous run
+def init_local_content():
+    if not os.path.exists(LOCAL_CONTENT_DIR):
+        os.makedirs(LOCAL_CONTENT_DIR)
+    load_cache_metadata()
+
+# Function to clean up local files, trimming the cache and saving its metadata for the next run
+def cleanup_local_content():
+    if os.path.exists(LOCAL_CONTENT_DIR):
+        enforce_cache_size()
+        save_cache_metadata()
+    shutdown_search_pool()
+    stop_local_state_watcher()
+
+# Search the custom filters, all of them are returned when there is no keyword
+def search_custom_filters(keyword):
+    custom_filters = load_custom_filters()
+    if keyword:
+        with timed("search_custom") as counters:
+            counters["lines"] = len(custom_filters)
+            try:
+                return search_in_content("\n".join(custom_filters), keyword)
+            except re.error as e:
+                print(f"Invalid search pattern: {e}", file=sys.stderr)
+                return []
+    return custom_filters
+
+# Search one saved list, returns its file key and matching lines. Runs in a search worker process or inline.
+# The time taken is returned too, so searches in other processes can be recorded here.
+def search_source(filename, keyword, structured):
+    start = time.perf_counter()
+    rule_index = get_rule_index(filename) if structured else None
+    filtered_lines = search_in_file(filename, keyword, load_keyword_index(filename, keyword), rule_index)
+    return get_file_key(filename), filtered_lines, time.perf_counter() - start
+
+# Submit searches of the given lists to the pool of search worker processes, creating it with the given number
+# of workers on first use, returns a filename -> future dict. A pool with a different number of workers is only
+# replaced once no search is running in it, replacing it would cancel the searches of another thread.
+def submit_searches(workers, filenames, keyword, structured):
+    global search_pool, search_pool_workers, search_pool_pending
+    replaced = None
+    with search_pool_lock:
+        if search_pool is None or (search_pool_workers != workers and not search_pool_pending):
+            replaced = search_pool
+            # Spawned workers do not inherit the threads and open connections of this process
+            search_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            search_pool_workers = workers
+        searches = {filename: search_pool.submit(search_source, filename, keyword, structured) for filename in filenames}
+        search_pool_pending += len(searches)
+    if replaced is not None:
+        replaced.shutdown(wait=False)
+    for search in searches.values():
+        search.add_done_callback(finish_pool_search)
+    return searches
+
+# Count a search of the pool as no longer running once it finished or was cancelled
+def finish_pool_search(search):
+    global search_pool_pending
+    with search_pool_lock:
+        search_pool_pending -= 1
+
+# Stop the search worker processes, if any were started
+def shutdown_search_pool():
+    global search_pool
+    with search_pool_lock:
+        pool, search_pool = search_pool, None
+    # Outside the lock, cancelling the waiting searches calls finish_pool_search
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Start searching the saved lists in worker processes, returns a filename -> future dict.
+# The futures are None when the selection is too small to be worth the processes, then searches run inline.
+def start_source_searches(filenames, keyword, structured, workers=None):
+    workers = SEARCH_WORKERS if workers is None else workers
+    searches = dict.fromkeys(filenames)
+    total_size = 0
+    for filename in filenames:
+        try:
+            total_size += os.path.getsize(filename)
+        except OSError:
+            pass
+    if workers <= 1 or len(filenames) < 2 or total_size < PARALLEL_SEARCH_MIN_SIZE:
+        return searches
+
+    try:
+        searches = submit_searches(min(workers, len(filenames)), filenames, keyword, structured)
+    except (OSError, RuntimeError, BrokenProcessPool) as e:
+        print(f"Searching in a single process: {e}", file=sys.stderr)
+        shutdown_search_pool()
+    return searches
+
+# Get the result of a search started by start_source_searches, searching inline when it has no worker
+# or its worker could not finish it
+def get_source_search_result(searches, filename, keyword, structured):
+    search = searches.get(filename)
+    result = None
+    if search is not None:
+        try:
+            result = search.result()
+        except BrokenProcessPool as e:
+            print(f"Search worker failed, searching in a single process: {e}", file=sys.stderr)
+            shutdown_search_pool()
+            for other in searches:
+                searches[other] = None
+        except CancelledError:
+            pass  # The pool was shut down while the search waited for a worker
+        except Exception as e:
+            print(f"Search worker failed for {filename}, searching in this process: {e}", file=sys.stderr)
+    if result is None:
+        result = search_source(filename, keyword, structured)
+    file_key, filtered_lines, seconds = result
+    record("search", seconds, filename, matches=len(filtered_lines))
+    return file_key, filtered_lines
+
+# Yield the lines of a saved list as bytes without line endings, splitting the decompressed chunks
+def iter_local_line_bytes(filename):
+    for buffer in iter_local_chunks(filename):
+        lines = bytes(buffer).split(b"\n")
+        if not lines[-1]:
+            lines.pop()  # Chunks end on a line boundary
+        for line in lines:
+            yield line[:-1] if line.endswith(b"\r") else line
+
+# Get the rule ids of the lines of a saved list, storing the list in the rule store when it is new or changed.
+# Must be called with rule_store_lock held.
+def load_stored_list(filename):
+    file_key = get_file_key(filename)
+    ids = rule_store.get_list(filename, file_key)
+    if ids is None:
+        with timed("rule_store", filename) as counters:
+            ids = rule_store.add_list(filename, file_key, iter_local_line_bytes(filename))
+            counters["lines"] = len(ids)
+            counters["rules"] = len(rule_store)
+    return ids
+
+# Search saved lists through the rule store, returns a filename -> (file key, matching lines) dict, or None once
+# is_cancelled returns True. Each distinct rule is checked once however many of the lists have it, and a rule
+# matching in several lists is the same string in each of their results.
+def search_stored_lists(filenames, keyword, is_cancelled=lambda: False):
+    pattern = is_pattern_query(keyword)
+    # Lists the trigram index cannot narrow are answered from one search of every stored rule, except for
+    # keywords whose case the bytes regexes would not fold like str.lower
+    search_all = pattern or (keyword and keyword.isascii())
+    needle = keyword.lower()
+    results = {}
+    matched = {}  # rule id -> its text if it matches, None if it does not
+    found = None  # rule id -> line bytes of every stored rule matching, searched for once the first list needs it
+    with rule_store_lock:
+        # Every list is stored before any is searched, the search of all stored rules has to see all of them
+        stored = {}
+        for filename in filenames:
+            if is_cancelled():
+                return None
+            stored[filename] = (get_file_key(filename), load_stored_list(filename))
+
+        for filename, (file_key, ids) in stored.items():
+            if is_cancelled():
+                return None
+            with timed("search", filename) as counters:
+                candidates = None
+                index = load_keyword_index(filename, keyword)
+                if index is not None and index["lines"] == len(ids):
+                    candidates = get_trigram_candidates(index, keyword)
+
+                lines = []
+                if candidates is None and search_all:
+                    if found is None:
+                        found = rule_store.find(compile_pattern_query(keyword)) if pattern else rule_store.find_substring(keyword.encode('ascii'))
+                    for rule_id in rule_store.select(filename, found):
+                        line = matched.get(rule_id)
+                        if line is None:
+                            line = matched[rule_id] = found[rule_id].decode('utf-8', errors='replace')
+                        lines.append(line)
+                else:
+                    for line_number in candidates if candidates is not None else range(len(ids)):
+                        rule_id = ids[line_number]
+                        if rule_id in matched:
+                            line = matched[rule_id]
+                        else:
+                            line = rule_store.get_rule(rule_id)
+                            if needle not in line.lower() or line.strip().startswith('!'):
+                                line = None
+                            matched[rule_id] = line
+                        if line is not None:
+                            lines.append(line)
+                counters["matches"] = len(lines)
+            results[filename] = (file_key, lines)
+    return results
+
+# Drop the lists that are not among the given filenames from the rule store, compacting it once most of
+# the rules it holds belong to no list any more
+def retain_stored_lists(filenames):
+    with rule_store_lock:
+        rule_store.retain_lists(set(filenames))
+
+# Check whether the rule store holds exactly the given lists at their current versions. Returns False rather than
+# waiting while the store is being filled.
+def is_rule_store_ready(filenames):
+    if not rule_store_lock.acquire(blocking=False):
+        return False
+    try:
+        return set(rule_store.lists) == set(filenames) and all(
+            rule_store.get_list(filename, get_file_key(filename)) is not None for filename in filenames
+        )
+    finally:
+        rule_store_lock.release()
+
+# Make the rule store hold the given lists, dropping the others, in a daemon thread. A fill already running
+# switches to the new lists once it has stored its current one.
+def start_filling_rule_store(filenames):
+    global rule_store_filler, rule_store_fill_pending
+    with rule_store_fill_lock:
+        rule_store_fill_pending = list(filenames)
+        if rule_store_filler is None:
+            rule_store_filler = threading.Thread(target=fill_rule_store, daemon=True)
+            rule_store_filler.start()
+
+# Store the pending lists one at a time, so searches waiting for the store are held up by one list at most
+def fill_rule_store():
+    global rule_store_filler, rule_store_fill_pending
+    while True:
+        with rule_store_fill_lock:
+            filenames, rule_store_fill_pending = rule_store_fill_pending, None
+            if filenames is None:
+                rule_store_filler = None
+                return
+        try:
+            retain_stored_lists(filenames)
+            for filename in filenames:
+                with rule_store_fill_lock:
+                    if rule_store_fill_pending is not None:
+                        break  # The selection changed
+                with rule_store_lock:
+                    load_stored_list(filename)
+        except Exception as e:
+            print(f"Error filling the rule store: {e}", file=sys.stderr)
+
+# Get overlap statistics of the selected lists, the active ones by default, from the rule store,
+# storing the lists first when needed.
+# Returns a dict per source with its rule lines, distinct rules and the rules no other selected source has,
+# a dict per pair of sources sharing rules, and the number of distinct rules of all of them together.
+def get_list_overlap(catalog, selected_uuids=None, on_progress=None):
+    selected_uuids = load_active_filters() if selected_uuids is None else selected_uuids
+    selected_lists = get_selected_lists(catalog, selected_uuids)
+    fetched = prefetch_sources([source for _, sources in selected_lists for source in sources], on_progress)
+    descriptions = {}
+    for list_title, sources in selected_lists:
+        for url, title, filename in sources:
+            available = fetched[filename] if filename in fetched else ensure_url_content(url, filename)
+            if available:
+                descriptions[filename] = {"list": list_title, "source": title, "url": url}
+            else:
+                print(f"Failed to load content from {url} ({title})", file=sys.stderr)
+
+    with rule_store_lock:
+        for filename in descriptions:
+            load_stored_list(filename)
+        with timed("overlap") as counters:
+            overlap = rule_store.get_overlap(list(descriptions))
+            counters["lists"] = len(descriptions)
+
+    sources = [
+        dict(description, lines=overlap["lines"][filename], rules=overlap["rules"][filename], only=overlap["only"][filename])
+        for filename, description in descriptions.items()
+    ]
+    pairs = [
+        {"source": descriptions[first]["source"], "other": descriptions[second]["source"], "shared": count}
+        for (first, second), count in overlap["shared"].items()
+        if count
+    ]
+    return sources, pairs, overlap["distinct"]
+
+# Search the selected lists in selection order, yielding ("list", list_title) before the sources of each list,
+# then ("source", url, title, lines) or ("failed", url, title) for each source.
+# Yields only ("invalid", message) when the keyword is a pattern query that does not compile.
+# Interactive searches, as the GUI runs them while typing, keep their matches in last_search to narrow the next one,
+# and keep the selected lists in the rule store, filled in the background. Their plain and pattern searches over
+# several lists go through the store once it holds them. Other searches of large selections, and interactive ones
+# while the store is filled, are searched by up to workers processes, SEARCH_WORKERS by default.
+# Results keep catalog order.
+# Stops early once is_cancelled returns True.
+def iter_search_results(catalog, keyword, selected_uuids, is_cancelled=lambda: False, on_progress=None, workers=None, interactive=False):
+    global last_search
+    pattern = is_pattern_query(keyword)
+    if pattern:
+        try:
+            compile_pattern_query(parse_query(keyword)[1])
+        except re.error as e:
+            yield ("invalid", f"Invalid search pattern: {e}")
+            return
+    selected_lists = get_selected_lists(catalog, selected_uuids)
+
+    # When the keyword only got longer, all matches are among the previous search's matches
+    previous = last_search if interactive else None
+    needle = keyword.lower()
+    structured = is_structured_query(keyword)
+    narrowing = (
+        previous is not None
+        and previous["keyword"]
+        and previous["keyword"] in needle
+        and previous["uuids"] == tuple(selected_uuids)
+        and not structured
+        and not previous["structured"]
+        and not pattern
+        and not previous["pattern"]
+    )
+    matches = {}  # filename -> (file key, matching lines), kept for the next search
+
+    # Download every missing source at once before searching
+    fetched = prefetch_sources(
+        [source for _, sources in selected_lists for source in sources],
+        on_progress,
+    )
+
+    # Work out how each source is answered: from the previous matches, by searching it, or not at all
+    narrowed = {}
+    to_search = []
+    failed = set()
+    for _, sources in selected_lists:
+        for url, title, filename in sources:
+            if is_cancelled():
+                return
+
+            previous_match = previous["matches"].get(filename) if narrowing else None
+            file_key = get_file_key(filename)
+            if previous_match and file_key is not None and previous_match[0] == file_key:
+                narrowed[filename] = (file_key, [line for line in previous_match[1] if needle in line.lower()])
+                continue
+
+            if filename in fetched:
+                available = fetched[filename]
+            else:
+                available = ensure_url_content(url, filename)
+            if available:
+                to_search.append(filename)
+            else:
+                failed.add(filename)
+
+    # Interactive plain and pattern searches over several lists check each distinct rule once through the rule
+    # store when it holds the selection. Otherwise, and for other searches, lists are searched file by file,
+    # in worker processes for large selections, while the store is filled for the next interactive search.
+    stored = None
+    searches = {}
+    store_ready = False
+    if interactive:
+        selected_files = [filename for _, sources in selected_lists for _, _, filename in sources if filename not in failed]
+        if len(selected_files) < RULE_STORE_MIN_LISTS:
+            selected_files = []
+        store_ready = is_rule_store_ready(selected_files)
+        if not store_ready:
+            start_filling_rule_store(selected_files)
+    if store_ready and not structured and len(to_search) >= RULE_STORE_MIN_LISTS:
+        stored = search_stored_lists(to_search, keyword, is_cancelled)
+        if stored is None:
+            return
+    else:
+        searches = start_source_searches(to_search, keyword, structured, workers)
+    try:
+        for list_title, sources in selected_lists:
+            yield ("list", list_title)
+
+            for url, title, filename in sources:
+                # Stop early if a newer search has been requested
+                if is_cancelled():
+                    return
+
+                if filename in failed:
+                    yield ("failed", url, title)
+                    continue
+                if filename in narrowed:
+                    file_key, filtered_lines = narrowed[filename]
+                elif stored is not None:
+                    file_key, filtered_lines = stored[filename]
+                else:
+                    file_key, filtered_lines = get_source_search_result(searches, filename, keyword, structured)
+                matches[filename] = (file_key, filtered_lines)
+                yield ("source", url, title, filtered_lines)
+    finally:
+        # Searches still running for a cancelled or abandoned search are not needed any more
+        for search in searches.values():
+            if search is not None:
+                search.cancel()
+
+    if interactive:
+        last_search = {"keyword": needle, "uuids": tuple(selected_uuids), "structured": structured, "pattern": pattern, "matches": matches}
+
+# Yield a dict for every rule matching the keyword, custom filters first when they are enabled
+def iter_hits(catalog, keyword, selected_uuids, custom_filters_enabled=False, on_progress=None, workers=None):
+    if custom_filters_enabled:
+        for rule in search_custom_filters(keyword):
+            yield {"list": "My Custom Filters", "source": "Local State", "url": None, "rule": rule}
+
+    list_title = None
+    for event in iter_search_results(catalog, keyword, selected_uuids, on_progress=on_progress, workers=workers):
+        if event[0] == "list":
+            list_title = event[1]
+        elif event[0] == "invalid":
+            print(event[1], file=sys.stderr)
+        elif event[0] == "failed":
+            print(f"Failed to load content from {event[1]} ({event[2]})", file=sys.stderr)
+        else:
+            _, url, title, lines = event
+            for line in lines:
+                yield {"list": list_title, "source": title, "url": url, "rule": line}
+
+# Yield a dict for every rule matching the keyword like iter_hits, reading each list as it goes instead of collecting
+# its matches first, so nothing but the current line is held however many rules match. Raises re.error when the
+# keyword is a pattern query that does not compile.
+def iter_export_hits(catalog, keyword, selected_uuids, custom_filters_enabled=False, on_progress=None):
+    if is_pattern_query(keyword):
+        compile_pattern_query(parse_query(keyword)[1])
+    if custom_filters_enabled:
+        for rule in search_custom_filters(keyword):
+            yield {"list": "My Custom Filters", "source": "Local State", "url": None, "rule": rule}
+
+    selected_lists = get_selected_lists(catalog, selected_uuids)
+    fetched = prefetch_sources([source for _, sources in selected_lists for source in sources], on_progress)
+    structured = is_structured_query(keyword)
+    for list_title, sources in selected_lists:
+        for url, title, filename in sources:
+            available = fetched[filename] if filename in fetched else ensure_url_content(url, filename)
+            if not available:
+                print(f"Failed to load content from {url} ({title})", file=sys.stderr)
+                continue
+            rule_index = get_rule_index(filename) if structured else None
+            for line in iter_file_matches(filename, keyword, load_keyword_index(filename, keyword), rule_index):
+                yield {"list": list_title, "source": title, "url": url, "rule": line}
+
+# Get the export format for a filename from its extension, plain rules unless it ends in .csv or .jsonl
+def get_export_format(filename):
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    return {"csv": "csv", "jsonl": "jsonl", "json": "jsonl"}.get(extension, "txt")
+
+# Write records, dicts with the given fields, to an open text file one at a time. Plain text only keeps the rules,
+# CSV joins list values with "; ". Returns the number of records written.
+def write_records(records, file, export_format, fields):
+    counted = enumerate(records, start=1)
+    count = 0
+    if export_format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        get_row = itemgetter(*fields) if len(fields) > 1 else lambda entry: (entry[fields[0]],)
+        for count, entry in counted:
+            row = get_row(entry)
+            if list in map(type, row):
+                row = ["; ".join(value) if isinstance(value, list) else value for value in row]
+            writer.writerow(row)
+    elif export_format == "jsonl":
+        encode = json.JSONEncoder().encode  # Same output as json.dumps, without its per-call setup
+        for count, entry in counted:
+            file.write(encode({field: entry[field] for field in fields}) + "\n")
+    else:
+        for count, entry in counted:
+            file.write(entry["rule"] + "\n")
+    return count
+
+# Export records to a file, in the format given or the one its extension stands for. The file is written under a
+# temporary name and only replaces an existing one once complete. Returns the number of records written.
+def export_records(filename, records, fields, export_format=None):
+    export_format = export_format or get_export_format(filename)
+    temp_filename = f"{filename}.{threading.get_ident()}.part"
+    with timed("export", filename) as counters:
+        try:
+            with open(temp_filename, 'w', encoding='utf-8', newline='') as file:
+                counters["records"] = write_records(records, file, export_format, fields)
+            os.replace(temp_filename, filename)
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+    return counters["records"]
+
+# Export every rule matching the keyword in the selected lists, and the custom filters when enabled, to a file.
+# Returns the number of rules written.
+def export_search_results(filename, catalog, keyword, selected_uuids, custom_filters_enabled=False, export_format=None, on_progress=None):
+    hits = iter_export_hits(catalog, keyword, selected_uuids, custom_filters_enabled, on_progress)
+    return export_records(filename, hits, HIT_FIELDS, export_format)
+
+# Build the exact and canonical lookups used to compare rules against existing filters
+def build_filter_index(filters):
+    return {"filters": filters, "exact": set(filters), "canonical": None}
+
+# Get the existing filters by canonical form, only computed once an inexact lookup needs it
+def get_canonical_filters(index):
+    if index["canonical"] is None:
+        canonical = {}
+        for existing_filter in index["filters"]:
+            canonical.setdefault(canonicalize_rule(existing_filter), existing_filter)
+        index["canonical"] = canonical
+    return index["canonical"]
+
+# Classify a rule against a filter index, returns ("duplicate", rule), ("equivalent", existing filter) or ("new", None)
+def classify_rule(index, rule):
+    if rule in index["exact"]:
+        return "duplicate", rule
+    equivalent_filter = get_canonical_filters(index).get(canonicalize_rule(rule))
+    if equivalent_filter is not None:
+        return "equivalent", equivalent_filter
+    return "new", None
+
+# Yield (rule, sources) for each rule, naming the catalog lists and custom filters that already contain it
+def iter_catalog_comparison(catalog, rules, on_progress=None):
+    index = load_catalog_membership_index(catalog, on_progress)
+    custom_filters = {canonicalize_rule(custom_filter) for custom_filter in load_custom_filters()}
+    for rule in rules:
+        sources = [f"{source['list']} ({source['source']})" for source in find_rule_sources(index, rule)]
+        if canonicalize_rule(rule) in custom_filters:
+            sources.append("My Custom Filters")
+        yield rule, sources
+
+# Yield a record with the status and matching existing filter of each rule, for export
+def iter_comparison_records(index, rules):
+    for rule in rules:
+        status, existing_filter = classify_rule(index, rule)
+        yield {"rule": rule, "status": status, "existing": existing_filter}
+
+# Yield a record with the status and the lists already containing each rule, for export
+def iter_catalog_comparison_records(catalog, rules, on_progress=None):
+    for rule, sources in iter_catalog_comparison(catalog, rules, on_progress):
+        yield {"rule": rule, "status": "duplicate" if sources else "new", "lists": sources}
+
+# Get an index over the given lists kept in a {"files", "index"} cache guarded by lock, downloading the lists and
+# rebuilding the index with build only when they changed. build takes (source, lines) pairs, described by list and
+# source title, and get_size what to record as the size of the built index under phase.
+def load_cached_lists_index(cache, lock, build, phase, get_size, catalog, selected_uuids, on_progress=None):
+    with lock:
+        sources = [
+            (list_title, source)
+            for list_title, list_sources in get_selected_lists(catalog, selected_uuids)
+            for source in list_sources
+        ]
+        prefetch_sources([source for _, source in sources], on_progress)
+
+        files = {filename: get_file_key(filename) for _, (_, _, filename) in sources}
+        if cache["files"] == files:
+            return cache["index"]
+
+        def iter_source_lines():
+            for list_title, (url, title, filename) in sources:
+                if os.path.exists(filename):
+                    yield f"{list_title} ({title})", iter_local_lines(filename)
+
+        with timed(phase) as counters:
+            index = build(iter_source_lines())
+            counters["rules"] = get_size(index)
+        cache.update(files=files, index=index)
+        return index
+
+# Get the coverage index over the given lists, downloading them and rebuilding it only when they changed
+def load_coverage_index(catalog, selected_uuids, on_progress=None):
+    return load_cached_lists_index(
+        coverage_index_cache, coverage_lock, build_coverage_index, "coverage_index",
+        lambda index: index["block"].size + index["allow"].size, catalog, selected_uuids, on_progress,
+    )
+
+# Yield (rule, status, covering rule, source) for each custom rule with no effect of its own: "redundant" when a broader
+# rule in the lists or the custom filters already blocks everything it does, "shadowed" when an exception
+# always undoes it. Rules default to the custom filters and lists to the active ones.
+def iter_coverage_analysis(catalog, rules=None, selected_uuids=None, on_progress=None):
+    rules = load_custom_filters() if rules is None else list(rules)
+    selected_uuids = load_active_filters() if selected_uuids is None else selected_uuids
+    index = load_coverage_index(catalog, selected_uuids, on_progress)
+    custom_index = build_coverage_index([("My Custom Filters", rules)])
+    for rule in rules:
+        status, covering_rule, source = find_covering_rule(index, rule)
+        if status is None:
+            status, covering_rule, source = find_covering_rule(custom_index, rule, skip_source=0)
+        if status:
+            yield rule, status, covering_rule, source
+
+# Get the URL matcher over the given lists, downloading them and rebuilding it only when they changed
+def load_url_matcher(catalog, selected_uuids, on_progress=None):
+    return load_cached_lists_index(
+        url_matcher_cache, url_matcher_lock, build_url_matcher, "url_matcher",
+        itemgetter("rules"), catalog, selected_uuids, on_progress,
+    )
+
+# Yield (url, blocked, [(rule, kind, source), ...]) for each URL, with the network and exception rules of the lists
+# that match it. Lists default to the active ones. Options about the page (domain=, third-party) and the request
+# type are only checked when page_url or request_type is given.
+def iter_url_matches(catalog, urls, selected_uuids=None, custom_filters_enabled=False, page_url=None, request_type=None, on_progress=None):
+    selected_uuids = load_active_filters() if selected_uuids is None else selected_uuids
+    matchers = [load_url_matcher(catalog, selected_uuids, on_progress)]
+    if custom_filters_enabled:
+        matchers.append(build_url_matcher([("My Custom Filters", load_custom_filters())]))
+    for url in urls:
+        with timed("url_match") as counters:
+            matches = [match for matcher in matchers for match in match_url(matcher, url, page_url, request_type)]
+            counters["matches"] = len(matches)
+        yield url, is_blocked([rule for rule, _ in matches]), [(rule.line, rule.kind, source) for rule, source in matches]
+
+# Yield (list title, source title, url, changes) for each source of the given lists, lists defaulting to the active ones.
+# changes holds the rules "added" and "removed" by the last refresh that downloaded a new version of the source,
+# none when only its comments changed, when that refresh was ("synced_at") and the one before it ("previous_synced_at"),
+# and when the source was last "checked_at" upstream.
+# The times are None and the rules empty until a refresh finds a new version. With refresh set, every source is
+# revalidated first, however fresh its saved copy is.
+def iter_list_changes(catalog, selected_uuids=None, refresh=False, on_progress=None):
+    selected_uuids = load_active_filters() if selected_uuids is None else selected_uuids
+    selected_lists = get_selected_lists(catalog, selected_uuids)
+    prefetch_sources([source for _, sources in selected_lists for source in sources], on_progress, force=refresh)
+    for list_title, sources in selected_lists:
+        for url, title, filename in sources:
+            changes = load_list_changes(filename) or {"synced_at": None, "previous_synced_at": None, "added": [], "removed": []}
+            with cache_lock:
+                entry = cache_metadata.get(url)
+            yield list_title, title, url, {
+                "synced_at": changes["synced_at"],
+                "previous_synced_at": changes["previous_synced_at"],
+                "checked_at": entry['validated_at'] if entry else None,
+                "added": changes["added"],
+                "removed": changes["removed"],
+            }
+
+# Get the uuids of the lists chosen on the command line, by uuid or title
+def resolve_selected_uuids(catalog, args):
+    if args.all:
+        return [item['uuid'] for item in catalog]
+    selected_uuids = load_active_filters() if args.active else []
+    for name in args.list or []:
+        matches = [item['uuid'] for item in catalog if name in (item['uuid'], item.get('title'))]
+        if not matches:
+            raise SystemExit(f"Unknown list: {name}")
+        selected_uuids.extend(uuid for uuid in matches if uuid not in selected_uuids)
+    return selected_uuids
+
+# Add the options choosing which lists to use
+def add_selection_arguments(parser):
+    parser.add_argument("-l", "--list", action="append", metavar="LIST", help="uuid or title of a list to use, can be repeated")
+    parser.add_argument("--active", action="store_true", help="use the lists enabled in Brave")
+    parser.add_argument("--all", action="store_true", help="use every list in the catalog")
+    parser.add_argument("--custom", action="store_true", help="include the custom filters from Brave")
+
+# Print download progress on stderr, keeping stdout for results
+def print_progress(done, total, title):
+    print(f"Downloaded {done}/{total} lists: {title}", file=sys.stderr)
+
+# Write one JSON object per line to stdout
+def write_json_line(record):
+    sys.stdout.write(json.dumps(record) + "\n")
+
+# Read rules to compare, one per line, skipping blank lines
+def iter_input_rules(filename):
+    file = sys.stdin if filename == "-" else open(filename, 'r', encoding='utf-8')
+    try:
+        for line in file:
+            rule = line.strip()
+            if rule:
+                yield rule
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+# Write results to the --output file, or stream them to stdout, in the --format asked for
+def write_results(records, fields, args):
+    if args.output:
+        count = export_records(args.output, records, fields, args.format)
+        print(f"Exported {count:,} results to {args.output}", file=sys.stderr)
+    else:
+        write_records(records, sys.stdout, args.format or "jsonl", fields)
+
+# Add the options choosing where results are written and in which format
+def add_output_arguments(parser):
+    parser.add_argument("-o", "--output", metavar="FILE", help="export the results to a file instead of stdout")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="txt for plain rules, csv or jsonl (default jsonl on stdout, from the extension for --output)")
+
+# Run a parsed command line against the catalog, writing the results to stdout
+def run_command(catalog, args):
+    if args.command == "lists":
+        for item in catalog:
+            write_json_line({"uuid": item['uuid'], "title": item.get('title', 'No Title'), "sources": item.get('sources', [])})
+
+    elif args.command == "search":
+        selected_uuids = resolve_selected_uuids(catalog, args)
+        # Hits are streamed a line at a time unless worker processes were asked for, which return whole lists
+        if args.workers is not None and args.workers > 1:
+            hits = iter_hits(catalog, args.keyword, selected_uuids, args.custom, print_progress, args.workers)
+        else:
+            hits = iter_export_hits(catalog, args.keyword, selected_uuids, args.custom, print_progress)
+        try:
+            write_results(hits, HIT_FIELDS, args)
+        except re.error as e:
+            print(f"Invalid search pattern: {e}", file=sys.stderr)
+
+    elif args.command == "analyze":
+        # Like Brave, check against the active lists unless told otherwise
+        selected_uuids = resolve_selected_uuids(catalog, args) if (args.list or args.active or args.all) else None
+        rules = iter_input_rules(args.file) if args.file else None
+        for rule, status, covering_rule, source in iter_coverage_analysis(catalog, rules, selected_uuids, print_progress):
+            write_json_line({"rule": rule, "status": status, "covered_by": covering_rule, "source": source})
+
+    elif args.command == "changes":
+        selected_uuids = resolve_selected_uuids(catalog, args) if (args.list or args.active or args.all) else None
+        for list_title, source_title, url, changes in iter_list_changes(catalog, selected_uuids, args.refresh, print_progress):
+            write_json_line(dict({"list": list_title, "source": source_title, "url": url}, **changes))
+
+    elif args.command == "overlap":
+        selected_uuids = resolve_selected_uuids(catalog, args) if (args.list or args.active or args.all) else None
+        sources, pairs, distinct = get_list_overlap(catalog, selected_uuids, print_progress)
+        for entry in sources + pairs:
+            write_json_line(entry)
+        write_json_line({"lines": sum(source["lines"] for source in sources), "distinct": distinct})
+
+    elif args.command == "match":
+        selected_uuids = resolve_selected_uuids(catalog, args) if (args.list or args.active or args.all) else None
+        urls = list(args.url)
+        if args.file:
+            urls.extend(iter_input_rules(args.file))
+        for url, blocked, matches in iter_url_matches(catalog, urls, selected_uuids, args.custom, args.page, args.type, print_progress):
+            write_json_line({
+                "url": url,
+                "blocked": blocked,
+                "matches": [{"rule": rule, "kind": kind, "list": source} for rule, kind, source in matches],
+            })
+
+    elif args.catalog:
+        records = iter_catalog_comparison_records(catalog, iter_input_rules(args.file), print_progress)
+        write_results(records, CATALOG_COMPARISON_FIELDS, args)
+
+    else:
+        # Like the GUI, compare against the active lists and custom filters unless told otherwise
+        if not (args.list or args.active or args.all or args.custom):
+            args.active = args.custom = True
+        selected_uuids = resolve_selected_uuids(catalog, args)
+        existing_filters = [hit["rule"] for hit in iter_export_hits(catalog, "", selected_uuids, args.custom, print_progress)]
+        index = build_filter_index(existing_filters)
+        write_results(iter_comparison_records(index, iter_input_rules(args.file)), COMPARISON_FIELDS, args)
+
+# Command line entry point, results are streamed to stdout as JSON lines
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search and compare Brave filter lists without the GUI.")
+    parser.add_argument("--metrics", metavar="FILE", help="save per-phase timings and counters to a JSON file")
+    parser.add_argument("--profile", metavar="FILE", help="save a cProfile dump of the command, readable with pstats")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("lists", help="print the lists in the catalog")
+
+    search_parser = subparsers.add_parser("search", help="print every rule matching a keyword")
+    search_parser.add_argument("keyword", nargs="?", default="", help="keyword, structured or pattern query, empty for every rule")
+    search_parser.add_argument("-j", "--workers", type=int, help="search in this many processes, holding each list's matches until it is written (default: stream the matches from this process)")
+    add_selection_arguments(search_parser)
+    add_output_arguments(search_parser)
+
+    compare_parser = subparsers.add_parser("compare", help="compare rules read from a file or stdin")
+    compare_parser.add_argument("file", nargs="?", default="-", help="file with one rule per line, - for stdin")
+    compare_parser.add_argument("--catalog", action="store_true", help="compare against every list in the catalog")
+    add_selection_arguments(compare_parser)
+    add_output_arguments(compare_parser)
+
+    analyze_parser = subparsers.add_parser("analyze", help="report custom rules made redundant by broader rules or shadowed by exceptions")
+    analyze_parser.add_argument("file", nargs="?", help="file with one rule per line, - for stdin, the custom filters by default")
+    add_selection_arguments(analyze_parser)
+
+    changes_parser = subparsers.add_parser("changes", help="print the rules added and removed by the last change of each list")
+    changes_parser.add_argument("--refresh", action="store_true", help="check every list for a new version first")
+    add_selection_arguments(changes_parser)
+
+    overlap_parser = subparsers.add_parser("overlap", help="print how many rules each list has to itself and shares with each other list")
+    add_selection_arguments(overlap_parser)
+
+    match_parser = subparsers.add_parser("match", help="print the network rules that block or allow each URL")
+    match_parser.add_argument("url", nargs="*", help="URL to test")
+    match_parser.add_argument("-f", "--file", help="file with one URL per line, - for stdin")
+    match_parser.add_argument("--page", metavar="URL", help="URL of the page making the request, to check domain= and third-party")
+    match_parser.add_argument("--type", choices=REQUEST_TYPES, help="request type, to check type options such as script or image")
+    add_selection_arguments(match_parser)
+
+    add_parser = subparsers.add_parser("add", help="add rules read from a file or stdin to the custom filters in Local State")
+    add_parser.add_argument("file", nargs="?", default="-", help="file with one rule per line, - for stdin")
+    add_parser.add_argument("--local-state", default=LOCAL_STATE_PATH, help="path of Brave's Local State file, Brave must be closed")
+
+    args = parser.parse_args(argv)
+
+    # Adding filters only touches Local State, it does not need the catalog
+    if args.command == "add":
+        try:
+            added = add_custom_filters(iter_input_rules(args.file), args.local_state)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error adding new filters: {e}", file=sys.stderr)
+            return 1
+        write_json_line({"added": added})
+        return 0
+
+    init_local_content()
+    catalog = load_catalog()
+    if catalog is None:
+        print("Failed to load the filter list catalog.", file=sys.stderr)
+        return 1
+
+    if args.profile:
+        start_profiling()
+    try:
+        profile_call(run_command, catalog, args)
+    except BrokenPipeError:
+        # The reader went away, e.g. when piping into head, so stop writing to it
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    finally:
+        cleanup_local_content()
+        if args.profile:
+            stop_profiling(args.profile)
+        if args.metrics:
+            export_metrics(args.metrics)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
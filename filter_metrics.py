@@ -0,0 +1,168 @@
+import cProfile
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket takes everything slower
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# Number of sources kept per phase, the slowest ones in total, when metrics are shown or exported
+TOP_SOURCES = 20
+
+# Recorded metrics: phase -> totals, plus (phase, source) -> totals for each source, guarded by metrics_lock
+phase_metrics = {}
+source_metrics = {}
+metrics_lock = threading.Lock()
+
+# Profiler collecting calls made through profile_call, None while profiling is off, guarded by profiler_lock
+# with the profiler a call is running under and the (profiler, filename) of a stopped profiler still running one
+profiler = None
+running_profiler = None
+pending_dump = None
+profiler_lock = threading.Lock()
+
+
+# Create empty totals for a phase or source
+def new_entry():
+    return {"count": 0, "seconds": 0.0, "max": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1), "counters": {}}
+
+
+# Add one timed call to totals
+def add_to_entry(entry, seconds, counters):
+    entry["count"] += 1
+    entry["seconds"] += seconds
+    entry["max"] = max(entry["max"], seconds)
+    bucket = 0
+    while bucket < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[bucket]:
+        bucket += 1
+    entry["buckets"][bucket] += 1
+    for name, amount in counters.items():
+        entry["counters"][name] = entry["counters"].get(name, 0) + amount
+
+
+# Record a call of a phase that took the given seconds, with optional counters such as bytes or lines
+def record(phase, seconds, source=None, **counters):
+    with metrics_lock:
+        add_to_entry(phase_metrics.setdefault(phase, new_entry()), seconds, counters)
+        if source is not None:
+            add_to_entry(source_metrics.setdefault((phase, source), new_entry()), seconds, counters)
+
+
+# Time the body of a with statement as one call of a phase. The yielded dict collects counters.
+@contextmanager
+def timed(phase, source=None):
+    counters = {}
+    start = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        record(phase, time.perf_counter() - start, source, **counters)
+
+
+# Forget everything recorded so far
+def reset_metrics():
+    with metrics_lock:
+        phase_metrics.clear()
+        source_metrics.clear()
+
+
+# Get a latency histogram from the bucket counts of totals, keyed by the bucket bounds
+def get_histogram(buckets):
+    return dict(zip([f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"], buckets))
+
+
+# Get a copy of the metrics, each phase with its mean, latency histogram and slowest sources with their own histograms
+def get_metrics():
+    with metrics_lock:
+        phases = {phase: dict(entry, counters=dict(entry["counters"]), buckets=list(entry["buckets"])) for phase, entry in phase_metrics.items()}
+        sources = {key: dict(entry, counters=dict(entry["counters"]), buckets=list(entry["buckets"])) for key, entry in source_metrics.items()}
+
+    for phase, entry in phases.items():
+        entry["mean"] = entry["seconds"] / entry["count"] if entry["count"] else 0.0
+        entry["histogram"] = get_histogram(entry.pop("buckets"))
+        slowest = sorted(((key[1], source) for key, source in sources.items() if key[0] == phase), key=lambda item: item[1]["seconds"], reverse=True)
+        entry["sources"] = {
+            name: {
+                "count": source["count"],
+                "seconds": source["seconds"],
+                "max": source["max"],
+                "histogram": get_histogram(source["buckets"]),
+                "counters": source["counters"],
+            }
+            for name, source in slowest[:TOP_SOURCES]
+        }
+    return phases
+
+
+# Format the metrics as text lines for a status panel
+def format_metrics():
+    lines = []
+    for phase, entry in sorted(get_metrics().items()):
+        counters = "".join(f", {name} {amount:,}" for name, amount in sorted(entry["counters"].items()))
+        lines.append(f"{phase}: {entry['count']:,} calls, {entry['seconds']:.3f}s total, {entry['mean'] * 1000:.1f}ms mean, {entry['max'] * 1000:.1f}ms max{counters}")
+        for name, source in list(entry["sources"].items())[:5]:
+            lines.append(f"    {name}: {source['count']:,} calls, {source['seconds']:.3f}s total")
+    return lines or ["Nothing recorded yet."]
+
+
+# Save the metrics to a JSON file
+def export_metrics(filename):
+    with open(filename, "w") as file:
+        json.dump({"latency_buckets": LATENCY_BUCKETS, "phases": get_metrics()}, file, indent=2)
+
+
+# Start collecting a profile of the calls made through profile_call
+def start_profiling():
+    global profiler
+    with profiler_lock:
+        if profiler is None:
+            profiler = cProfile.Profile()
+
+
+# Stop profiling and save the collected profile as a cProfile dump, readable with pstats. A profile still
+# running a call is saved once that call returns, so stopping never waits for it. Returns False if profiling
+# was not running.
+def stop_profiling(filename):
+    global profiler, pending_dump
+    with profiler_lock:
+        finished, profiler = profiler, None
+        if finished is None:
+            return False
+        if finished is running_profiler:
+            pending_dump = (finished, filename)
+            return True
+    finished.dump_stats(filename)
+    return True
+
+
+# Check whether a profile is being collected
+def is_profiling():
+    return profiler is not None
+
+
+# Call a function, profiling it while profiling is on. A profiler follows a single thread,
+# so a call made while another thread's call is being profiled runs unprofiled.
+def profile_call(function, *args, **kwargs):
+    global running_profiler, pending_dump
+    with profiler_lock:
+        active = profiler if running_profiler is None else None
+        if active is not None:
+            running_profiler = active
+    if active is None:
+        return function(*args, **kwargs)
+
+    try:
+        return active.runcall(function, *args, **kwargs)
+    finally:
+        with profiler_lock:
+            running_profiler = None
+            dump = pending_dump if pending_dump is not None and pending_dump[0] is active else None
+            if dump is not None:
+                pending_dump = None
+        if dump is not None:
+            try:
+                active.dump_stats(dump[1])
+            except OSError as e:
+                print(f"Error saving profile to {dump[1]}: {e}", file=sys.stderr)
@@ -0,0 +1,156 @@
+import re
+from functools import lru_cache
+
+# Words that combine the terms of a pattern query, NOT binds tighter than AND and AND tighter than OR
+QUERY_OPERATORS = ("AND", "OR", "NOT")
+
+# Prefix of query terms that are regular expressions instead of plain text
+REGEX_PREFIX = "re:"
+
+# Tokens of a pattern query, a double-quoted phrase or a run of non-space characters
+QUERY_TOKEN = re.compile(r'(?:re:)?"[^"]*"|\S+')
+
+
+# Check whether a keyword is a boolean or regex query rather than a plain substring
+def is_pattern_query(keyword):
+    return any(token in QUERY_OPERATORS or token.startswith(REGEX_PREFIX) for token in keyword.split())
+
+
+# Compile a single query term into a case-insensitive bytes regex
+def compile_term(token):
+    regex = token.startswith(REGEX_PREFIX)
+    if regex:
+        token = token[len(REGEX_PREFIX):]
+    if len(token) >= 2 and token.startswith('"') and token.endswith('"'):
+        token = token[1:-1]
+    pattern = token.encode("utf-8")
+    if not regex:
+        pattern = re.escape(pattern)
+    return ("term", re.compile(pattern, re.IGNORECASE | re.MULTILINE))
+
+
+# Parse a term, optionally negated with NOT
+def parse_not(tokens, position):
+    if position >= len(tokens):
+        raise re.error("missing term at end of query")
+    if tokens[position] == "NOT":
+        node, position = parse_not(tokens, position + 1)
+        return ("not", node), position
+    if tokens[position] in QUERY_OPERATORS:
+        raise re.error(f"unexpected {tokens[position]}")
+    return compile_term(tokens[position]), position + 1
+
+
+# Parse terms joined by AND, adjacent terms without an operator must also all match
+def parse_and(tokens, position):
+    nodes = []
+    while True:
+        node, position = parse_not(tokens, position)
+        nodes.append(node)
+        if position < len(tokens) and tokens[position] == "AND":
+            position += 1
+        elif position >= len(tokens) or tokens[position] == "OR":
+            break
+    return (nodes[0] if len(nodes) == 1 else ("and", nodes)), position
+
+
+# Compile a pattern query into a tree of ("term", regex), ("not", node), ("and", nodes) and ("or", nodes).
+# Raises re.error for invalid regular expressions or misplaced operators.
+@lru_cache(maxsize=32)
+def compile_pattern_query(keyword):
+    tokens = QUERY_TOKEN.findall(keyword)
+    nodes = []
+    position = 0
+    while True:
+        node, position = parse_and(tokens, position)
+        nodes.append(node)
+        if position >= len(tokens):
+            break
+        position += 1  # Skip the OR
+    return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+
+# Check whether a line, as bytes, matches a compiled query
+def match_query(query, line):
+    kind = query[0]
+    if kind == "term":
+        return query[1].search(line) is not None
+    if kind == "not":
+        return not match_query(query[1], line)
+    if kind == "and":
+        return all(match_query(node, line) for node in query[1])
+    return any(match_query(node, line) for node in query[1])
+
+
+# Get regexes of which at least one matches every line the query matches, or None when no term is required.
+# Only lines around their matches need to be looked at, instead of every line of a list.
+def get_anchor_terms(query):
+    kind = query[0]
+    if kind == "term":
+        return [query[1]]
+    if kind == "not":
+        return None
+    if kind == "and":
+        # The rarest term would be best, without statistics the first required one will do
+        for node in query[1]:
+            anchors = get_anchor_terms(node)
+            if anchors is not None:
+                return anchors
+        return None
+    anchors = []
+    for node in query[1]:
+        node_anchors = get_anchor_terms(node)
+        if node_anchors is None:
+            return None
+        anchors.extend(node_anchors)
+    return anchors
+
+
+# Get the start offsets of the lines of a buffer that contain a match of any of the anchor regexes
+def find_anchor_lines(buffer, anchors):
+    starts = []
+    for anchor in anchors:
+        position = 0
+        while True:
+            match = anchor.search(buffer, position)
+            if match is None:
+                break
+            starts.append(buffer.rfind(b"\n", 0, match.start()) + 1)
+            # Continue after this line, it only needs to be found once
+            end = buffer.find(b"\n", match.start())
+            if end == -1:
+                break
+            position = end + 1
+    # A single anchor finds the lines in order, several can find the same line more than once
+    return starts if len(anchors) == 1 else sorted(set(starts))
+
+
+# Yield the start offset of every line of a buffer
+def iter_line_starts(buffer):
+    position = 0
+    size = len(buffer)
+    while position < size:
+        yield position
+        end = buffer.find(b"\n", position)
+        if end == -1:
+            break
+        position = end + 1
+
+
+# Yield the start offset and bytes of each non-comment line of a buffer of list content matching a compiled query.
+# The buffer can be bytes, a bytearray or an mmap, only the lines that are looked at are copied out of it.
+def iter_buffer_matches(buffer, query):
+    anchors = get_anchor_terms(query)
+    starts = iter_line_starts(buffer) if anchors is None else find_anchor_lines(buffer, anchors)
+    for start in starts:
+        end = buffer.find(b"\n", start)
+        line = buffer[start:end if end != -1 else len(buffer)].rstrip(b"\r")
+        if line.lstrip().startswith(b"!"):
+            continue
+        if match_query(query, line):
+            yield start, bytes(line)
+
+
+# Get the non-comment lines of a buffer of list content matching a compiled query, as bytes
+def search_buffer(buffer, query):
+    return [line for _, line in iter_buffer_matches(buffer, query)]
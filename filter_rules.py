@@ -0,0 +1,230 @@
+import re
+from array import array
+
+# Kinds of rules a filter list line can hold
+RULE_KINDS = ("network", "exception", "cosmetic", "scriptlet")
+
+# Separators between the domains and the body of cosmetic and scriptlet rules
+COSMETIC_SEPARATOR = re.compile(r"#@?[?$%]?#")
+
+# Start of the options of a network rule, e.g. $third-party,domain=example.com
+OPTION_NAME = re.compile(r"~?[a-z0-9_-]+(=|,|$)", re.IGNORECASE)
+
+# Option names that mean the same thing, mapped to the name used in canonical rules
+OPTION_ALIASES = {
+    "3p": "third-party",
+    "1p": "~third-party",
+    "first-party": "~third-party",
+    "xhr": "xmlhttprequest",
+    "css": "stylesheet",
+    "frame": "subdocument",
+    "doc": "document",
+    "ghide": "generichide",
+    "ehide": "elemhide",
+    "shide": "specifichide",
+    "from": "domain",
+}
+
+# Query fields understood by structured searches, "type" and "kind" both select the rule kind
+QUERY_FIELDS = ("domain", "type", "kind", "option")
+
+
+# A parsed filter rule, slots keep the many records of a large list small
+class Rule:
+    __slots__ = ("kind", "pattern", "domains", "hostname", "options")
+
+    def __init__(self, kind, pattern, domains=(), hostname=None, options=()):
+        self.kind = kind
+        self.pattern = pattern
+        self.domains = domains  # Domains the rule applies on, negated ones start with ~
+        self.hostname = hostname  # Host of a ||host anchored network rule
+        self.options = options  # (name, value) pairs, value is None for flags
+
+    def __repr__(self):
+        return f"Rule({self.kind!r}, {self.pattern!r}, domains={self.domains!r}, hostname={self.hostname!r}, options={self.options!r})"
+
+
+# Parse a cosmetic or scriptlet rule, or return None if the line has no cosmetic separator
+def parse_cosmetic_rule(line):
+    match = COSMETIC_SEPARATOR.search(line)
+    if not match:
+        return None
+    separator = match.group()
+    body = line[match.end():]
+    domains = tuple(domain.strip().lower() for domain in line[:match.start()].split(",") if domain.strip())
+
+    if "@" in separator:
+        kind = "exception"
+    elif "%" in separator or body.startswith("+js(") or body.startswith("//scriptlet("):
+        kind = "scriptlet"
+    else:
+        kind = "cosmetic"
+    return Rule(kind, body, domains)
+
+
+# Split the options of a network rule into (name, value) pairs
+def parse_options(text):
+    options = []
+    for option in text.split(","):
+        option = option.strip()
+        if not option:
+            continue
+        name, _, value = option.partition("=")
+        options.append((name.lower(), value if "=" in option else None))
+    return tuple(options)
+
+
+# Parse a filter list line into a Rule, or return None for comments, headers and blank lines
+def parse_rule(line):
+    line = line.strip()
+    if not line or line.startswith("!") or (line.startswith("[") and line.endswith("]")):
+        return None
+
+    rule = parse_cosmetic_rule(line)
+    if rule is not None:
+        return rule
+
+    kind = "network"
+    pattern = line
+    if pattern.startswith("@@"):
+        kind = "exception"
+        pattern = pattern[2:]
+
+    # Options follow the last $, unless it is part of a regex pattern
+    options = ()
+    option_start = pattern.rfind("$")
+    if option_start != -1 and OPTION_NAME.match(pattern, option_start + 1) and not (
+        pattern.startswith("/") and pattern.rfind("/") > option_start
+    ):
+        options = parse_options(pattern[option_start + 1:])
+        pattern = pattern[:option_start]
+
+    domains = ()
+    for name, value in options:
+        if name == "domain" and value:
+            domains = tuple(domain.strip().lower() for domain in value.split("|") if domain.strip())
+
+    hostname = None
+    if pattern.startswith("||"):
+        hostname = re.split(r"[\^/*|:?]", pattern[2:], maxsplit=1)[0].lower() or None
+
+    return Rule(kind, pattern, domains, hostname, options)
+
+
+# Get a domain and its parent domains, so sub.example.com is found by a query for example.com
+def get_domain_suffixes(domain):
+    parts = domain.split(".")
+    return [".".join(parts[i:]) for i in range(len(parts) - 1)] or [domain]
+
+
+# Build the field indexes over the lines of a list, mapping field values to line numbers.
+# Lines can be any iterable, so a list can be indexed while it is streamed from disk.
+def build_rule_index(lines):
+    kinds = {}
+    domains = {}
+    options = {}
+    line_count = 0
+    for line_number, line in enumerate(lines):
+        line_count += 1
+        rule = parse_rule(line)
+        if rule is None:
+            continue
+        kinds.setdefault(rule.kind, array("I")).append(line_number)
+
+        rule_domains = set()
+        for domain in rule.domains:
+            if not domain.startswith("~"):
+                rule_domains.update(get_domain_suffixes(domain))
+        if rule.hostname:
+            rule_domains.update(get_domain_suffixes(rule.hostname))
+        for domain in rule_domains:
+            domains.setdefault(domain, array("I")).append(line_number)
+
+        for name in {name for name, _ in rule.options}:
+            options.setdefault(name, array("I")).append(line_number)
+    return {"lines": line_count, "kind": kinds, "domain": domains, "option": options}
+
+
+# Split a keyword into structured (field, value) terms and the remaining free text
+def parse_query(keyword):
+    fields = []
+    text = []
+    for term in keyword.split():
+        name, separator, value = term.partition(":")
+        if separator and value and name.lower() in QUERY_FIELDS:
+            name = name.lower()
+            fields.append(("kind" if name == "type" else name, value.lower()))
+        else:
+            text.append(term)
+    return fields, " ".join(text)
+
+
+# Check whether a keyword uses any structured query fields
+def is_structured_query(keyword):
+    return bool(parse_query(keyword)[0])
+
+
+# Get the sorted numbers of the lines matching all query fields
+def get_rule_candidates(index, fields):
+    candidates = None
+    for name, value in fields:
+        line_numbers = index[name].get(value)
+        if not line_numbers:
+            return []
+        if candidates is None:
+            candidates = set(line_numbers)
+        else:
+            candidates.intersection_update(line_numbers)
+        if not candidates:
+            return []
+    return sorted(candidates)
+
+
+# Get the lines matching all query fields and containing the free text
+def search_rule_index(lines, index, fields, text=""):
+    text = text.lower()
+    return [lines[n] for n in get_rule_candidates(index, fields) if text in lines[n].lower()]
+
+
+# Resolve the alias of an option name, keeping it negated, so ~1p becomes third-party and ~3p ~third-party
+def resolve_option_name(name):
+    negated = name.startswith("~")
+    name = name.lstrip("~")
+    name = OPTION_ALIASES.get(name, name)
+    if name.startswith("~"):  # An alias such as 1p stands for a negated option
+        negated = not negated
+        name = name[1:]
+    return "~" + name if negated else name
+
+
+# Get the canonical form of an option, with its name unaliased and domain lists sorted
+def canonicalize_option(name, value):
+    name = resolve_option_name(name)
+    if value is None:
+        return name
+    if name == "domain":
+        value = "|".join(sorted({domain.strip().lower() for domain in value.split("|") if domain.strip()}))
+    return f"{name}={value}"
+
+
+# Get a canonical form of a rule, equal for rules that only differ in option or domain order,
+# option aliases, letter case of domains and of the ||host part or surrounding whitespace
+def canonicalize_rule(line):
+    line = line.strip()
+    rule = parse_rule(line)
+    if rule is None:
+        return line
+
+    # Cosmetic and scriptlet rules, parse_rule already treats any line with a separator as one
+    match = COSMETIC_SEPARATOR.search(line)
+    if match:
+        return ",".join(sorted(set(rule.domains))) + match.group() + rule.pattern.strip()
+
+    pattern = rule.pattern
+    if rule.hostname:
+        pattern = "||" + pattern[2:2 + len(rule.hostname)].lower() + pattern[2 + len(rule.hostname):]
+    options = sorted({canonicalize_option(name, value) for name, value in rule.options})
+    canonical = ("@@" if rule.kind == "exception" else "") + pattern
+    if options:
+        canonical += "$" + ",".join(options)
+    return canonical
@@ -1,178 +1,261 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import requests
-import os
+from tkinter import ttk, messagebox, filedialog
+from tkinter import font as tkfont
 import sys
 import signal
-import json
-
-# Directory to store local content
-LOCAL_CONTENT_DIR = "local_content"
-
-# Fetch JSON data from a URL
-def fetch_json_data(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        return response.json()
-    except requests.RequestException as e:
-        print(f"Error fetching JSON data: {e}")
-        return []
-
-# Load the active filters
-def load_active_filters():
-    input_file_path = os.path.expanduser('~/Library/Application Support/BraveSoftware/Brave-Browser/Local State')
-    try:
-        with open(input_file_path, 'r') as file:
-            raw_content = file.read()
-        json_start_index = raw_content.find('{')
-        json_string = raw_content[json_start_index:]
-        data = json.loads(json_string)
-        active_filters = [
-            uuid for uuid, details in data['brave']['ad_block']['regional_filters'].items()
-            if details.get('enabled')
-        ]
-        return active_filters
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error loading active filters: {e}")
-        return []
-
-# Function to toggle active filters
-def toggle_active_filters(var):
+import queue
+import threading
+import time
+import bisect
+from filter_engine import (
+    LOCAL_STATE_PATH,
+    init_local_content,
+    cleanup_local_content,
+    load_cached_catalog,
+    load_catalog,
+    add_custom_filters,
+    load_active_filters,
+    search_custom_filters,
+    iter_search_results,
+    build_filter_index,
+    classify_rule,
+    iter_catalog_comparison,
+    iter_coverage_analysis,
+    iter_url_matches,
+    iter_list_changes,
+    export_search_results,
+    export_records,
+    iter_comparison_records,
+    iter_catalog_comparison_records,
+    COMPARISON_FIELDS,
+    CATALOG_COMPARISON_FIELDS,
+    FileChangedError,
+    start_local_state_watcher,
+)
+from url_matcher import REQUEST_TYPES
+from filter_metrics import timed, profile_call, format_metrics, reset_metrics, export_metrics, start_profiling, stop_profiling, is_profiling
+
+# Delay in milliseconds between the last keystroke and the start of a search
+SEARCH_DEBOUNCE_MS = 250
+
+# Interval in milliseconds between refreshes of the timings panel while it is open
+METRICS_REFRESH_MS = 1000
+
+# File types offered when exporting results, the extension picks the format
+EXPORT_FILETYPES = [("Plain rules", "*.txt"), ("CSV", "*.csv"), ("JSON Lines", "*.jsonl")]
+
+# Timings panel, None while it is closed
+metrics_window = None
+
+# URL tester window, None while it is closed
+url_tester_window = None
+
+# Most added or removed rules shown per list in the changes window, the counts always cover all of them
+CHANGES_SHOWN_LINES = 200
+
+# Window showing what changed in the selected lists, None while it is closed
+changes_window = None
+
+# Lists ticked in the catalog panel, the panel rows only show this state
+checked_uuids = set()
+
+# Number of catalog rows inserted at a time, the rest follow once the window is idle
+CATALOG_BATCH_SIZE = 200
+
+# Event state bits of Shift, Control and Alt (Command on macOS), a click holding one of them only changes the selection
+CLICK_MODIFIERS = 0x0001 | 0x0004 | 0x0008
+
+# Pending call inserting the next batch of catalog rows, None once all rows are in
+catalog_fill_id = None
+
+# State of the background search worker
+search_queue = queue.Queue()
+search_generation = 0  # Incremented for every new search, older searches are stale
+rendered_generation = 0  # Generation of the results currently shown
+current_filters = []  # Filters shown in the results, used by compare_filters
+current_filter_index = None  # Exact and canonical lookups over current_filters, built by compare_filters
+search_after_id = None
+search_thread = None
+
+# Select the active filters, or clear the selection
+def apply_active_filters(var):
     if var.get():
-        active_filters = load_active_filters()
-        for uuid in check_vars:
-            check_vars[uuid].set(1 if uuid in active_filters else 0)
+        active_filters = set(load_active_filters())
+        set_checked_lists({item['uuid'] for item in data if item['uuid'] in active_filters})
     else:
-        for uuid in check_vars:
-            check_vars[uuid].set(0)
-    update_results()  # Call to update the results after toggling filters
-
-# Load custom filters
-def load_custom_filters():
-    input_file_path = os.path.expanduser('~/Library/Application Support/BraveSoftware/Brave-Browser/Local State')
-    try:
-        with open(input_file_path, 'r') as file:
-            raw_content = file.read()
-        json_start_index = raw_content.find('{')
-        json_string = raw_content[json_start_index:]
-        data = json.loads(json_string)
-        custom_filters = data['brave']['ad_block'].get('custom_filters', '').strip().splitlines()
-        return [filter for filter in custom_filters if filter]
-    except Exception as e:
-        print(f"Error loading custom filters: {e}")
-        return []
-
-# Fetch the content from a URL and save it locally
-def fetch_and_save_url_content(url, filename):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        content_type = response.headers.get('Content-Type', '')
-        if 'text' not in content_type:
-            print(f"Skipping non-text content from {url}")
-            return None
-        with open(filename, 'w', encoding='utf-8') as file:
-            file.write(response.text)
-        return response.text
-    except requests.RequestException as e:
-        print(f"Error fetching {url}: {e}")
-        return None
-
-# Load the content from a local file
-def load_local_content(filename):
-    try:
-        with open(filename, 'r', encoding='utf-8') as file:
-            return file.read()
-    except FileNotFoundError:
-        return None
-
-# Search for the keyword in the content
-def search_in_content(content, keyword):
-    if not content:
-        return []
+        set_checked_lists(set())
+
+# Bring the selection and results up to date with a change Brave made to Local State, must run on the Tk thread.
+# Only the lists Brave enabled or disabled are ticked or unticked, lists ticked by hand stay as they are.
+def apply_local_state_changes(changes):
+    needs_search = False
+    if active_filters_var.get():
+        catalog_uuids = {item['uuid'] for item in data}
+        checked = (checked_uuids - set(changes["disabled"])) | (set(changes["enabled"]) & catalog_uuids)
+        if checked != checked_uuids:
+            set_checked_lists(checked)
+            needs_search = True
+    if custom_filters_var.get() and (changes["custom_added"] or changes["custom_removed"]):
+        needs_search = True
+
+    set_status(
+        f"Local State changed: {len(changes['enabled'])} lists enabled, {len(changes['disabled'])} disabled, "
+        f"{len(changes['custom_added'])} custom filters added, {len(changes['custom_removed'])} removed"
+    )
+    if needs_search:
+        request_search(0)
 
-    lines = content.splitlines()
-    filtered_lines = [line for line in lines if keyword.lower() in line.lower() and not line.strip().startswith('!')]
-    return filtered_lines
-
-# Update the results based on selected checkboxes and keyword
-def update_results():
-    global current_filters  # Make current_filters accessible globally
-    keyword = keyword_var.get()
-    selected_uuids = [uuid for uuid, var in check_vars.items() if var.get()]
-    custom_filters_enabled = custom_filters_var.get() == 1
+# Function to toggle active filters
+def toggle_active_filters(var):
+    apply_active_filters(var)
+    request_search(0)  # Update the results after toggling filters
 
-    result_text.delete(1.0, tk.END)
-    current_filters = []
+# Collect the result blocks for a search, returns None if the search was cancelled
+def collect_results(keyword, selected_uuids, custom_filters_enabled, is_cancelled=lambda: False, on_progress=None):
+    blocks = []  # (lines, tag) pairs shown in the result view, matches are kept as the search's own lists
+    filters = []
 
     if not selected_uuids and not custom_filters_enabled:
-        result_text.insert(tk.END, "Please select at least one filter or enable custom filters.")
-        return
+        blocks.append((["Please select at least one filter or enable custom filters."], None))
+        return blocks, filters
 
     # If custom filters are enabled, add them to the results
     if custom_filters_enabled:
-        custom_filters = load_custom_filters()
-        # If there's no keyword, show all custom filters
-        if keyword:
-            filtered_custom_filters = search_in_content("\n".join(custom_filters), keyword)
+        filtered_custom_filters = search_custom_filters(keyword)
+        if filtered_custom_filters:
+            blocks.append((["", "", "--- Custom Filters ---", ""], None))
+            blocks.append((filtered_custom_filters, None))
+            filters.extend(filtered_custom_filters)  # Keep track of custom filters
+
+    for event in iter_search_results(data, keyword, selected_uuids, is_cancelled, on_progress, interactive=True):
+        if event[0] == "list":
+            blocks.append((["", "", f"--- List Title: {event[1]} ---", ""], "list_title"))
+        elif event[0] == "invalid":
+            return [([event[1]], None)], []
+        elif event[0] == "failed":
+            _, url, title = event
+            blocks.append((["", "", f"--- Failed to load content from {url} ({title}) ---", ""], "url"))
         else:
-            filtered_custom_filters = custom_filters  # Show all if no keyword
+            _, url, title, filtered_lines = event
+            if filtered_lines:
+                blocks.append((["", "", f"--- Content from {url} ({title}) ---", ""], "url"))
+                blocks.append(([f"--- Filter: {title} ---", ""], "uuid_title"))  # Use the title from the source
+                blocks.append((filtered_lines, None))
+                filters.extend(filtered_lines)  # Add filtered lines to current filters
+
+    # A cancelled search stops without finishing its lists
+    if is_cancelled():
+        return None
 
-        if filtered_custom_filters:
-            result_text.insert(tk.END, "\n\n--- Custom Filters ---\n\n")
-            for filter in filtered_custom_filters:
-                result_text.insert(tk.END, filter + "\n")
-                current_filters.append(filter)  # Keep track of custom filters
-
-    # Dictionary to keep track of which URLs correspond to which titles
-    url_title_mapping = {}
-
-    for uuid in selected_uuids:
-        for item in data:
-            if item['uuid'] == uuid:
-                list_title = item.get('title', 'No Title')
-                result_text.insert(tk.END, f"\n\n--- List Title: {list_title} ---\n\n", "list_title")
-
-                for source in item.get('sources', []):
-                    url = source.get('url')
-                    title = source.get('title', 'No Title')  # Provide a default title if missing
-                    if url:
-                        url_title_mapping[url] = title
-                        filename = os.path.join(LOCAL_CONTENT_DIR, f"{uuid}_{title}.txt")
-                        if not os.path.exists(filename):
-                            content = fetch_and_save_url_content(url, filename)
-                        else:
-                            content = load_local_content(filename)
-
-                        if content is None:
-                            result_text.insert(tk.END, f"\n\n--- Failed to load content from {url} ({title}) ---\n\n", "url")
-                            continue
-
-                        filtered_lines = search_in_content(content, keyword)
-
-                        if filtered_lines:
-                            result_text.insert(tk.END, f"\n\n--- Content from {url} ({title}) ---\n\n", "url")
-                            result_text.insert(tk.END, f"--- Filter: {title} ---\n\n", "uuid_title")  # Use the title from the source
-                            for line in filtered_lines:
-                                result_text.insert(tk.END, line + "\n")
-                                current_filters.append(line)  # Add filtered lines to current filters
-
-    if not current_filters:
-        result_text.insert(tk.END, "No results found.")
+    if not filters:
+        blocks.append((["No results found."], None))
+    return blocks, filters
+
+# Show collected results in the result view, must run on the Tk thread
+def render_results(blocks, filters, generation):
+    global current_filters, rendered_generation  # Make current_filters accessible globally
+    with timed("render") as counters:
+        result_view.set_blocks(blocks)
+        root.update_idletasks()  # Include drawing the first page in the time
+        counters["rows"] = result_view.total
+    hit_count_var.set(f"{len(filters):,} matches")
+    current_filters = filters
+    rendered_generation = generation
+
+# Read the search inputs from the widgets, must run on the Tk thread
+def get_search_query():
+    keyword = keyword_var.get()
+    selected_uuids = [item['uuid'] for item in data if item['uuid'] in checked_uuids]
+    custom_filters_enabled = custom_filters_var.get() == 1
+    return keyword, selected_uuids, custom_filters_enabled
+
+# Update the results based on selected checkboxes and keyword, blocking until done
+def update_results():
+    global search_generation
+    search_generation += 1  # Drop any search still running in the background
+    blocks, filters = collect_results(*get_search_query())
+    render_results(blocks, filters, search_generation)
+
+# Schedule a background search once the input has been quiet for the debounce delay
+def request_search(delay=SEARCH_DEBOUNCE_MS):
+    global search_after_id
+    if search_after_id is not None:
+        root.after_cancel(search_after_id)
+    search_after_id = root.after(delay, start_search)
+
+# Hand the current query to the search worker
+def start_search():
+    global search_after_id, search_generation, search_thread
+    search_after_id = None
+    search_generation += 1
+    if search_thread is None:
+        search_thread = threading.Thread(target=search_worker, daemon=True)
+        search_thread.start()
+    search_queue.put((search_generation, get_search_query()))
+
+# Run queued searches off the Tk thread, skipping any that are already stale
+def search_worker():
+    while True:
+        generation, query = search_queue.get()
+        try:
+            while True:
+                generation, query = search_queue.get_nowait()
+        except queue.Empty:
+            pass
+        if generation != search_generation:
+            continue
+
+        try:
+            with timed("search_total"):
+                results = profile_call(
+                    collect_results,
+                    *query,
+                    is_cancelled=lambda: generation != search_generation,
+                    on_progress=lambda done, total, title: root.after(0, set_status, f"Downloaded {done}/{total} lists: {title}"),
+                )
+        except Exception as e:
+            # Show the failure in place of the results and keep serving later searches
+            print(f"Search failed: {e}", file=sys.stderr)
+            results = ([([f"Search failed: {e}"], None)], [])
+        if results is None:
+            continue
+        try:
+            root.after(0, finish_search, generation, results)
+        except (RuntimeError, tk.TclError):
+            return  # The window has been closed
+
+# Show a message in the status line, must run on the Tk thread
+def set_status(message):
+    status_var.set(message)
+
+# Render the results of a background search unless a newer one has started
+def finish_search(generation, results):
+    if generation == search_generation:
+        render_results(*results, generation)
+        set_status("")
 
 def compare_filters(new_filter_text):
 
     new_filters = new_filter_text.strip().splitlines()
 
+    # Comparing against the whole catalog uses the membership index instead of the search results
+    if compare_catalog_var.get():
+        compare_filters_with_catalog(new_filters)
+        return
+
     # Ensure both filters are enabled
+    needs_update = False
     if active_filters_var.get() == 0:
         active_filters_var.set(1)  # Enable "Show My Active Filters"
-        toggle_active_filters(active_filters_var)  # Load active filters
+        apply_active_filters(active_filters_var)  # Load active filters
+        needs_update = True
 
     if custom_filters_var.get() == 0:
         custom_filters_var.set(1)  # Enable "My Custom Filters"
-        # Load custom filters if not already loaded
+        needs_update = True
+
+    # Also search now if the shown results are out of date
+    if needs_update or search_after_id is not None or rendered_generation != search_generation:
         update_results()  # This will also load custom filters into results
 
     # Clear previous results
@@ -183,65 +266,201 @@ def compare_filters(new_filter_text):
         return
 
     # Now both filters are guaranteed to be enabled
+    index = get_current_filter_index()
+    counts = {"new_filter": 0, "duplicate_filter": 0, "equivalent_filter": 0}
     for new_filter in new_filters:
-        if new_filter in current_filters:
+        status, existing_filter = classify_rule(index, new_filter)
+        if status == "duplicate":
             # Highlight duplicate filters in red
-            compare_results_text.insert(tk.END, f"{new_filter}\n", "duplicate_filter")
+            tag = "duplicate_filter"
+            line = f"{new_filter}\n"
+        elif status == "equivalent":
+            # Highlight filters equivalent to an existing one in orange
+            tag = "equivalent_filter"
+            line = f"{new_filter}    (same as {existing_filter})\n"
         else:
             # Highlight new filters in green
-            compare_results_text.insert(tk.END, f"{new_filter}\n", "new_filter")
+            tag = "new_filter"
+            line = f"{new_filter}\n"
+        counts[tag] += 1
+        compare_results_text.insert(tk.END, line, tag)
+
+    compare_results_text.insert(
+        tk.END,
+        f"\n{counts['new_filter']} new, {counts['duplicate_filter']} exact duplicates, "
+        f"{counts['equivalent_filter']} equivalent duplicates\n",
+    )
 
     # Configure tags for highlighting
     compare_results_text.tag_configure("new_filter", foreground="green")
     compare_results_text.tag_configure("duplicate_filter", foreground="red")
+    compare_results_text.tag_configure("equivalent_filter", foreground="orange")
+
+# Look up the filters in the catalog membership index off the Tk thread, then show the results
+def compare_filters_with_catalog(new_filters):
+    compare_results_text.delete(1.0, tk.END)
+    if not new_filters:
+        messagebox.showinfo("Info", "Please enter filters to compare.")
+        return
+    set_status("Loading catalog membership index...")
+
+    def worker():
+        try:
+            results = list(iter_catalog_comparison(
+                data,
+                new_filters,
+                lambda done, total, title: root.after(0, set_status, f"Downloaded {done}/{total} lists: {title}"),
+            ))
+        except Exception as e:
+            root.after(0, show_task_error, "compare against the catalog", e)
+            return
+        root.after(0, show_catalog_comparison, results)
 
+    threading.Thread(target=worker, daemon=True).start()
 
-def add_new_filters(new_filters):
-    input_file_path = os.path.expanduser('~/Library/Application Support/BraveSoftware/Brave-Browser/Local State')
+# Show which lists already contain each compared filter, must run on the Tk thread
+def show_catalog_comparison(results):
+    set_status("")
+    compare_results_text.delete(1.0, tk.END)
+    duplicates = 0
+    for new_filter, sources in results:
+        if sources:
+            duplicates += 1
+            compare_results_text.insert(tk.END, f"{new_filter}    (in: {', '.join(sources)})\n", "duplicate_filter")
+        else:
+            compare_results_text.insert(tk.END, f"{new_filter}\n", "new_filter")
+    compare_results_text.insert(tk.END, f"\n{len(results) - duplicates} new, {duplicates} already in a list\n")
 
-    try:
-        with open(input_file_path, 'r') as file:
-            raw_content = file.read()
+    compare_results_text.tag_configure("new_filter", foreground="green")
+    compare_results_text.tag_configure("duplicate_filter", foreground="red")
+
+# Report the filters that have no effect of their own next to the active lists: the entered filters,
+# or Brave's custom filters when none are entered
+def analyze_custom_filters(filter_text_content):
+    rules = filter_text_content.strip().splitlines() or None
+    compare_results_text.delete(1.0, tk.END)
+    set_status("Analyzing filters against the active lists...")
+
+    def worker():
+        try:
+            results = list(iter_coverage_analysis(
+                data,
+                rules,
+                on_progress=lambda done, total, title: root.after(0, set_status, f"Downloaded {done}/{total} lists: {title}"),
+            ))
+        except Exception as e:
+            root.after(0, show_task_error, "analyze the filters", e)
+            return
+        root.after(0, show_coverage_analysis, results)
 
-        json_start_index = raw_content.find('{')
-        json_string = raw_content[json_start_index:]
-        data = json.loads(json_string)
+    threading.Thread(target=worker, daemon=True).start()
 
-        # Get existing custom filters
-        existing_custom_filters = data['brave']['ad_block'].get('custom_filters', '').strip().splitlines()
+# Show the redundant and shadowed filters found by the analysis, must run on the Tk thread
+def show_coverage_analysis(results):
+    set_status("")
+    compare_results_text.delete(1.0, tk.END)
+    shadowed = 0
+    for rule, status, covering_rule, source in results:
+        if status == "shadowed":
+            shadowed += 1
+            compare_results_text.insert(tk.END, f"{rule}    (undone by {covering_rule} in {source})\n", "equivalent_filter")
+        else:
+            compare_results_text.insert(tk.END, f"{rule}    (covered by {covering_rule} in {source})\n", "duplicate_filter")
+    compare_results_text.insert(tk.END, f"\n{len(results) - shadowed} redundant, {shadowed} shadowed by exceptions\n")
 
-        # Create a set for fast lookup of existing filters
-        existing_filter_set = set(existing_custom_filters)
+    compare_results_text.tag_configure("duplicate_filter", foreground="red")
+    compare_results_text.tag_configure("equivalent_filter", foreground="orange")
 
-        # Keep track of whether we have added any new filters
-        new_filters_added = False
+# Ask for a file and stream every rule matching the current search into it, without rendering the results
+def export_results_to_file():
+    filename = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=EXPORT_FILETYPES)
+    if not filename:
+        return
+    keyword, selected_uuids, custom_filters_enabled = get_search_query()
+    set_status("Exporting results...")
+
+    def worker():
+        try:
+            count = export_search_results(
+                filename,
+                data,
+                keyword,
+                selected_uuids,
+                custom_filters_enabled,
+                on_progress=lambda done, total, title: root.after(0, set_status, f"Downloaded {done}/{total} lists: {title}"),
+            )
+        except Exception as e:
+            root.after(0, show_task_error, "export the results", e)
+            return
+        root.after(0, set_status, f"Exported {count:,} rules to {filename}")
 
-        # Append new filters while avoiding duplicates
-        for new_filter in new_filters:
-            if new_filter and new_filter not in existing_filter_set:
-                existing_custom_filters.append(new_filter)
-                new_filters_added = True  # Mark that a new filter was added
+    threading.Thread(target=worker, daemon=True).start()
 
-        if not new_filters_added:
-            messagebox.showinfo("Info", "No new Filters to Add.")
+# Ask for a file and export the comparison of the entered filters into it, against the whole catalog
+# when that is ticked and against the shown results otherwise
+def export_comparison_to_file(new_filter_text):
+    new_filters = new_filter_text.strip().splitlines()
+    if not new_filters:
+        messagebox.showinfo("Info", "Please enter filters to compare.")
+        return
+    filename = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=EXPORT_FILETYPES)
+    if not filename:
+        return
+    compare_catalog = compare_catalog_var.get()
+    index = None if compare_catalog else get_current_filter_index()
+    set_status("Exporting comparison...")
+
+    def worker():
+        try:
+            if compare_catalog:
+                records = iter_catalog_comparison_records(
+                    data,
+                    new_filters,
+                    lambda done, total, title: root.after(0, set_status, f"Downloaded {done}/{total} lists: {title}"),
+                )
+                count = export_records(filename, records, CATALOG_COMPARISON_FIELDS)
+            else:
+                count = export_records(filename, iter_comparison_records(index, new_filters), COMPARISON_FIELDS)
+        except Exception as e:
+            root.after(0, show_task_error, "export the comparison", e)
             return
+        root.after(0, set_status, f"Exported {count:,} compared filters to {filename}")
+
+    threading.Thread(target=worker, daemon=True).start()
 
-        # Update the custom filters in the data
-        data['brave']['ad_block']['custom_filters'] = "\n".join(existing_custom_filters)
+# Report a background task that failed, such as a comparison or URL test, must run on the Tk thread
+def show_task_error(task, error):
+    set_status("")
+    messagebox.showerror("Error", f"Failed to {task}: {error}")
 
-        # Save the updated data back to the file
-        with open(input_file_path, 'w') as file:
-            file.write(json.dumps(data, indent=4))
+# Get the lookups over current_filters, rebuilt whenever new results are rendered
+def get_current_filter_index():
+    global current_filter_index
+    if current_filter_index is None or current_filter_index["filters"] is not current_filters:
+        current_filter_index = build_filter_index(current_filters)
+    return current_filter_index
 
-        messagebox.showinfo("Success", "New filters added successfully!")
 
+def add_new_filters(new_filters):
+    try:
+        added = add_custom_filters(new_filters, LOCAL_STATE_PATH)
+    except FileChangedError as e:
+        print(f"Error adding new filters: {e}")
+        messagebox.showerror("Error", "Local State was changed by Brave while adding the filters, nothing was written. Close Brave and try again.")
+        return
     except Exception as e:
         print(f"Error adding new filters: {e}")
         messagebox.showerror("Error", "Failed to add new filters.")
+        return
+
+    if not added:
+        messagebox.showinfo("Info", "No new Filters to Add.")
+        return
+    messagebox.showinfo("Success", f"{added:,} new filters added successfully!")
 
 
 def create_filter_comparison_frame(right_frame):
-    global filter_comparison_frame, filter_text, compare_results_text, filter_button
+    global filter_comparison_frame, filter_text, compare_results_text, filter_button, compare_catalog_var
 
     filter_comparison_frame = ttk.Frame(right_frame)
     filter_comparison_frame.grid(row=3, column=1, padx=10, pady=5, sticky="nsew")
@@ -258,10 +477,23 @@ def create_filter_comparison_frame(right_frame):
     filter_text = tk.Text(comparison_content_frame, height=20, width=50)
     filter_text.pack(padx=5, pady=5)
 
+    # Compare against every list in the catalog instead of the shown results
+    compare_catalog_var = tk.IntVar()
+    compare_catalog_checkbox = ttk.Checkbutton(comparison_content_frame, text="Compare with all catalog lists", variable=compare_catalog_var)
+    compare_catalog_checkbox.pack(pady=5)
+
     # Button to compare filters
     compare_button = ttk.Button(comparison_content_frame, text="Compare Filters", command=lambda: compare_filters(filter_text.get("1.0", tk.END)))
     compare_button.pack(pady=5)
 
+    # Button to find filters already covered by broader rules or undone by exceptions
+    analyze_button = ttk.Button(comparison_content_frame, text="Find Redundant Filters", command=lambda: analyze_custom_filters(filter_text.get("1.0", tk.END)))
+    analyze_button.pack(pady=5)
+
+    # Button to save the comparison of the entered filters to a file
+    export_comparison_button = ttk.Button(comparison_content_frame, text="Export Comparison...", command=lambda: export_comparison_to_file(filter_text.get("1.0", tk.END)))
+    export_comparison_button.pack(pady=5)
+
     # New results box for comparison results
     compare_results_text = tk.Text(comparison_content_frame, height=20, width=50, wrap=tk.WORD)
     compare_results_text.pack(padx=5, pady=5)
@@ -288,19 +520,11 @@ def toggle_filter_frame():
 
 # Function to handle checkbox state change
 def on_checkbox_change(*args):
-    update_results()
+    request_search(0)
 
 # Function to handle keyword entry change
 def on_keyword_change(*args):
-    update_results()
-
-# Function to clean up local files
-def cleanup_local_content():
-    if os.path.exists(LOCAL_CONTENT_DIR):
-        for filename in os.listdir(LOCAL_CONTENT_DIR):
-            file_path = os.path.join(LOCAL_CONTENT_DIR, filename)
-            os.remove(file_path)
-        os.rmdir(LOCAL_CONTENT_DIR)
+    request_search()
 
 def exit_program():
     cleanup_local_content()
@@ -311,24 +535,445 @@ def signal_handler(signal, frame):
     cleanup_local_content()
     sys.exit(0)
 
+# Get the check mark of a catalog row
+def get_check_mark(uuid):
+    return "\u2611" if uuid in checked_uuids else "\u2610"
+
+# Show the catalog lists whose title or uuid contains the filter text, a batch of rows at a time
+def populate_catalog_view(catalog):
+    global catalog_fill_id
+    if catalog_fill_id is not None:
+        root.after_cancel(catalog_fill_id)
+        catalog_fill_id = None
+    catalog_view.delete(*catalog_view.get_children())
+    text = catalog_filter_var.get().strip().lower()
+    items = [item for item in catalog if text in item.get('title', 'No Title').lower() or text in item['uuid'].lower()]
+    insert_catalog_rows(items, 0)
+
+# Insert a batch of catalog rows and schedule the next one
+def insert_catalog_rows(items, start):
+    global catalog_fill_id
+    for item in items[start:start + CATALOG_BATCH_SIZE]:
+        uuid = item['uuid']
+        if not catalog_view.exists(uuid):
+            title = item.get('title', 'No Title')  # Provide a default title if missing
+            catalog_view.insert("", tk.END, iid=uuid, text=get_check_mark(uuid), values=(title,))
+    if start + CATALOG_BATCH_SIZE < len(items):
+        catalog_fill_id = root.after_idle(insert_catalog_rows, items, start + CATALOG_BATCH_SIZE)
+    else:
+        catalog_fill_id = None
+
+# Show the lists of a new catalog, keeping the current selection. Returns True if a ticked list was removed.
+def update_catalog_view(catalog):
+    removed = checked_uuids - {item['uuid'] for item in catalog}
+    checked_uuids.difference_update(removed)
+    populate_catalog_view(catalog)
+    return bool(removed)
+
+# Tick exactly the given lists, only the rows whose state changes are updated
+def set_checked_lists(uuids):
+    changed = checked_uuids ^ uuids
+    checked_uuids.clear()
+    checked_uuids.update(uuids)
+    for uuid in changed:
+        if catalog_view.exists(uuid):
+            catalog_view.item(uuid, text=get_check_mark(uuid))
+
+# Flip the given lists and search once for all of them
+def toggle_lists(uuids):
+    set_checked_lists(checked_uuids ^ set(uuids))
+    request_search(0)
+
+# Toggle the list of the row whose check mark was clicked, other clicks are left to the Treeview to select rows
+def on_catalog_click(event):
+    if event.state & CLICK_MODIFIERS or catalog_view.identify_column(event.x) != "#0":
+        return
+    uuid = catalog_view.identify_row(event.y)
+    if uuid:
+        toggle_lists([uuid])
+
+# Toggle the selected rows with the space bar
+def on_catalog_space(event):
+    toggle_lists(catalog_view.selection())
+    return "break"
+
+# Refresh the catalog off the Tk thread and hand the result back to it
+def catalog_refresh_worker():
+    catalog = load_catalog(refresh=True)
+    try:
+        root.after(0, apply_catalog_update, catalog)
+    except (RuntimeError, tk.TclError):
+        pass  # The window has been closed
+
+# Patch the window with the refreshed catalog, must run on the Tk thread
+def apply_catalog_update(catalog):
+    global data
+    if catalog is None:
+        if not data:
+            messagebox.showerror("Error", "Failed to load data.")
+            exit_program()
+        return
+    if not data:
+        set_status("")
+    if catalog == data:
+        return
+
+    data = catalog
+    if update_catalog_view(catalog):
+        request_search(0)  # A selected list was removed from the catalog
+
+# Show or hide the timings panel
+def toggle_metrics_window():
+    if show_metrics_var.get():
+        open_metrics_window()
+    else:
+        close_metrics_window()
+
+# Open a window with the timings and counters of each phase, refreshed while it is open
+def open_metrics_window():
+    global metrics_window, metrics_text, profile_button
+    if metrics_window is not None:
+        return
+    metrics_window = tk.Toplevel(root)
+    metrics_window.title("Timings")
+    metrics_window.protocol("WM_DELETE_WINDOW", lambda: (show_metrics_var.set(0), close_metrics_window()))
+
+    button_frame = ttk.Frame(metrics_window, padding="5")
+    button_frame.pack(side=tk.TOP, fill=tk.X)
+    ttk.Button(button_frame, text="Export JSON...", command=export_metrics_to_file).pack(side=tk.LEFT, padx=5)
+    profile_button = ttk.Button(button_frame, text="Start Profiling", command=toggle_profiling)
+    profile_button.pack(side=tk.LEFT, padx=5)
+    ttk.Button(button_frame, text="Reset", command=lambda: (reset_metrics(), show_metrics())).pack(side=tk.LEFT, padx=5)
+
+    metrics_text = tk.Text(metrics_window, width=110, height=25, wrap=tk.NONE)
+    metrics_text.pack(fill=tk.BOTH, expand=True)
+    refresh_metrics_window()
+
+# Close the timings panel
+def close_metrics_window():
+    global metrics_window
+    if metrics_window is not None:
+        metrics_window.after_cancel(metrics_after_id)
+        metrics_window.destroy()
+        metrics_window = None
+
+# Show the current timings in the panel
+def show_metrics():
+    metrics_text.config(state=tk.NORMAL)
+    metrics_text.delete("1.0", tk.END)
+    metrics_text.insert(tk.END, "\n".join(format_metrics()))
+    metrics_text.config(state=tk.DISABLED)
+    profile_button.config(text="Stop and Save Profile..." if is_profiling() else "Start Profiling")
+
+# Show the current timings and check again after METRICS_REFRESH_MS
+def refresh_metrics_window():
+    global metrics_after_id
+    show_metrics()
+    metrics_after_id = metrics_window.after(METRICS_REFRESH_MS, refresh_metrics_window)
+
+# Ask for a file and save the timings to it as JSON
+def export_metrics_to_file():
+    filename = filedialog.asksaveasfilename(parent=metrics_window, defaultextension=".json", filetypes=[("JSON", "*.json")])
+    if not filename:
+        return
+    try:
+        export_metrics(filename)
+    except OSError as e:
+        messagebox.showerror("Error", f"Failed to export timings: {e}", parent=metrics_window)
+
+# Start profiling searches, or stop and save the profile as a cProfile dump
+def toggle_profiling():
+    if not is_profiling():
+        start_profiling()
+    else:
+        filename = filedialog.asksaveasfilename(parent=metrics_window, defaultextension=".prof", filetypes=[("cProfile dump", "*.prof")])
+        if filename:
+            try:
+                stop_profiling(filename)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save profile: {e}", parent=metrics_window)
+    show_metrics()
+
+# Shows result blocks in a tk.Text, inserting only the rows in the visible window
+class ResultView:
+    def __init__(self, parent, width, height):
+        self.blocks = []
+        self.starts = []  # Row number of the first row of each block
+        self.total = 0
+        self.first = 0  # Row number of the first visible row
+        self.page_size = height
+
+        self.text = tk.Text(parent, wrap=tk.NONE, width=width, height=height)
+        self.scrollbar = tk.Scrollbar(parent, orient="vertical", command=self.yview)
+        x_scrollbar = tk.Scrollbar(parent, orient="horizontal", command=self.text.xview)
+        self.text.configure(xscrollcommand=x_scrollbar.set)
+
+        x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # The text only ever holds one page, so scrolling moves the window over the rows instead
+        self.text.bind("<Configure>", self.on_configure)
+        self.text.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1, "wheel"))
+        self.text.bind("<Button-4>", lambda event: self.scroll(-1, "wheel"))
+        self.text.bind("<Button-5>", lambda event: self.scroll(1, "wheel"))
+        self.text.bind("<Prior>", lambda event: self.scroll(-1, "pages"))
+        self.text.bind("<Next>", lambda event: self.scroll(1, "pages"))
+
+    # Replace the shown rows with new blocks of (lines, tag)
+    def set_blocks(self, blocks):
+        self.blocks = [(lines, tag) for lines, tag in blocks if lines]
+        self.starts = []
+        self.total = 0
+        for lines, _ in self.blocks:
+            self.starts.append(self.total)
+            self.total += len(lines)
+        self.first = 0
+        self.render()
+
+    # Yield the (line, tag) rows from row number start up to stop
+    def iter_rows(self, start, stop):
+        index = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        while start < stop and index < len(self.blocks):
+            lines, tag = self.blocks[index]
+            offset = start - self.starts[index]
+            for line in lines[offset:offset + stop - start]:
+                yield line, tag
+            start = self.starts[index] + len(lines)
+            index += 1
+
+    # Insert the rows of the visible window and update the scrollbar
+    def render(self):
+        self.text.delete(1.0, tk.END)
+        for line, tag in self.iter_rows(self.first, self.first + self.page_size):
+            self.text.insert(tk.END, line + "\n", tag or ())
+        if self.total:
+            self.scrollbar.set(self.first / self.total, min((self.first + self.page_size) / self.total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    # Move the visible window so it starts at the given row
+    def move_to(self, first):
+        first = max(0, min(first, self.total - self.page_size))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    # Scroll by units, pages or mouse wheel steps
+    def scroll(self, count, what):
+        step = {"units": 1, "wheel": 3, "pages": self.page_size}.get(what, 1)
+        self.move_to(self.first + count * step)
+        return "break"
+
+    # Handle the scrollbar, which calls this like the yview of a tk.Text
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.move_to(int(float(args[1]) * self.total))
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]), args[2])
+
+    # Fit the page to the height of the text widget
+    def on_configure(self, event):
+        line_height = tkfont.Font(font=self.text.cget("font")).metrics("linespace")
+        page_size = max(1, event.height // max(line_height, 1))
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.first = max(0, min(self.first, self.total - page_size))
+            self.render()
+
+# Open a window to test which rules of the selected lists block or allow URLs
+def open_url_tester():
+    global url_tester_window, url_text, page_url_var, request_type_var, url_results_text
+    if url_tester_window is not None:
+        url_tester_window.lift()
+        return
+    url_tester_window = tk.Toplevel(root)
+    url_tester_window.title("Test URLs")
+    url_tester_window.protocol("WM_DELETE_WINDOW", close_url_tester)
+
+    ttk.Label(url_tester_window, text="URLs, one per line:").pack(side=tk.TOP, anchor="w", padx=5)
+    url_text = tk.Text(url_tester_window, width=100, height=5)
+    url_text.pack(side=tk.TOP, fill=tk.X, padx=5)
+
+    option_frame = ttk.Frame(url_tester_window, padding="5")
+    option_frame.pack(side=tk.TOP, fill=tk.X)
+    ttk.Label(option_frame, text="Page URL:").pack(side=tk.LEFT)
+    page_url_var = tk.StringVar()
+    ttk.Entry(option_frame, textvariable=page_url_var, width=40).pack(side=tk.LEFT, padx=5)
+    ttk.Label(option_frame, text="Type:").pack(side=tk.LEFT)
+    request_type_var = tk.StringVar()
+    ttk.Combobox(option_frame, textvariable=request_type_var, values=[""] + REQUEST_TYPES, state="readonly", width=15).pack(side=tk.LEFT, padx=5)
+    ttk.Button(option_frame, text="Test", command=lambda: test_urls(url_text.get("1.0", tk.END).split())).pack(side=tk.LEFT, padx=5)
+    ttk.Button(option_frame, text="Load File...", command=load_url_file).pack(side=tk.LEFT, padx=5)
+
+    url_results_text = tk.Text(url_tester_window, width=100, height=20, wrap=tk.NONE)
+    url_results_text.pack(fill=tk.BOTH, expand=True)
+    url_results_text.tag_configure("blocked", foreground="red")
+    url_results_text.tag_configure("allowed", foreground="green")
+
+# Close the URL tester window
+def close_url_tester():
+    global url_tester_window
+    url_tester_window.destroy()
+    url_tester_window = None
+
+# Ask for a file with one URL per line and test all of them
+def load_url_file():
+    filename = filedialog.askopenfilename(parent=url_tester_window, filetypes=[("Text", "*.txt"), ("All files", "*")])
+    if not filename:
+        return
+    try:
+        with open(filename, 'r', encoding='utf-8') as file:
+            urls = file.read().split()
+    except (OSError, UnicodeDecodeError) as e:
+        messagebox.showerror("Error", f"Failed to read URLs: {e}", parent=url_tester_window)
+        return
+    url_text.delete("1.0", tk.END)
+    url_text.insert(tk.END, "\n".join(urls))
+    test_urls(urls)
+
+# Match URLs against the selected lists off the Tk thread, then show the matching rules
+def test_urls(urls):
+    _, selected_uuids, custom_filters_enabled = get_search_query()
+    if not urls:
+        messagebox.showinfo("Info", "Please enter URLs to test.", parent=url_tester_window)
+        return
+    if not selected_uuids and not custom_filters_enabled:
+        messagebox.showinfo("Info", "Please select the lists to test against.", parent=url_tester_window)
+        return
+    url_results_text.delete("1.0", tk.END)
+    set_status("Loading URL matcher...")
+    page_url = page_url_var.get().strip() or None
+    request_type = request_type_var.get() or None
+
+    def worker():
+        try:
+            results = list(iter_url_matches(
+                data,
+                urls,
+                selected_uuids,
+                custom_filters_enabled,
+                page_url,
+                request_type,
+                lambda done, total, title: root.after(0, set_status, f"Downloaded {done}/{total} lists: {title}"),
+            ))
+        except Exception as e:
+            root.after(0, show_task_error, "test the URLs", e)
+            return
+        root.after(0, show_url_matches, results)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+# Show whether each URL is blocked and the rules matching it, must run on the Tk thread
+def show_url_matches(results):
+    set_status("")
+    if url_tester_window is None:
+        return
+    url_results_text.delete("1.0", tk.END)
+    blocked_count = 0
+    for url, blocked, matches in results:
+        blocked_count += blocked
+        if blocked:
+            url_results_text.insert(tk.END, f"BLOCKED  {url}\n", "blocked")
+        elif matches:
+            url_results_text.insert(tk.END, f"ALLOWED  {url}\n", "allowed")
+        else:
+            url_results_text.insert(tk.END, f"no match {url}\n")
+        for rule, kind, source in matches:
+            url_results_text.insert(tk.END, f"    {rule}    ({source})\n", "blocked" if kind == "network" else "allowed")
+    url_results_text.insert(tk.END, f"\n{blocked_count:,} of {len(results):,} URLs blocked\n")
+
+# Open a window showing the rules added and removed by the last change of each selected list
+def open_changes_window():
+    global changes_window, changes_text
+    if changes_window is not None:
+        changes_window.lift()
+    else:
+        changes_window = tk.Toplevel(root)
+        changes_window.title("Changes Since Last Sync")
+        changes_window.protocol("WM_DELETE_WINDOW", close_changes_window)
+
+        button_frame = ttk.Frame(changes_window, padding="5")
+        button_frame.pack(side=tk.TOP, fill=tk.X)
+        ttk.Button(button_frame, text="Refresh Now", command=lambda: fetch_list_changes(refresh=True)).pack(side=tk.LEFT, padx=5)
+
+        changes_text = tk.Text(changes_window, width=100, height=30, wrap=tk.NONE)
+        changes_text.pack(fill=tk.BOTH, expand=True)
+        changes_text.tag_configure("list_title", foreground="orange")
+        changes_text.tag_configure("added", foreground="green")
+        changes_text.tag_configure("removed", foreground="red")
+    fetch_list_changes()
+
+# Close the changes window
+def close_changes_window():
+    global changes_window
+    changes_window.destroy()
+    changes_window = None
+
+# Load the changes of the selected lists off the Tk thread, checking every list upstream first when refresh is set
+def fetch_list_changes(refresh=False):
+    _, selected_uuids, _ = get_search_query()
+    changes_text.delete("1.0", tk.END)
+    if not selected_uuids:
+        changes_text.insert(tk.END, "Select lists to see their changes.\n")
+        return
+    set_status("Checking lists for new versions..." if refresh else "Loading list changes...")
+
+    def worker():
+        try:
+            results = list(iter_list_changes(
+                data,
+                selected_uuids,
+                refresh,
+                lambda done, total, title: root.after(0, set_status, f"Checked {done}/{total} lists: {title}"),
+            ))
+        except Exception as e:
+            root.after(0, show_task_error, "load the list changes", e)
+            return
+        root.after(0, show_list_changes, results)
+        if refresh:
+            root.after(0, request_search, 0)  # Search the new versions
+
+    threading.Thread(target=worker, daemon=True).start()
+
+# Format a time stamp for the changes window
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp)) if timestamp else "never"
+
+# Show the changes of each list, must run on the Tk thread
+def show_list_changes(results):
+    set_status("")
+    if changes_window is None:
+        return
+    changes_text.delete("1.0", tk.END)
+    for list_title, source_title, url, changes in results:
+        changes_text.insert(tk.END, f"{list_title} ({source_title})\n", "list_title")
+        if changes["synced_at"] is None:
+            changes_text.insert(tk.END, f"    No changes since it was downloaded, checked {format_time(changes['checked_at'])}\n\n")
+            continue
+        changes_text.insert(
+            tk.END,
+            f"    +{len(changes['added']):,} -{len(changes['removed']):,} since {format_time(changes['previous_synced_at'])}, "
+            f"changed {format_time(changes['synced_at'])}, checked {format_time(changes['checked_at'])}\n",
+        )
+        for sign, tag in (("+", "added"), ("-", "removed")):
+            rules = changes[tag]
+            for rule in rules[:CHANGES_SHOWN_LINES]:
+                changes_text.insert(tk.END, f"    {sign} {rule}\n", tag)
+            if len(rules) > CHANGES_SHOWN_LINES:
+                changes_text.insert(tk.END, f"    ... {len(rules) - CHANGES_SHOWN_LINES:,} more {tag}\n", tag)
+        changes_text.insert(tk.END, "\n")
+
 def build_gui():
-    global check_vars, keyword_var, result_text, data, root, custom_filters_var, current_filters, active_filters_var, custom_filters_var
+    global catalog_view, catalog_filter_var, keyword_var, result_view, hit_count_var, data, root, custom_filters_var, current_filters, active_filters_var, custom_filters_var, status_var, show_metrics_var
     root = tk.Tk()
     root.title("Filter Search App")
 
     # Create local content directory if it doesn't exist
-    if not os.path.exists(LOCAL_CONTENT_DIR):
-        os.makedirs(LOCAL_CONTENT_DIR)
-
-    # Fetch JSON data from URL
-    url = "https://raw.githubusercontent.com/brave/adblock-resources/master/filter_lists/list_catalog.json"
-    global data
-    data = fetch_json_data(url)
+    init_local_content()
 
-    if not data:
-        messagebox.showerror("Error", "Failed to load data.")
-        root.destroy()
-        return
+    # Start from the cached catalog, it is refreshed in the background once the window is up
+    data = load_cached_catalog() or []
 
     # Create a frame for the checkboxes and result area
     left_frame = ttk.Frame(root, padding="10")
@@ -354,33 +999,36 @@ def build_gui():
     custom_filters_checkbox = ttk.Checkbutton(active_filters_frame, text="My Custom Filters", variable=custom_filters_var, command=on_checkbox_change)
     custom_filters_checkbox.grid(row=0, column=1, padx=10, pady=5, sticky="w")
 
-    # Create canvas and scrollbar for checkboxes
-    canvas = tk.Canvas(left_frame)
-    scrollbar = tk.Scrollbar(left_frame, orient="vertical", command=canvas.yview)
-    checkbox_frame = ttk.Frame(canvas)
-
-    # Add a window to the canvas for the checkbox frame
-    canvas.create_window((0, 0), window=checkbox_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-
-    canvas.pack(side="left", fill="both", expand=True)
+    # Optional panel with timings of downloads, searches and rendering
+    show_metrics_var = tk.IntVar()
+    show_metrics_checkbox = ttk.Checkbutton(active_filters_frame, text="Show Timings", variable=show_metrics_var, command=toggle_metrics_window)
+    show_metrics_checkbox.grid(row=0, column=2, padx=10, pady=5, sticky="w")
+
+    # Window to check which rules block or allow given URLs
+    url_tester_button = ttk.Button(active_filters_frame, text="Test URLs...", command=open_url_tester)
+    url_tester_button.grid(row=0, column=3, padx=10, pady=5, sticky="w")
+
+    # Window with what changed upstream in the selected lists, and a way to check for new versions
+    changes_button = ttk.Button(active_filters_frame, text="List Changes...", command=open_changes_window)
+    changes_button.grid(row=0, column=4, padx=10, pady=5, sticky="w")
+
+    # Entry narrowing the catalog panel to matching lists
+    catalog_filter_var = tk.StringVar()
+    catalog_filter_var.trace_add("write", lambda *args: populate_catalog_view(data))
+    ttk.Entry(left_frame, textvariable=catalog_filter_var).pack(side="top", fill="x", pady=(0, 5))
+
+    # List view of the catalog, it only draws the rows that are visible
+    catalog_view = ttk.Treeview(left_frame, columns=("title",), show="tree", selectmode="extended")
+    catalog_view.column("#0", width=30, stretch=False)
+    catalog_view.column("title", width=250)
+    scrollbar = ttk.Scrollbar(left_frame, orient="vertical", command=catalog_view.yview)
+    catalog_view.configure(yscrollcommand=scrollbar.set)
+    catalog_view.bind("<Button-1>", on_catalog_click)
+    catalog_view.bind("<space>", on_catalog_space)
+
+    catalog_view.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
-
-    # Add checkboxes to the checkbox frame
-    check_vars = {}
-    for item in data:
-        uuid = item['uuid']
-        title = item.get('title', 'No Title')  # Provide a default title if missing
-        var = tk.IntVar()
-        check_vars[uuid] = var
-        cb = ttk.Checkbutton(checkbox_frame, text=title, variable=var, command=on_checkbox_change)
-        cb.pack(anchor="w", padx=5, pady=2)
-
-    # Update the scroll region of the canvas when the frame is resized
-    def on_frame_configure(event):
-        canvas.configure(scrollregion=canvas.bbox("all"))
-
-    checkbox_frame.bind("<Configure>", on_frame_configure)
+    populate_catalog_view(data)
 
     # Entry for keyword
     ttk.Label(right_frame, text="Keyword:").grid(row=1, column=0, padx=10, pady=5, sticky="w")
@@ -393,21 +1041,33 @@ def build_gui():
     result_frame = ttk.Frame(right_frame)
     result_frame.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
 
-    # Create the text widget for results
-    result_text = tk.Text(result_frame, wrap=tk.WORD, width=80, height=20)
-    result_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    # Create the view for results, it only renders the rows that are visible
+    result_view = ResultView(result_frame, width=80, height=20)
 
-    # Create and place the scrollbar
-    result_scrollbar = tk.Scrollbar(result_frame, orient="vertical", command=result_text.yview)
-    result_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    # Total number of matches, shown at once however many rows there are
+    hit_count_var = tk.StringVar()
+    ttk.Label(right_frame, textvariable=hit_count_var).grid(row=1, column=0, padx=10, pady=5, sticky="e")
 
-    # Link the scrollbar with the text widget
-    result_text.configure(yscrollcommand=result_scrollbar.set)
+    # Status line for download progress
+    status_var = tk.StringVar()
+    ttk.Label(right_frame, textvariable=status_var).grid(row=4, column=0, padx=10, pady=5, sticky="w")
+
+    # Save every match of the current search to a file, however many there are
+    export_button = ttk.Button(right_frame, text="Export Results...", command=export_results_to_file)
+    export_button.grid(row=4, column=0, padx=10, pady=5, sticky="e")
+
+    # Follow the lists and custom filters Brave changes while the window is open
+    start_local_state_watcher(lambda changes: root.after(0, apply_local_state_changes, changes))
+
+    # Refresh the catalog without holding up the window
+    if not data:
+        set_status("Loading filter list catalog...")
+    threading.Thread(target=catalog_refresh_worker, daemon=True).start()
 
-    # Configure tags for result_text
-    result_text.tag_configure("url", foreground="blue")
-    result_text.tag_configure("uuid_title", foreground="yellow")
-    result_text.tag_configure("list_title", foreground="orange")
+    # Configure tags for the result view
+    result_view.text.tag_configure("url", foreground="blue")
+    result_view.text.tag_configure("uuid_title", foreground="yellow")
+    result_view.text.tag_configure("list_title", foreground="orange")
 
     # Adjust grid weights to make sure the widgets expand properly
     root.grid_rowconfigure(0, weight=1)  # Main row
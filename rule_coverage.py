@@ -0,0 +1,207 @@
+import re
+
+from filter_rules import parse_options, parse_rule, resolve_option_name
+
+# Options that restrict a rule to some request types, a rule without any applies to all types
+TYPE_OPTIONS = {
+    "script", "image", "stylesheet", "object", "xmlhttprequest", "subdocument", "ping", "websocket",
+    "webrtc", "font", "media", "other", "object-subrequest", "popup", "document",
+}
+
+# Options that only narrow which requests a rule applies to, any other option changes what a rule does
+# (redirect=, csp=, removeparam=, badfilter, ...) and keeps it out of the analysis
+RESTRICTION_OPTIONS = TYPE_OPTIONS | {"third-party", "domain", "match-case", "important"}
+
+# A host-anchored rule without a path, e.g. ||example.com^ or @@||example.com^$script,
+# the only rules that can cover others. Matched directly so most list lines need no full parse.
+HOST_RULE = re.compile(r"(@@)?\|\|([a-z0-9.-]+)(?:\^\|?|\|)?(?:\$(.*))?$", re.IGNORECASE)
+
+
+# Reverse-domain trie of host-anchored rules. The rules for a host and all of its parent domains
+# are found by walking the labels of the host from the top-level domain down.
+class DomainTrie:
+    __slots__ = ("root", "size")
+
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    # Store a value for a hostname
+    def add(self, hostname, value):
+        node = self.root
+        for label in reversed(hostname.split(".")):
+            child = node.get(label)
+            if child is None:
+                child = node[label] = {}
+            node = child
+        values = node.get(None)  # None never clashes with a label
+        if values is None:
+            node[None] = [value]
+        else:
+            values.append(value)
+        self.size += 1
+
+    # Yield the values stored for a hostname and its parent domains, broadest domain first
+    def iter_matches(self, hostname):
+        node = self.root
+        for label in reversed(hostname.split(".")):
+            node = node.get(label)
+            if node is None:
+                return
+            yield from node.get(None, ())
+
+
+# Check whether a domain is one of the domains or a subdomain of one of them
+def is_within_domains(domain, domains):
+    return any(domain == parent or domain.endswith("." + parent) for parent in domains)
+
+
+# Get what a network rule applies to as a dict, or None if the rule is not a plain host-anchored
+# network rule whose options can be compared
+def get_rule_conditions(rule):
+    if rule is None or rule.kind not in ("network", "exception") or not rule.hostname:
+        return None
+    # A wildcard inside the host part, e.g. ||ads*.example.com^, does not name a single host, and neither does
+    # a host without a ^ or | after it: ||example.com also matches example.community
+    rest = rule.pattern[2 + len(rule.hostname):]
+    if not rest or rest.startswith("*") or rest.startswith(":"):
+        return None
+
+    conditions = get_option_conditions(rule.options)
+    if conditions is not None:
+        conditions["host_only"] = rest in ("^", "^|", "|")  # No path, so every request to the host matches
+    return conditions
+
+
+# Get what the options of a network rule restrict it to as a dict, or None if an option changes what the rule does
+def get_option_conditions(options):
+    conditions = {
+        "host_only": False,
+        "types": set(),
+        "not_types": set(),
+        "party": None,
+        "domains": set(),
+        "not_domains": set(),
+        "important": False,
+        "match_case": False,
+    }
+    for name, value in options:
+        name = resolve_option_name(name)
+        negated = name.startswith("~")
+        name = name.lstrip("~")
+        if name not in RESTRICTION_OPTIONS:
+            return None
+        if name in TYPE_OPTIONS:
+            conditions["not_types" if negated else "types"].add(name)
+        elif name == "third-party":
+            conditions["party"] = "first" if negated else "third"
+        elif name == "domain":
+            # Read the value rather than rule.domains, so aliases such as from= count too
+            for domain in (value or "").lower().split("|"):
+                domain = domain.strip()
+                if not domain:
+                    continue
+                if domain.startswith("~"):
+                    conditions["not_domains"].add(domain[1:])
+                else:
+                    conditions["domains"].add(domain)
+        elif name == "important":
+            conditions["important"] = True
+        else:
+            conditions["match_case"] = True
+    return conditions
+
+
+# Check whether every request the narrow rule applies to is also matched by the broad rule.
+# The broad rule's host must already be the narrow rule's host or a parent domain of it.
+def covers(broad, narrow):
+    if not broad["host_only"] or broad["match_case"]:
+        return False
+    # An important rule also wins over exceptions, a plain one cannot stand in for it
+    if narrow["important"] and not broad["important"]:
+        return False
+
+    if broad["types"] or broad["not_types"]:
+        if not narrow["types"] or narrow["not_types"]:
+            return False
+        if broad["types"] and not narrow["types"] <= broad["types"]:
+            return False
+        if narrow["types"] & broad["not_types"]:
+            return False
+
+    if broad["party"] is not None and narrow["party"] != broad["party"]:
+        return False
+
+    if broad["domains"]:
+        if not narrow["domains"] or not all(is_within_domains(domain, broad["domains"]) for domain in narrow["domains"]):
+            return False
+    if broad["not_domains"]:
+        # The narrow rule must stay off every domain the broad rule excludes
+        if narrow["domains"]:
+            if any(is_within_domains(domain, broad["not_domains"]) for domain in narrow["domains"]):
+                return False
+        elif not all(is_within_domains(domain, narrow["not_domains"]) for domain in broad["not_domains"]):
+            return False
+    return True
+
+
+# Build a coverage index from (source, lines) pairs: one trie of host-anchored blocking rules
+# and one of exception rules, each entry keeping its rule, conditions and source number
+def build_coverage_index(sources):
+    index = {"sources": [], "block": DomainTrie(), "allow": DomainTrie()}
+    # Lists repeat the same few option strings, rules sharing one share its conditions too
+    no_options = get_option_conditions(())
+    no_options["host_only"] = True
+    option_conditions = {None: no_options}
+    for source_number, (source, lines) in enumerate(sources):
+        index["sources"].append(source)
+        for line in lines:
+            line = line.strip()
+            match = HOST_RULE.match(line)
+            # A rule without a ^ or | after its host, e.g. ||example.com, also matches other hosts
+            if match is None or match.end(2) == len(line) or line[match.end(2)] == "$":
+                continue
+            exception, hostname, options = match.groups()
+            if options not in option_conditions:
+                conditions = get_option_conditions(parse_options(options))
+                if conditions is not None:
+                    conditions["host_only"] = True
+                option_conditions[options] = conditions
+            conditions = option_conditions[options]
+            if conditions is None:
+                continue
+            trie = index["allow"] if exception else index["block"]
+            trie.add(hostname.lower(), (match.group(), conditions, source_number))
+    return index
+
+
+# Find why a rule has no effect of its own. Returns ("redundant", broader rule, source) when a broader rule
+# of the same kind already matches everything it does, ("shadowed", exception, source) when a blocking rule
+# is always undone by an exception, or (None, None, None). Entries of skip_source equal to the rule are ignored,
+# so a rule is not reported as covering itself.
+def find_covering_rule(index, line, skip_source=None):
+    line = line.strip()
+    rule = parse_rule(line)
+    conditions = get_rule_conditions(rule)
+    if conditions is None:
+        return None, None, None
+
+    def find_in(trie):
+        for broad_line, broad_conditions, source_number in trie.iter_matches(rule.hostname):
+            if broad_line == line and source_number == skip_source:
+                continue
+            if covers(broad_conditions, conditions):
+                return broad_line, index["sources"][source_number]
+        return None
+
+    if rule.kind == "exception":
+        found = find_in(index["allow"])
+        return ("redundant",) + found if found else (None, None, None)
+
+    found = find_in(index["allow"])
+    if found:
+        return ("shadowed",) + found
+    found = find_in(index["block"])
+    if found:
+        return ("redundant",) + found
+    return None, None, None
@@ -0,0 +1,181 @@
+import bisect
+import hashlib
+import json
+import os
+import sys
+from array import array
+
+from filter_rules import canonicalize_rule
+
+# Membership index files start with this marker, followed by the header length and a JSON header
+MEMBERSHIP_INDEX_MAGIC = b"BFSMEMBER3\n"
+
+
+# Hash the canonical form of a rule into a 64-bit integer
+def hash_rule(rule):
+    return int.from_bytes(hashlib.blake2b(canonicalize_rule(rule).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# Get the lines of a list that count as its rules: not blank and not comments, each distinct line once
+def get_rule_lines(lines):
+    rule_lines = set()
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("!"):
+            rule_lines.add(line)
+    return rule_lines
+
+
+# Build a membership index from (source, lines) pairs, where source is any JSON-serialisable description.
+# Every distinct rule of a source adds one entry to three parallel arrays sorted by hash, the last one
+# counting the distinct lines of the source with that canonical form, so removing one of them can be undone exactly.
+def build_membership_index(sources):
+    source_list = []
+    entries = []
+    for source_number, (source, lines) in enumerate(sources):
+        source_list.append(source)
+        counts = {}
+        for line in get_rule_lines(lines):
+            rule_hash = hash_rule(line)
+            counts[rule_hash] = counts.get(rule_hash, 0) + 1
+        # Pack hash and source number into one int, so a single sort orders both
+        entries.extend(((rule_hash << 16) | source_number, count) for rule_hash, count in counts.items())
+    entries.sort()
+
+    hashes = array("Q", (entry >> 16 for entry, _ in entries))
+    source_numbers = array("H", (entry & 0xFFFF for entry, _ in entries))
+    counts = array("I", (count for _, count in entries))
+    return {"sources": source_list, "hashes": hashes, "source_numbers": source_numbers, "counts": counts}
+
+
+# Find where the entry of a rule hash and source number is, or would be inserted, and whether it exists
+def find_entry(index, rule_hash, source_number):
+    hashes = index["hashes"]
+    source_numbers = index["source_numbers"]
+    position = bisect.bisect_left(hashes, rule_hash)
+    while position < len(hashes) and hashes[position] == rule_hash and source_numbers[position] < source_number:
+        position += 1
+    found = position < len(hashes) and hashes[position] == rule_hash and source_numbers[position] == source_number
+    return position, found
+
+
+# Get a copy of a membership index with the lines added to and removed from one source applied,
+# instead of building it again from every source. The lines are the distinct rule lines that changed.
+def update_membership_index(index, source_number, added_lines, removed_lines):
+    changes = {}
+    for line in removed_lines:
+        rule_hash = hash_rule(line)
+        changes[rule_hash] = changes.get(rule_hash, 0) - 1
+    for line in added_lines:
+        rule_hash = hash_rule(line)
+        changes[rule_hash] = changes.get(rule_hash, 0) + 1
+
+    counts = array("I", index["counts"])
+    edits = []  # (position, count or None to delete the entry there, hash to insert or None)
+    for rule_hash, change in changes.items():
+        if change == 0:
+            continue
+        position, found = find_entry(index, rule_hash, source_number)
+        if found:
+            count = counts[position] + change
+            if count > 0:
+                counts[position] = count
+            else:
+                edits.append((position, None, None))
+        elif change > 0:
+            edits.append((position, change, rule_hash))
+        # A rule removed from a source the index does not have it for leaves nothing to update
+
+    if not edits:
+        return dict(index, counts=counts)
+
+    # Copy the unchanged runs between the edited positions in one go
+    edits.sort(key=lambda edit: (edit[0], edit[2] is None, edit[2] or 0))
+    hashes = array("Q")
+    source_numbers = array("H")
+    new_counts = array("I")
+    start = 0
+    for position, count, rule_hash in edits:
+        hashes.extend(index["hashes"][start:position])
+        source_numbers.extend(index["source_numbers"][start:position])
+        new_counts.extend(counts[start:position])
+        if rule_hash is None:
+            start = position + 1
+        else:
+            hashes.append(rule_hash)
+            source_numbers.append(source_number)
+            new_counts.append(count)
+            start = position
+    hashes.extend(index["hashes"][start:])
+    source_numbers.extend(index["source_numbers"][start:])
+    new_counts.extend(counts[start:])
+    return {"sources": index["sources"], "hashes": hashes, "source_numbers": source_numbers, "counts": new_counts}
+
+
+# Save a membership index, with extra JSON metadata used to tell whether it is still current
+def save_membership_index(index, filename, metadata=None):
+    header = json.dumps({
+        "byteorder": sys.byteorder,
+        "count": len(index["hashes"]),
+        "sources": index["sources"],
+        "metadata": metadata or {},
+    }).encode("utf-8")
+    temp_filename = filename + ".part"
+    with open(temp_filename, "wb") as file:
+        file.write(MEMBERSHIP_INDEX_MAGIC)
+        file.write(len(header).to_bytes(8, "little"))
+        file.write(header)
+        file.write(index["hashes"].tobytes())
+        file.write(index["source_numbers"].tobytes())
+        file.write(index["counts"].tobytes())
+    os.replace(temp_filename, filename)
+
+
+# Load a membership index and its metadata, or (None, None) if there is no valid index file.
+# A file that cannot be read, or whose header or arrays are cut short or corrupt, counts as missing.
+def load_membership_index(filename):
+    try:
+        with open(filename, "rb") as file:
+            raw = file.read()
+    except OSError:
+        return None, None
+    if not raw.startswith(MEMBERSHIP_INDEX_MAGIC):
+        return None, None
+
+    start = len(MEMBERSHIP_INDEX_MAGIC)
+    header_length = int.from_bytes(raw[start:start + 8], "little")
+    try:
+        header = json.loads(raw[start + 8:start + 8 + header_length])
+        byteorder, count, sources, metadata = header["byteorder"], header["count"], header["sources"], header["metadata"]
+    except (ValueError, KeyError, TypeError):
+        return None, None
+    if byteorder != sys.byteorder or not isinstance(count, int) or not isinstance(sources, list) or not isinstance(metadata, dict):
+        return None, None
+
+    offset = start + 8 + header_length
+    hashes = array("Q")
+    source_numbers = array("H")
+    counts = array("I")
+    if len(raw) != offset + count * (hashes.itemsize + source_numbers.itemsize + counts.itemsize):
+        return None, None
+    hashes.frombytes(raw[offset:offset + count * hashes.itemsize])
+    offset += count * hashes.itemsize
+    source_numbers.frombytes(raw[offset:offset + count * source_numbers.itemsize])
+    offset += count * source_numbers.itemsize
+    counts.frombytes(raw[offset:offset + count * counts.itemsize])
+    if any(source_number >= len(sources) for source_number in set(source_numbers)):
+        return None, None
+    index = {"sources": sources, "hashes": hashes, "source_numbers": source_numbers, "counts": counts}
+    return index, metadata
+
+
+# Get the sources containing a rule, or an empty list if no source has it
+def find_rule_sources(index, rule):
+    hashes = index["hashes"]
+    rule_hash = hash_rule(rule)
+    position = bisect.bisect_left(hashes, rule_hash)
+    sources = []
+    while position < len(hashes) and hashes[position] == rule_hash:
+        sources.append(index["sources"][index["source_numbers"][position]])
+        position += 1
+    return sources
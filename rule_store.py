@@ -0,0 +1,203 @@
+import bisect
+import re
+from array import array
+from collections import Counter
+from itertools import accumulate, combinations, compress, count, repeat
+from operator import add, not_
+
+from filter_query import iter_buffer_matches
+
+
+# Get the bytes of the line starting at an offset of a buffer of newline-terminated lines
+def get_line(text, start):
+    return bytes(text[start:text.index(b"\n", start)])
+
+
+# Rules of several lists stored once each. Every distinct line is interned by the hash of its bytes and gets
+# a rule id, its bytes are kept once in one buffer, and each list is an array of the ids of its lines in order,
+# so the rule id of line n of a list is ids[n].
+class RuleStore:
+    __slots__ = ("text", "offsets", "hashes", "hash_ids", "collisions", "non_rules", "non_ascii", "lists")
+
+    def __init__(self):
+        self.text = bytearray()  # Every distinct line followed by a newline, in rule id order
+        self.offsets = array("Q")  # Where the line of each rule id starts in text
+        # Sorted built-in hashes of the lines, hash_ids holds the rule id of each. The store only lives in memory,
+        # so the hash seed of each process does not matter.
+        self.hashes = array("q")
+        self.hash_ids = array("I")
+        self.collisions = {}  # line -> rule id of the rare lines whose hash was already filed under another line
+        self.non_rules = set()  # Ids of the blank and comment lines, which are stored but are no rules
+        self.non_ascii = set()  # Ids of the lines with other than ASCII characters, whose case bytes regexes do not fold
+        self.lists = {}  # key -> (version, array of rule ids)
+
+    # Number of distinct rules stored, including those no list refers to any more
+    def __len__(self):
+        return len(self.offsets)
+
+    # Get the text of a rule
+    def get_rule(self, rule_id):
+        return get_line(self.text, self.offsets[rule_id]).decode("utf-8", errors="replace")
+
+    # Get the rule ids of lines given as bytes without line endings, storing the lines not seen before.
+    # Lines are looked up with whole-list map() passes rather than one at a time. A line only gets the rule id
+    # its hash is filed under when the stored bytes are the same, so lines whose hashes collide stay apart.
+    def intern(self, lines):
+        lines = list(lines)
+        hashes = self.hashes
+        if hashes:
+            positions = map(min, map(bisect.bisect_left, repeat(hashes), map(hash, lines)), repeat(len(hashes) - 1))
+            ids = array("I", map(self.hash_ids.__getitem__, positions))
+            stored = map(self.text.startswith, map(add, lines, repeat(b"\n")), map(self.offsets.__getitem__, ids))
+            new_indexes = list(compress(range(len(lines)), map(not_, stored)))
+        else:
+            ids = array("I", bytes(4 * len(lines)))
+            new_indexes = range(len(lines))
+        if self.collisions and new_indexes:
+            remaining = []
+            for index in new_indexes:
+                rule_id = self.collisions.get(lines[index])
+                if rule_id is None:
+                    remaining.append(index)
+                else:
+                    ids[index] = rule_id
+            new_indexes = remaining
+        if not new_indexes:
+            return ids
+
+        # The first occurrence of each new line gets the next free rule id
+        added = dict(zip(dict.fromkeys(map(lines.__getitem__, new_indexes)), count(len(self.offsets))))
+        for index, rule_id in zip(new_indexes, map(added.__getitem__, map(lines.__getitem__, new_indexes))):
+            ids[index] = rule_id
+
+        new_lines = list(added)
+        self.offsets.extend(accumulate((len(line) + 1 for line in new_lines[:-1]), initial=len(self.text)))
+        self.text += b"\n".join(new_lines)
+        self.text += b"\n"
+        self.non_rules.update(rule_id for rule_id, line in zip(added.values(), new_lines) if line.lstrip()[:1] in (b"", b"!"))
+        self.non_ascii.update(rule_id for rule_id, line in zip(added.values(), new_lines) if not line.isascii())
+
+        # A new line whose hash is already taken is looked up by its bytes instead
+        added_hashes = {}
+        for line, rule_id in added.items():
+            line_hash = hash(line)
+            position = bisect.bisect_left(hashes, line_hash)
+            if line_hash in added_hashes or (position < len(hashes) and hashes[position] == line_hash):
+                self.collisions[line] = rule_id
+            else:
+                added_hashes[line_hash] = rule_id
+        self.add_hashes(added_hashes)
+        return ids
+
+    # Merge the hashes of new rules, given as a hash -> rule id dict, into the sorted hash lookup,
+    # copying the runs of existing hashes between them in one go
+    def add_hashes(self, added):
+        new_hashes = sorted(added)
+        hashes = array("q")
+        hash_ids = array("I")
+        start = 0
+        for line_hash, rule_id, position in zip(new_hashes, map(added.__getitem__, new_hashes), map(bisect.bisect_left, repeat(self.hashes), new_hashes)):
+            if position > start:
+                hashes.extend(self.hashes[start:position])
+                hash_ids.extend(self.hash_ids[start:position])
+                start = position
+            hashes.append(line_hash)
+            hash_ids.append(rule_id)
+        hashes.extend(self.hashes[start:])
+        hash_ids.extend(self.hash_ids[start:])
+        self.hashes = hashes
+        self.hash_ids = hash_ids
+
+    # Store the lines of a list under a key, replacing an older version of it, returns its rule ids
+    def add_list(self, key, version, lines):
+        replaced = key in self.lists
+        self.lists[key] = (version, self.intern(lines))
+        if replaced:
+            self.compact_if_sparse()
+        return self.lists[key][1]
+
+    # Get the rule ids of a stored list if the stored version is the given one, otherwise None
+    def get_list(self, key, version):
+        stored = self.lists.get(key)
+        if stored is None or stored[0] != version:
+            return None
+        return stored[1]
+
+    # Forget a list
+    def remove_list(self, key):
+        if self.lists.pop(key, None) is not None:
+            self.compact_if_sparse()
+
+    # Forget every list whose key is not among the given ones
+    def retain_lists(self, keys):
+        removed = [key for key in self.lists if key not in keys]
+        for key in removed:
+            del self.lists[key]
+        if removed:
+            self.compact_if_sparse()
+
+    # Count the distinct rules the stored lists refer to
+    def count_referenced(self):
+        return len(set().union(*(ids for _, ids in self.lists.values())))
+
+    # Compact the store once most stored rules belong to no list any more
+    def compact_if_sparse(self):
+        if len(self.offsets) > 2 * self.count_referenced():
+            self.compact()
+
+    # Store the lists again from scratch, dropping the rules none of them refers to any more
+    def compact(self):
+        text, offsets, lists = self.text, self.offsets, self.lists
+        self.__init__()
+        for key, (version, ids) in lists.items():
+            self.lists[key] = (version, self.intern(get_line(text, offsets[rule_id]) for rule_id in ids))
+
+    # Get the stored rules matching a compiled pattern query, as a rule id -> line bytes dict. The distinct
+    # rules are searched as one buffer, so a rule is looked at once however many lists have it.
+    def find(self, query):
+        offsets = self.offsets
+        return {bisect.bisect_left(offsets, start): line for start, line in iter_buffer_matches(self.text, query)}
+
+    # Get the stored rules containing an ASCII needle, ignoring case like str.lower does, as a rule id -> line bytes
+    # dict. Blank and comment lines are left out. Each ASCII line with a match is found by one regex match over
+    # the buffer, the few other lines are decoded and lowered, as "İ" or "K" (Kelvin) lower to ASCII letters.
+    def find_substring(self, needle):
+        offsets = self.offsets
+        non_rules = self.non_rules
+        line_pattern = re.compile(rb"^.*" + re.escape(needle) + rb".*", re.IGNORECASE | re.MULTILINE)
+        found = {}
+        for match in line_pattern.finditer(self.text):
+            rule_id = bisect.bisect_left(offsets, match.start())
+            if rule_id not in non_rules:
+                found[rule_id] = match.group()
+        lowered_needle = needle.decode("ascii").lower()
+        for rule_id in self.non_ascii - non_rules - found.keys():
+            line = get_line(self.text, offsets[rule_id])
+            if lowered_needle in line.decode("utf-8", errors="replace").lower():
+                found[rule_id] = line
+        return found
+
+    # Get the ids of a stored list that are among the given rule ids, in list order
+    def select(self, key, rule_ids):
+        ids = self.lists[key][1]
+        if not rule_ids:
+            return []
+        return list(compress(ids, map(rule_ids.__contains__, ids)))
+
+    # Get overlap statistics of stored lists: the rule lines and distinct rules of each list, the rules only it has
+    # among them, the rules each pair of them shares and the distinct rules of all of them together.
+    # Blank and comment lines are left out.
+    def get_overlap(self, keys):
+        non_rules = self.non_rules
+        rule_sets = {key: set(self.lists[key][1]) - non_rules for key in keys}
+        list_counts = Counter()
+        for rules in rule_sets.values():
+            list_counts.update(rules)
+        single = {rule_id for rule_id, count in list_counts.items() if count == 1}
+        return {
+            "lines": {key: len(self.lists[key][1]) - sum(map(non_rules.__contains__, self.lists[key][1])) for key in keys},
+            "rules": {key: len(rules) for key, rules in rule_sets.items()},
+            "only": {key: len(rules & single) for key, rules in rule_sets.items()},
+            "shared": {(first, second): len(rule_sets[first] & rule_sets[second]) for first, second in combinations(keys, 2)},
+            "distinct": len(list_counts),
+        }
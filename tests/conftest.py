@@ -0,0 +1,69 @@
+import functools
+import http.server
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pytest
+
+# The modules under test live at the top of the repository, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Serves files like the list hosts do, with Last-Modified and 304 responses, without logging each request
+class ListRequestHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve a directory over HTTP from a background thread, yields the directory and its base URL
+@pytest.fixture
+def list_server(tmp_path):
+    directory = tmp_path / "served"
+    directory.mkdir()
+    handler = functools.partial(ListRequestHandler, directory=str(directory))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield directory, f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+
+# Run the engine in an empty working directory, with an empty HTTP cache and nothing loaded or searched yet
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    import filter_engine
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    monkeypatch.setattr(filter_engine, "cache_metadata", {})
+    monkeypatch.setattr(filter_engine, "last_search", None)
+    monkeypatch.setattr(filter_engine, "rule_store", filter_engine.RuleStore())
+    monkeypatch.setattr(filter_engine, "trigram_index_cache", OrderedDict())
+    monkeypatch.setattr(filter_engine, "rule_index_cache", OrderedDict())
+    monkeypatch.setattr(filter_engine, "membership_index_cache", {"files": None, "index": None})
+    monkeypatch.setattr(filter_engine, "coverage_index_cache", {"files": None, "index": None})
+    monkeypatch.setattr(filter_engine, "url_matcher_cache", {"files": None, "index": None})
+    filter_engine.init_local_content()
+    yield filter_engine
+    filter_engine.shutdown_search_pool()
+    filler = filter_engine.rule_store_filler
+    if filler is not None:
+        filler.join()
+
+
+# Get a function saving lists, given as title -> lines, in the served directory and returning a catalog of them.
+# List n has the uuid "uuid-n" and one source.
+@pytest.fixture
+def serve_catalog(list_server):
+    directory, base_url = list_server
+
+    def serve(lists):
+        catalog = []
+        for number, (title, lines) in enumerate(lists.items()):
+            (directory / f"list{number}.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+            source = {"url": f"{base_url}list{number}.txt", "title": f"{title} source"}
+            catalog.append({"uuid": f"uuid-{number}", "title": title, "sources": [source]})
+        return catalog
+    return serve
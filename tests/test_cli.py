@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+
+import pytest
+
+LISTS = {
+    "Ads": ["! Title: Ads", "||ads.example.com^", "example.com##.banner"],
+    "Annoyances": ["example.com##.cookie-banner", "||ads.example.com^"],
+}
+
+
+# Serve the lists and a catalog of them, and point the command line at that catalog
+@pytest.fixture
+def cli(engine, serve_catalog, list_server, monkeypatch):
+    directory, base_url = list_server
+    catalog = serve_catalog(LISTS)
+    (directory / "catalog.json").write_text(json.dumps(catalog), encoding="utf-8")
+    monkeypatch.setattr(engine, "CATALOG_URL", f"{base_url}catalog.json")
+    return engine
+
+
+# Run a command line and get its exit status and stdout
+def run(cli, capsys, *argv):
+    status = cli.main(list(argv))
+    return status, capsys.readouterr().out
+
+
+def test_search_streams_the_hits_in_each_format(cli, capsys, tmp_path):
+    status, out = run(cli, capsys, "search", "ads", "--list", "Ads", "--list", "uuid-1")
+    assert status == 0
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {"list": "Ads", "source": "Ads source", "url": cli.CATALOG_URL.replace("catalog.json", "list0.txt"), "rule": "||ads.example.com^"},
+        {"list": "Annoyances", "source": "Annoyances source", "url": cli.CATALOG_URL.replace("catalog.json", "list1.txt"), "rule": "||ads.example.com^"},
+    ]
+
+    assert run(cli, capsys, "search", "banner", "--all", "--format", "txt") == (0, "example.com##.banner\nexample.com##.cookie-banner\n")
+    status, out = run(cli, capsys, "search", "banner", "-l", "Ads", "--format", "csv")
+    assert [row[0] for row in csv.reader(io.StringIO(out))] == ["list", "Ads"]
+
+    output = tmp_path / "hits.csv"
+    assert run(cli, capsys, "search", "banner", "--all", "-o", str(output)) == (0, "")
+    assert [row[3] for row in csv.reader(output.open(encoding="utf-8", newline=""))] == [
+        "rule", "example.com##.banner", "example.com##.cookie-banner",
+    ]
+
+    # Worker processes write the same hits, and no search of the command line is kept for narrowing
+    assert run(cli, capsys, "search", "banner", "--all", "-j", "2", "--format", "txt") == (0, "example.com##.banner\nexample.com##.cookie-banner\n")
+    assert cli.last_search is None
+
+
+def test_unknown_lists_and_invalid_patterns_are_reported(cli, capsys):
+    with pytest.raises(SystemExit, match="Unknown list: Privacy"):
+        cli.main(["search", "ads", "--list", "Privacy"])
+    assert run(cli, capsys, "search", "/ads(/", "--all") == (0, "")
+
+
+def test_lists_and_compare(cli, capsys, tmp_path):
+    status, out = run(cli, capsys, "lists")
+    assert [(item["uuid"], item["title"]) for item in map(json.loads, out.splitlines())] == [("uuid-0", "Ads"), ("uuid-1", "Annoyances")]
+
+    rules = tmp_path / "rules.txt"
+    rules.write_text("||ads.example.com^\n\n||new.example.net^\n", encoding="utf-8")
+    status, out = run(cli, capsys, "compare", str(rules), "--list", "Ads")
+    assert [json.loads(line) for line in out.splitlines()] == [
+        {"rule": "||ads.example.com^", "status": "duplicate", "existing": "||ads.example.com^"},
+        {"rule": "||new.example.net^", "status": "new", "existing": None},
+    ]
+    status, out = run(cli, capsys, "compare", str(rules), "--catalog", "--format", "csv")
+    assert list(csv.reader(io.StringIO(out))) == [
+        ["rule", "status", "lists"],
+        ["||ads.example.com^", "duplicate", "Ads (Ads source); Annoyances (Annoyances source)"],
+        ["||new.example.net^", "new", ""],
+    ]
@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+import os
+
+import pytest
+
+import filter_engine
+
+RECORDS = [
+    {"rule": "||ads.example.com^", "status": "new", "lists": []},
+    {"rule": "example.com##.ad, .banner", "status": "duplicate", "lists": ["Ads", "Annoyances"]},
+]
+
+
+# Write the records in a format and get the written text
+def write(export_format, fields, records=RECORDS):
+    file = io.StringIO(newline="")
+    count = filter_engine.write_records(iter(records), file, export_format, fields)
+    return count, file.getvalue()
+
+
+def test_records_are_written_in_each_format():
+    count, text = write("txt", filter_engine.CATALOG_COMPARISON_FIELDS)
+    assert (count, text) == (2, "||ads.example.com^\nexample.com##.ad, .banner\n")
+
+    count, text = write("csv", filter_engine.CATALOG_COMPARISON_FIELDS)
+    assert count == 2
+    assert list(csv.reader(io.StringIO(text))) == [
+        ["rule", "status", "lists"],
+        ["||ads.example.com^", "new", ""],
+        ["example.com##.ad, .banner", "duplicate", "Ads; Annoyances"],
+    ]
+    assert list(csv.reader(io.StringIO(write("csv", ("rule",))[1]))) == [["rule"], ["||ads.example.com^"], ["example.com##.ad, .banner"]]
+
+    count, text = write("jsonl", ("rule", "lists"))
+    assert [json.loads(line) for line in text.splitlines()] == [{"rule": record["rule"], "lists": record["lists"]} for record in RECORDS]
+    assert write("jsonl", ("rule",), []) == (0, "")
+
+
+def test_exports_pick_the_format_from_the_extension(tmp_path):
+    for name, first_line in (("out.txt", "||ads.example.com^"), ("out.csv", "rule,status,lists"), ("out.JSONL", '{"rule": "||ads.example.com^"')):
+        filename = str(tmp_path / name)
+        assert filter_engine.export_records(filename, iter(RECORDS), filter_engine.CATALOG_COMPARISON_FIELDS) == 2
+        with open(filename, encoding="utf-8") as file:
+            assert file.readline().startswith(first_line)
+    assert filter_engine.export_records(str(tmp_path / "forced.txt"), iter(RECORDS), ("rule",), "csv") == 2
+    assert (tmp_path / "forced.txt").read_text().startswith("rule\n")
+
+
+def test_failed_exports_keep_the_previous_file(tmp_path):
+    filename = tmp_path / "out.txt"
+    filename.write_text("previous export\n")
+
+    def failing_records():
+        yield RECORDS[0]
+        raise OSError("list went missing")
+    with pytest.raises(OSError):
+        filter_engine.export_records(str(filename), failing_records(), ("rule",))
+    assert filename.read_text() == "previous export\n"
+    assert os.listdir(tmp_path) == ["out.txt"]
+
+
+def test_search_results_are_exported_with_their_lists(engine, serve_catalog, tmp_path):
+    catalog = serve_catalog({
+        "Ads": ["! Title: Ads", "||ads.example.com^", "example.com##.banner"],
+        "Annoyances": ["example.com##.cookie-banner", "||popup.example.org^"],
+    })
+    filename = str(tmp_path / "hits.csv")
+    assert engine.export_search_results(filename, catalog, "banner", ["uuid-0", "uuid-1"]) == 2
+    with open(filename, newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert [(row["list"], row["source"], row["rule"]) for row in rows] == [
+        ("Ads", "Ads source", "example.com##.banner"),
+        ("Annoyances", "Annoyances source", "example.com##.cookie-banner"),
+    ]
+    assert rows[0]["url"].endswith("/list0.txt")
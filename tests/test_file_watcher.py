@@ -0,0 +1,40 @@
+import os
+
+from file_watcher import FileWatcher, get_file_version
+
+
+def test_versions_change_with_the_file(tmp_path):
+    path = tmp_path / "state.json"
+    assert get_file_version(str(path)) is None
+    path.write_text("{}")
+    version = get_file_version(str(path))
+    path.write_text('{"a": 1}')
+    assert get_file_version(str(path)) != version
+
+
+def test_check_reports_each_change_once(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{}")
+    changes = []
+    watcher = FileWatcher(str(path), changes.append)
+    watcher.check()
+    assert changes == []
+
+    path.write_text('{"a": 1}')
+    watcher.check()
+    watcher.check()
+    assert changes == [get_file_version(str(path))]
+
+    os.remove(path)
+    watcher.check()
+    assert changes[-1] is None and len(changes) == 2
+
+
+# Errors of the callback are reported without stopping the watcher
+def test_check_survives_callback_errors(tmp_path, capsys):
+    path = tmp_path / "state.json"
+    watcher = FileWatcher(str(path), lambda version: 1 / 0)
+    path.write_text("{}")
+    watcher.check()
+    assert "Error handling a change" in capsys.readouterr().err
+    assert watcher.version == get_file_version(str(path))
@@ -0,0 +1,153 @@
+import gzip
+import json
+import os
+
+import pytest
+
+import filter_engine
+
+
+# Write a Local State file in Brave's compact layout
+def write_local_state(path, custom_filters="", regional_filters=None):
+    document = {"brave": {"ad_block": {"custom_filters": custom_filters, "regional_filters": regional_filters or {}}}}
+    path.write_text(json.dumps(document, separators=(",", ":")), encoding="utf-8")
+
+
+# Save a list the way downloads are saved, gzip-compressed, and return its filename
+def write_list(path, lines):
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def fresh_local_state(monkeypatch):
+    monkeypatch.setattr(filter_engine, "local_state_cache", {"key": None, "document": None, "filters": None})
+    monkeypatch.setattr(filter_engine, "local_state_seen", {"path": None, "filters": None})
+
+
+def test_atomic_writes_replace_the_file_without_leftovers(tmp_path):
+    path = tmp_path / "Local State"
+    path.write_text("old")
+    os.chmod(path, 0o600)
+    filter_engine.write_file_atomically(str(path), "new")
+    assert path.read_text() == "new"
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.listdir(tmp_path) == ["Local State"]
+
+
+def test_atomic_writes_refuse_to_overwrite_a_changed_file(tmp_path):
+    path = tmp_path / "Local State"
+    path.write_text("old")
+    version = filter_engine.get_file_version(str(path))
+    path.write_text("changed by Brave")
+    with pytest.raises(filter_engine.FileChangedError):
+        filter_engine.write_file_atomically(str(path), "new", version)
+    assert path.read_text() == "changed by Brave"
+    assert os.listdir(tmp_path) == ["Local State"]
+
+
+def test_custom_filters_are_added_once_in_the_original_layout(tmp_path):
+    path = tmp_path / "Local State"
+    write_local_state(path, "||a.com^\n||b.com^")
+    original = path.read_text()
+    added = filter_engine.add_custom_filters([" ||b.com^", "||c.com^", "||c.com^", ""], str(path))
+    assert added == 1
+    content = path.read_text()
+    assert "\n" not in content
+    assert json.loads(content)["brave"]["ad_block"]["custom_filters"] == "||a.com^\n||b.com^\n||c.com^"
+    assert (tmp_path / "Local State.bak1").read_text() == original
+    assert filter_engine.add_custom_filters(["||a.com^"], str(path)) == 0
+    assert path.read_text() == content
+
+
+def test_local_state_changes_are_reported_since_the_last_call(tmp_path):
+    path = tmp_path / "Local State"
+    write_local_state(path, "||a.com^", {"uuid-1": {"enabled": True}, "uuid-2": {"enabled": False}})
+    assert filter_engine.get_local_state_changes(str(path)) is None
+    write_local_state(path, "||b.com^\n||a.com^", {"uuid-1": {"enabled": False}, "uuid-2": {"enabled": True}})
+    assert filter_engine.get_local_state_changes(str(path)) == {
+        "enabled": ["uuid-2"],
+        "disabled": ["uuid-1"],
+        "custom_added": ["||b.com^"],
+        "custom_removed": [],
+    }
+    assert filter_engine.get_local_state_changes(str(path)) is None
+
+
+def test_postings_round_trip_through_varints():
+    line_numbers = [0, 1, 5, 127, 128, 300, 16384, 2 ** 21, 2 ** 32 + 7]
+    encoded = bytearray()
+    previous = 0
+    for line_number in line_numbers:
+        filter_engine.append_varint(encoded, line_number - previous)
+        previous = line_number
+    assert filter_engine.decode_postings(bytes(encoded)) == line_numbers
+    assert filter_engine.decode_postings(bytes([3, 1, 1])) == [3, 4, 5]
+
+
+def test_trigram_index_narrows_plain_keyword_searches(tmp_path, monkeypatch):
+    monkeypatch.setattr(filter_engine, "trigram_index_cache", type(filter_engine.trigram_index_cache)())
+    lines = ["! Title: banner list", "||ads.example.com^", "##.Banner-top", "||tracker.net^"] + [f"rule{n}" for n in range(300)]
+    filename = write_list(tmp_path / "list.txt.gz", lines)
+    filter_engine.build_trigram_index(filename)
+
+    index = filter_engine.load_trigram_index(filename)
+    assert index["lines"] == len(lines)
+    assert filter_engine.get_trigram_candidates(index, "banner") == [2]
+    assert filter_engine.get_trigram_candidates(index, "rule299") == [303]
+    assert filter_engine.get_trigram_candidates(index, "missing") == []
+    assert filter_engine.load_keyword_index(filename, "banner") is index
+    assert filter_engine.load_keyword_index(filename, "ad") is None
+    assert filter_engine.load_keyword_index(filename, "ads OR banner") is None
+    assert filter_engine.load_keyword_index(filename, "domain:example.com") is None
+
+    # An index older than its list is not used
+    with gzip.open(filename, "wt", encoding="utf-8") as file:
+        file.write("changed\n")
+    os.utime(filename, ns=(0, 0))
+    assert filter_engine.load_trigram_index(filename) is None
+
+
+def test_field_indexes_are_kept_for_the_most_recently_used_lists(tmp_path, monkeypatch):
+    monkeypatch.setattr(filter_engine, "rule_index_cache", type(filter_engine.rule_index_cache)())
+    filenames = [write_list(tmp_path / f"list{n}.txt.gz", [f"||ads{n}.example.com^", "example.com##.ad"])
+                 for n in range(filter_engine.RULE_INDEX_CACHE_SIZE + 1)]
+    first = filter_engine.get_rule_index(filenames[0])
+    assert first["domain"]["example.com"].tolist() == [0, 1]
+    for filename in filenames[1:]:
+        filter_engine.get_rule_index(filename)
+    assert len(filter_engine.rule_index_cache) == filter_engine.RULE_INDEX_CACHE_SIZE
+    assert filenames[0] not in filter_engine.rule_index_cache
+    assert filter_engine.get_rule_index(filenames[-1]) is filter_engine.rule_index_cache[filenames[-1]][1]
+
+
+def test_stored_lists_match_like_the_list_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(filter_engine, "rule_store", filter_engine.RuleStore())
+    filenames = [
+        write_list(tmp_path / "a.txt.gz", ["\u0130stanbul##.ad", "||ads.example.com^", "! ads", "||\u212aelvin.net^"]),
+        write_list(tmp_path / "b.txt.gz", ["||ads.example.com^", "example.org##.AD-banner"]),
+    ]
+    for keyword in ("i", "ads", "AD", "kelvin", "ads OR re:banner$"):
+        results = filter_engine.search_stored_lists(filenames, keyword)
+        for filename in filenames:
+            assert results[filename][1] == filter_engine.search_in_file(filename, keyword), (keyword, filename)
+
+
+def test_refused_writes_keep_the_backups(tmp_path, monkeypatch):
+    path = tmp_path / "Local State"
+    write_local_state(path, "||a.com^")
+    for number in (1, 2, 3):
+        (tmp_path / f"Local State.bak{number}").write_text(f"backup {number}")
+    dump_json_like = filter_engine.dump_json_like
+
+    # Brave saves Local State while the new filters are merged in
+    def dump_while_brave_writes(document, original):
+        write_local_state(path, "||a.com^\n||brave.com^")
+        return dump_json_like(document, original)
+    monkeypatch.setattr(filter_engine, "dump_json_like", dump_while_brave_writes)
+    with pytest.raises(filter_engine.FileChangedError):
+        filter_engine.add_custom_filters(["||b.com^"], str(path))
+    assert [(tmp_path / f"Local State.bak{number}").read_text() for number in (1, 2, 3)] == ["backup 1", "backup 2", "backup 3"]
+    assert "||brave.com^" in path.read_text()
+    assert sorted(os.listdir(tmp_path)) == ["Local State", "Local State.bak1", "Local State.bak2", "Local State.bak3"]
@@ -0,0 +1,28 @@
+import json
+
+from filter_metrics import LATENCY_BUCKETS, export_metrics, get_metrics, record, reset_metrics
+
+
+def test_phases_and_sources_keep_latency_histograms(tmp_path):
+    reset_metrics()
+    record("search", 0.0005, "a.txt.gz", matches=3)
+    record("search", 0.02, "a.txt.gz", matches=1)
+    record("search", 9.0, "b.txt.gz")
+    record("search", 0.0001)
+
+    search = get_metrics()["search"]
+    assert search["count"] == 4
+    assert search["histogram"]["<=0.001s"] == 2
+    assert search["histogram"]["<=0.05s"] == 1
+    assert search["histogram"][f">{LATENCY_BUCKETS[-1]}s"] == 1
+    assert list(search["sources"]) == ["b.txt.gz", "a.txt.gz"]  # Slowest first
+    source = search["sources"]["a.txt.gz"]
+    assert (source["count"], source["max"], source["counters"]) == (2, 0.02, {"matches": 4})
+    assert source["histogram"] == dict(search["histogram"], **{"<=0.001s": 1, f">{LATENCY_BUCKETS[-1]}s": 0})
+    assert sum(search["sources"]["b.txt.gz"]["histogram"].values()) == 1
+
+    export_metrics(str(tmp_path / "metrics.json"))
+    exported = json.loads((tmp_path / "metrics.json").read_text())
+    assert exported["phases"]["search"]["sources"]["a.txt.gz"]["histogram"]["<=0.05s"] == 1
+    reset_metrics()
+    assert get_metrics() == {}
@@ -0,0 +1,56 @@
+import re
+
+import pytest
+
+from filter_query import compile_pattern_query, is_pattern_query, match_query, search_buffer
+
+
+# Match a query against a line given as text
+def matches(keyword, line):
+    return match_query(compile_pattern_query(keyword), line.encode("utf-8"))
+
+
+def test_plain_keywords_are_not_pattern_queries():
+    assert not is_pattern_query("ads.example.com")
+    assert not is_pattern_query("and or not")
+    assert is_pattern_query("ads AND banner")
+    assert is_pattern_query("re:^\\|\\|ads")
+
+
+def test_operators_bind_not_then_and_then_or():
+    query = "ads AND NOT third-party OR banner"
+    assert matches(query, "||ads.example.com^")
+    assert not matches(query, "||ads.example.com^$third-party")
+    assert matches(query, "##.banner$third-party")
+    assert not matches(query, "||tracker.example^")
+
+
+def test_adjacent_terms_must_all_match():
+    assert matches("ads banner", "||ads.example.com/banner.gif")
+    assert not matches("ads banner", "||ads.example.com^ OR x")
+
+
+def test_quoted_phrases_and_regex_terms():
+    assert matches('"##.ad banner"', "example.com##.ad banner")
+    assert not matches('"##.ad banner"', "example.com##.ad")
+    assert matches("re:^\\|\\|ads\\.", "||ADS.example.com^")
+    assert not matches("re:^\\|\\|ads\\.", "@@||ads.example.com^")
+
+
+def test_invalid_queries_raise_re_error():
+    with pytest.raises(re.error):
+        compile_pattern_query("re:(")
+    with pytest.raises(re.error):
+        compile_pattern_query("ads AND")
+    with pytest.raises(re.error):
+        compile_pattern_query("OR ads")
+
+
+def test_search_buffer_skips_comments_and_keeps_line_order():
+    buffer = b"! ads comment\n||ads.example.com^\r\nexample.com##.banner\n||ads.other.org^"
+    assert search_buffer(buffer, compile_pattern_query("ads OR banner")) == [
+        b"||ads.example.com^",
+        b"example.com##.banner",
+        b"||ads.other.org^",
+    ]
+    assert search_buffer(buffer, compile_pattern_query("NOT ads")) == [b"example.com##.banner"]
@@ -0,0 +1,50 @@
+from filter_rules import build_rule_index, canonicalize_rule, parse_query, parse_rule, resolve_option_name, search_rule_index
+
+
+def test_parse_query_splits_fields_from_text():
+    assert parse_query("domain:Example.com type:cosmetic banner ad") == ([("domain", "example.com"), ("kind", "cosmetic")], "banner ad")
+    assert parse_query("https://example.com") == ([], "https://example.com")
+    assert parse_query("unknown:field") == ([], "unknown:field")
+
+
+def test_parse_rule_kinds_and_fields():
+    assert parse_rule("! comment") is None
+    assert parse_rule("[Adblock Plus 2.0]") is None
+    rule = parse_rule("@@||Example.com/path^$script,domain=a.com|~b.com")
+    assert (rule.kind, rule.hostname, rule.domains) == ("exception", "example.com", ("a.com", "~b.com"))
+    assert rule.options == (("script", None), ("domain", "a.com|~b.com"))
+    assert parse_rule("example.com##.ad").kind == "cosmetic"
+    assert parse_rule("example.com##+js(abort-on-property-read, x)").kind == "scriptlet"
+    assert parse_rule("/ads\\$/$script").pattern == "/ads\\$/"
+
+
+def test_structured_search_finds_subdomains():
+    lines = ["||ads.example.com^", "example.com##.banner", "||other.org^$third-party", "! example.com"]
+    index = build_rule_index(lines)
+    assert search_rule_index(lines, index, [("domain", "example.com")]) == ["||ads.example.com^", "example.com##.banner"]
+    assert search_rule_index(lines, index, [("domain", "example.com"), ("kind", "cosmetic")]) == ["example.com##.banner"]
+    assert search_rule_index(lines, index, [("option", "third-party")], "OTHER") == ["||other.org^$third-party"]
+
+
+def test_option_aliases_keep_their_negation():
+    assert resolve_option_name("3p") == "third-party"
+    assert resolve_option_name("~3p") == "~third-party"
+    assert resolve_option_name("1p") == "~third-party"
+    assert resolve_option_name("~1p") == "third-party"
+    assert resolve_option_name("~first-party") == "third-party"
+    assert resolve_option_name("~script") == "~script"
+
+
+def test_canonical_rules_ignore_option_order_aliases_and_host_case():
+    assert canonicalize_rule("||a.com^$~3p") == canonicalize_rule("||a.com^$1p")
+    assert canonicalize_rule("||a.com^$~1p") == canonicalize_rule("||a.com^$3p")
+    assert canonicalize_rule("||Tracker.NET^$third-party,script") == canonicalize_rule("||tracker.net^$script,third-party")
+    assert canonicalize_rule("||a.com^$domain=B.com|a.com") == canonicalize_rule(" ||a.com^$domain=a.com|b.com ")
+    assert canonicalize_rule("b.com,a.com##.ad") == canonicalize_rule("a.com,b.com##.ad")
+
+
+def test_canonical_rules_keep_what_changes_a_rule():
+    # Paths can be case sensitive, and negated options differ from plain ones
+    assert canonicalize_rule("||a.com/Ads.js") != canonicalize_rule("||a.com/ads.js")
+    assert canonicalize_rule("||a.com^$3p") != canonicalize_rule("||a.com^$1p")
+    assert canonicalize_rule("@@||a.com^") != canonicalize_rule("||a.com^")
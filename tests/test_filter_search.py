@@ -0,0 +1,158 @@
+import os
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+LISTS = {
+    "Ads": ["! Title: Ads", "||ads.example.com^", "example.com##.banner", "||tracker.net^$third-party"],
+    "Annoyances": ["example.com##.cookie-banner", "||ads.example.com^", "||popup.example.org^"],
+}
+
+
+# Get the matching lines of each source of a search, in result order
+def get_source_lines(events):
+    return [(event[2], event[3]) for event in events if event[0] == "source"]
+
+
+# Record the calls of an engine function, still calling it
+def spy(monkeypatch, engine, name):
+    calls = []
+    function = getattr(engine, name)
+
+    def recorded(*args, **kwargs):
+        calls.append(args)
+        return function(*args, **kwargs)
+    monkeypatch.setattr(engine, name, recorded)
+    return calls
+
+
+# Wait until the rule store holds the lists of the last interactive search
+def wait_for_rule_store(engine):
+    filler = engine.rule_store_filler
+    if filler is not None:
+        filler.join()
+
+
+def test_interactive_searches_use_the_rule_store_once_it_is_filled(engine, serve_catalog, monkeypatch):
+    catalog = serve_catalog(LISTS)
+    uuids = ["uuid-0", "uuid-1"]
+    stored_searches = spy(monkeypatch, engine, "search_stored_lists")
+
+    # The first search of lists not in the store searches the files while the store is filled
+    first = get_source_lines(engine.iter_search_results(catalog, "ads", uuids, interactive=True))
+    assert first == [("Ads source", ["||ads.example.com^"]), ("Annoyances source", ["||ads.example.com^"])]
+    assert stored_searches == []
+    wait_for_rule_store(engine)
+    assert sorted(engine.rule_store.lists) == sorted(engine.get_list_filename(uuid, f"{title} source") for uuid, title in zip(uuids, LISTS))
+
+    second = get_source_lines(engine.iter_search_results(catalog, "banner", uuids, interactive=True))
+    assert second == [("Ads source", ["example.com##.banner"]), ("Annoyances source", ["example.com##.cookie-banner"])]
+    assert len(stored_searches) == 1
+    assert second == get_source_lines(engine.iter_search_results(catalog, "banner", uuids))
+
+    # Deselected lists are dropped from the store, a single list is searched from its file
+    get_source_lines(engine.iter_search_results(catalog, "example", uuids[:1], interactive=True))
+    wait_for_rule_store(engine)
+    assert engine.rule_store.lists == {}
+    assert len(stored_searches) == 1
+
+
+def test_longer_keywords_narrow_the_previous_matches(engine, serve_catalog, monkeypatch):
+    catalog = serve_catalog({
+        "Ads": ["||ads.example.com^", "||ads.other.net^", "example.com##.ads-banner"],
+        "Annoyances": ["||ads.example.com/popup.js", "example.org##.cookie"],
+    })
+    file_searches = spy(monkeypatch, engine, "search_source")
+
+    assert get_source_lines(engine.iter_search_results(catalog, "ads", ["uuid-0"], interactive=True)) == [
+        ("Ads source", ["||ads.example.com^", "||ads.other.net^", "example.com##.ads-banner"]),
+    ]
+    assert len(file_searches) == 1
+    assert get_source_lines(engine.iter_search_results(catalog, "ADS.EX", ["uuid-0"], interactive=True)) == [
+        ("Ads source", ["||ads.example.com^"]),
+    ]
+    assert len(file_searches) == 1
+
+    # Keywords that do not extend the previous one, other selections and pattern queries are searched again
+    list(engine.iter_search_results(catalog, "banner", ["uuid-0"], interactive=True))
+    assert len(file_searches) == 2
+    assert get_source_lines(engine.iter_search_results(catalog, "banner.x", ["uuid-1"], interactive=True)) == [
+        ("Annoyances source", []),
+    ]
+    assert len(file_searches) == 3
+    list(engine.iter_search_results(catalog, "ads", ["uuid-0"], interactive=True))
+    assert get_source_lines(engine.iter_search_results(catalog, "ads OR cookie", ["uuid-0"], interactive=True)) == [
+        ("Ads source", ["||ads.example.com^", "||ads.other.net^", "example.com##.ads-banner"]),
+    ]
+    assert len(file_searches) == 5
+
+    # So is a list whose file changed since the previous search
+    list(engine.iter_search_results(catalog, "ads", ["uuid-0"], interactive=True))
+    filename = engine.get_list_filename("uuid-0", "Ads source")
+    modified = os.path.getmtime(filename) + 10
+    os.utime(filename, (modified, modified))
+    assert get_source_lines(engine.iter_search_results(catalog, "ads.o", ["uuid-0"], interactive=True)) == [
+        ("Ads source", ["||ads.other.net^"]),
+    ]
+    assert len(file_searches) == 7
+
+def test_searches_outside_the_gui_leave_no_state(engine, serve_catalog):
+    catalog = serve_catalog(LISTS)
+    get_source_lines(engine.iter_search_results(catalog, "ads", ["uuid-0", "uuid-1"]))
+    assert engine.last_search is None
+    assert engine.rule_store.lists == {}
+
+
+def test_large_selections_are_searched_by_worker_processes(engine, serve_catalog, monkeypatch):
+    catalog = serve_catalog(LISTS)
+    uuids = ["uuid-0", "uuid-1"]
+    monkeypatch.setattr(engine, "PARALLEL_SEARCH_MIN_SIZE", 0)
+    pool_searches = spy(monkeypatch, engine, "submit_searches")
+
+    inline = get_source_lines(engine.iter_search_results(catalog, "ads", uuids, workers=1))
+    assert pool_searches == []
+    assert get_source_lines(engine.iter_search_results(catalog, "ads", uuids, workers=2)) == inline
+    assert get_source_lines(engine.iter_search_results(catalog, "example.com##", uuids, workers=2)) == [
+        ("Ads source", ["example.com##.banner"]), ("Annoyances source", ["example.com##.cookie-banner"]),
+    ]
+    assert len(pool_searches) == 2
+    assert engine.search_pool is not None
+
+    # Finished searches are no longer counted as running
+    deadline = time.monotonic() + 10
+    while engine.search_pool_pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert engine.search_pool_pending == 0
+    engine.shutdown_search_pool()
+    assert engine.search_pool is None
+
+
+def test_searches_the_pool_could_not_finish_run_inline(engine, serve_catalog):
+    catalog = serve_catalog(LISTS)
+    list(engine.iter_search_results(catalog, "", ["uuid-0", "uuid-1"]))
+    filenames = [engine.get_list_filename(uuid, f"{title} source") for uuid, title in zip(["uuid-0", "uuid-1"], LISTS)]
+    expected = engine.get_source_search_result({}, filenames[0], "ads", False)
+    assert expected[1] == ["||ads.example.com^"]
+
+    cancelled = Future()
+    cancelled.cancel()
+    failed = Future()
+    failed.set_exception(ValueError("lost"))
+    for search in (None, cancelled, failed):
+        assert engine.get_source_search_result({filenames[0]: search}, filenames[0], "ads", False) == expected
+
+    # A broken pool is not used for the remaining searches either
+    broken = Future()
+    broken.set_exception(BrokenProcessPool("killed"))
+    searches = {filenames[0]: broken, filenames[1]: Future()}
+    assert engine.get_source_search_result(searches, filenames[0], "ads", False) == expected
+    assert searches == {filenames[0]: None, filenames[1]: None}
+
+
+def test_small_selections_are_searched_inline(engine, serve_catalog):
+    catalog = serve_catalog(LISTS)
+    list(engine.iter_search_results(catalog, "", ["uuid-0", "uuid-1"]))
+    filenames = [engine.get_list_filename(uuid, f"{title} source") for uuid, title in zip(["uuid-0", "uuid-1"], LISTS)]
+    assert engine.start_source_searches(filenames, "ads", False, workers=4) == dict.fromkeys(filenames)
+    assert engine.start_source_searches(filenames[:1], "ads", False, workers=4) == dict.fromkeys(filenames[:1])
+    assert engine.search_pool is None
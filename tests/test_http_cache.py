@@ -0,0 +1,70 @@
+import requests
+
+from filter_metrics import get_metrics, reset_metrics
+
+
+# Save a list in the served directory and get its URL
+def serve_list(list_server, name, lines):
+    directory, base_url = list_server
+    (directory / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return base_url + name
+
+
+# Get the counters recorded for the downloads of a URL
+def get_fetch_counters(url):
+    return get_metrics()["fetch"]["sources"][url]["counters"]
+
+
+def test_unchanged_lists_are_revalidated_with_a_304(engine, list_server):
+    reset_metrics()
+    url = serve_list(list_server, "ads.txt", ["||ads.example.com^"])
+    filename = engine.get_list_filename("uuid-0", "Ads")
+    assert engine.fetch_and_save_url_content(url, filename)
+    assert engine.cache_metadata[url]["last_modified"]
+    assert engine.load_local_content(filename) == "||ads.example.com^\n"
+    assert get_fetch_counters(url)["bytes"] > 0
+
+    # A fresh copy is used without asking the server, a stale one is revalidated
+    file_key = engine.get_file_key(filename)
+    assert engine.ensure_url_content(url, filename)
+    assert get_metrics()["fetch"]["count"] == 1
+    engine.cache_metadata[url]["validated_at"] = 0
+    assert not engine.is_cache_fresh(url, filename)
+    assert engine.ensure_url_content(url, filename)
+    assert get_fetch_counters(url)["not_modified"] == 1
+    assert engine.get_file_key(filename) == file_key
+    assert engine.is_cache_fresh(url, filename)
+
+
+def test_saved_lists_are_used_while_the_server_cannot_be_reached(engine, list_server, monkeypatch):
+    url = serve_list(list_server, "ads.txt", ["||ads.example.com^"])
+    filename = engine.get_list_filename("uuid-0", "Ads")
+    assert engine.fetch_and_save_url_content(url, filename)
+
+    # Nothing listens on the port of a closed server, and a session without retries fails at once
+    offline_url = url.replace(url.split("/")[2], "127.0.0.1:9")
+    monkeypatch.setattr(engine, "http_session", requests.Session())
+    engine.cache_metadata[offline_url] = dict(engine.cache_metadata.pop(url), etag=None, last_modified=None, validated_at=0)
+    assert engine.ensure_url_content(offline_url, filename)
+    assert engine.load_local_content(filename) == "||ads.example.com^\n"
+
+    # Without a saved copy there is nothing to fall back to
+    assert not engine.ensure_url_content(offline_url, engine.get_list_filename("uuid-1", "Other"))
+
+
+def test_missing_and_stale_sources_are_prefetched_together(engine, list_server):
+    urls = [serve_list(list_server, f"list{number}.txt", [f"||ads{number}.example.com^"]) for number in range(3)]
+    sources = [(url, f"Source {number}", engine.get_list_filename(f"uuid-{number}", "Source")) for number, url in enumerate(urls)]
+    sources.append(sources[0])  # A source shared by two lists is fetched once
+    sources.append((list_server[1] + "missing.txt", "Missing", engine.get_list_filename("uuid-9", "Missing")))
+    progress = []
+    fetched = engine.prefetch_sources(sources, lambda done, total, title: progress.append((done, total)))
+    assert fetched == {filename: url != list_server[1] + "missing.txt" for url, _, filename in sources}
+    assert sorted(progress) == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    assert engine.load_local_content(sources[2][2]) == "||ads2.example.com^\n"
+
+    # Fresh copies are not fetched again unless forced, stale ones are revalidated
+    assert engine.prefetch_sources(sources[:3]) == {}
+    engine.cache_metadata[urls[1]]["validated_at"] = 0
+    assert engine.prefetch_sources(sources[:3]) == {sources[1][2]: True}
+    assert engine.prefetch_sources(sources[:3], force=True) == {filename: True for _, _, filename in sources[:3]}
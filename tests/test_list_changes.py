@@ -0,0 +1,91 @@
+import gzip
+import os
+
+import filter_engine
+from filter_metrics import get_metrics, reset_metrics
+from rule_membership import build_membership_index, find_rule_sources
+
+LISTS = {
+    "Ads": ["! Version: 1", "||ads.example.com^", "||tracker.net^", "example.com##.banner"],
+    "Annoyances": ["example.com##.cookie-banner", "||popup.example.org^"],
+}
+
+
+# Save a list the way downloads are saved, gzip-compressed, and return its filename
+def write_list(path, lines):
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return str(path)
+
+
+# Publish a new version of a served list, dated later than the saved copy so the server does not answer 304
+def publish(list_server, number, lines):
+    path = list_server[0] / f"list{number}.txt"
+    modified = os.path.getmtime(path) + 10
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.utime(path, (modified, modified))
+
+
+# Get the entries of a membership index as comparable lists
+def get_entries(index):
+    return list(index["hashes"]), list(index["source_numbers"]), list(index["counts"])
+
+
+def test_diffs_list_added_and_removed_rules_once_in_file_order(tmp_path):
+    old = write_list(tmp_path / "old.txt.gz", ["! Version: 1", "||a.com^", "||b.com^", "||b.com^", "", "||c.com^"])
+    new = write_list(tmp_path / "new.txt.gz", ["! Version: 2", "||d.com^", " ||a.com^ ", "||e.com^", "||d.com^"])
+    assert filter_engine.diff_list_files(old, new) == (["||d.com^", "||e.com^"], ["||b.com^", "||c.com^"])
+    assert filter_engine.diff_list_files(old, old) == ([], [])
+
+
+def test_saved_changes_load_back(engine, tmp_path):
+    directory = tmp_path / "lists"
+    directory.mkdir()
+    filename = write_list(directory / "list.txt.gz", ["||a.com^"])
+    assert engine.load_list_changes(filename) is None
+    changes = {"from": [1, 2], "to": [3, 4], "previous_synced_at": None, "synced_at": 5.0, "added": ["||a.com^"], "removed": []}
+    engine.save_list_changes(filename, changes)
+    assert engine.load_list_changes(filename) == changes
+    assert sorted(os.listdir(directory)) == ["list.txt.gz", "list.txt.gz.changes"]
+
+
+def test_refreshes_record_the_changes_of_each_new_version(engine, serve_catalog, list_server):
+    catalog = serve_catalog(LISTS)
+    assert [changes["synced_at"] for *_, changes in engine.iter_list_changes(catalog, ["uuid-0"])] == [None]
+    filename = engine.get_list_filename("uuid-0", "Ads source")
+    first_key = engine.get_file_key(filename)
+
+    publish(list_server, 0, ["! Version: 2", "||ads.example.com^", "example.com##.banner", "||new.example.com^"])
+    (_, _, _, changes), = engine.iter_list_changes(catalog, ["uuid-0"], refresh=True)
+    assert (changes["added"], changes["removed"]) == (["||new.example.com^"], ["||tracker.net^"])
+    saved = engine.load_list_changes(filename)
+    assert (saved["from"], saved["to"]) == (list(first_key), list(engine.get_file_key(filename)))
+
+    # A version changing only comments replaces the changes too, so they lead to the saved version
+    second_key = engine.get_file_key(filename)
+    publish(list_server, 0, ["! Version: 3", "||ads.example.com^", "example.com##.banner", "||new.example.com^"])
+    (_, _, _, changes), = engine.iter_list_changes(catalog, ["uuid-0"], refresh=True)
+    assert (changes["added"], changes["removed"]) == ([], [])
+    saved = engine.load_list_changes(filename)
+    assert (saved["from"], saved["to"]) == (list(second_key), list(engine.get_file_key(filename)))
+
+
+def test_membership_index_is_updated_from_the_recorded_changes(engine, serve_catalog, list_server):
+    catalog = serve_catalog(LISTS)
+    index = engine.load_catalog_membership_index(catalog)
+    assert [source["list"] for source in find_rule_sources(index, "||tracker.net^")] == ["Ads"]
+
+    for version, lines in enumerate((
+        ["! Version: 2", "||ads.example.com^", "example.com##.banner", "||popup.example.org^"],
+        ["! Version: 3", "||ads.example.com^", "example.com##.banner", "||popup.example.org^"],
+    )):
+        publish(list_server, 0, lines)
+        list(engine.iter_list_changes(catalog, ["uuid-0"], refresh=True))
+        reset_metrics()
+        index = engine.load_catalog_membership_index(catalog)
+        assert get_metrics()["membership_update"]["counters"]["updated"] == 1
+        sources = [(description, engine.iter_local_lines(engine.get_list_filename(item["uuid"], item["sources"][0]["title"])))
+                   for item, description in zip(catalog, index["sources"])]
+        assert get_entries(index) == get_entries(build_membership_index(sources))
+    assert find_rule_sources(index, "||tracker.net^") == []
+    assert [source["list"] for source in find_rule_sources(index, "||popup.example.org^")] == ["Ads", "Annoyances"]
@@ -0,0 +1,69 @@
+from rule_coverage import build_coverage_index, find_covering_rule
+
+
+# Build a coverage index from lists given as source name and lines
+def build_index(**lists):
+    return build_coverage_index(list(lists.items()))
+
+
+def test_rules_under_a_host_rule_are_redundant():
+    index = build_index(a=["||example.com^"])
+    assert find_covering_rule(index, "||ads.example.com^") == ("redundant", "||example.com^", "a")
+    assert find_covering_rule(index, "||example.com^$script,third-party") == ("redundant", "||example.com^", "a")
+    assert find_covering_rule(index, "||example.com^|") == ("redundant", "||example.com^", "a")
+    assert find_covering_rule(index, "||notexample.com^") == (None, None, None)
+
+
+def test_rules_without_a_separator_after_the_host_are_left_out():
+    # ||example.com also matches example.community, so it neither covers nor is covered by ||example.com^
+    index = build_index(a=["||example.com"])
+    assert find_covering_rule(index, "||example.com^") == (None, None, None)
+    index = build_index(a=["||example.com^"])
+    assert find_covering_rule(index, "||example.com") == (None, None, None)
+
+
+def test_rules_do_not_cover_themselves_in_their_own_source():
+    index = build_index(a=["||example.com^"], b=["||example.com^"])
+    assert find_covering_rule(index, "||example.com^", skip_source=0) == ("redundant", "||example.com^", "b")
+
+
+def test_narrower_options_do_not_cover_broader_rules():
+    index = build_index(a=["||example.com^$script", "||example.com^$1p"])
+    assert find_covering_rule(index, "||example.com^") == (None, None, None)
+    assert find_covering_rule(index, "||example.com^$script,image") == (None, None, None)
+    assert find_covering_rule(index, "||example.com^$script,xhr") == (None, None, None)
+    assert find_covering_rule(index, "||example.com^$first-party")[0] == "redundant"
+    assert find_covering_rule(index, "||example.com^$~third-party,image")[0] == "redundant"
+    assert find_covering_rule(index, "||example.com^$3p") == (None, None, None)
+
+
+def test_negated_aliases_are_resolved():
+    index = build_index(a=["||example.com^$~1p"])
+    assert find_covering_rule(index, "||example.com^$third-party")[0] == "redundant"
+    assert find_covering_rule(index, "||example.com^$first-party") == (None, None, None)
+
+
+def test_exceptions_shadow_blocking_rules_unless_important():
+    index = build_index(a=["@@||example.com^"], b=["||cdn.example.com^$important"])
+    assert find_covering_rule(index, "||cdn.example.com^") == ("shadowed", "@@||example.com^", "a")
+    assert find_covering_rule(index, "@@||cdn.example.com^$script") == ("redundant", "@@||example.com^", "a")
+    assert find_covering_rule(index, "||cdn.example.com^$important", skip_source=1) == (None, None, None)
+
+
+def test_rules_with_modifier_options_are_left_out():
+    index = build_index(a=["||example.com^$removeparam=utm"])
+    assert find_covering_rule(index, "||example.com^$script") == (None, None, None)
+    index = build_index(a=["||example.com^"])
+    assert find_covering_rule(index, "||example.com^$redirect=noopjs") == (None, None, None)
+    assert find_covering_rule(index, "||example.com/ads.js") == ("redundant", "||example.com^", "a")
+
+
+def test_custom_filters_are_analysed_against_the_selected_lists(engine, serve_catalog):
+    catalog = serve_catalog({"Ads": ["||example.com^", "@@||cdn.example.org^"]})
+    rules = ["||ads.example.com^", "||cdn.example.org^$script", "||new.example.net^", "||new.example.net^$image"]
+    assert list(engine.iter_coverage_analysis(catalog, rules, ["uuid-0"])) == [
+        ("||ads.example.com^", "redundant", "||example.com^", "Ads (Ads source)"),
+        ("||cdn.example.org^$script", "shadowed", "@@||cdn.example.org^", "Ads (Ads source)"),
+        ("||new.example.net^$image", "redundant", "||new.example.net^", "My Custom Filters"),
+    ]
+    assert engine.load_coverage_index(catalog, ["uuid-0"]) is engine.load_coverage_index(catalog, ["uuid-0"])
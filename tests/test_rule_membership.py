@@ -0,0 +1,61 @@
+from rule_membership import (
+    build_membership_index,
+    find_rule_sources,
+    load_membership_index,
+    save_membership_index,
+    update_membership_index,
+)
+
+
+# Get the entries of a membership index as comparable lists
+def get_entries(index):
+    return list(index["hashes"]), list(index["source_numbers"]), list(index["counts"])
+
+
+def test_rules_are_found_by_canonical_form():
+    index = build_membership_index([("a", ["||ads.com^$script,3p", "! comment"]), ("b", ["||ads.com^$third-party,script"])])
+    assert find_rule_sources(index, "||ADS.com^$script,third-party") == ["a", "b"]
+    assert find_rule_sources(index, "! comment") == []
+    assert find_rule_sources(index, "||other.com^") == []
+
+
+def test_incremental_updates_match_a_full_build():
+    old_a = ["r1", "r2", "||x.com^$3p", "shared"]
+    new_a = ["r2", "r3", "||x.com^$third-party", "shared"]
+    b = ["shared", "b1"]
+    index = build_membership_index([("a", old_a), ("b", b)])
+    updated = update_membership_index(index, 0, ["r3", "||x.com^$third-party"], ["r1", "||x.com^$3p"])
+    assert get_entries(updated) == get_entries(build_membership_index([("a", new_a), ("b", b)]))
+    # Removing one of two lines with the same canonical form keeps the rule in the source
+    updated = update_membership_index(updated, 0, [], ["||x.com^$third-party"])
+    assert find_rule_sources(updated, "||x.com^$3p") == []
+    assert find_rule_sources(updated, "shared") == ["a", "b"]
+
+
+def test_updates_add_rules_to_a_source_in_hash_order():
+    index = build_membership_index([("a", ["r1"]), ("b", ["r2"])])
+    updated = update_membership_index(index, 1, ["r1", "r9"], [])
+    assert find_rule_sources(updated, "r1") == ["a", "b"]
+    assert find_rule_sources(updated, "r9") == ["b"]
+    assert list(updated["hashes"]) == sorted(updated["hashes"])
+    # The index updated from is left as it was
+    assert find_rule_sources(index, "r9") == []
+
+
+def test_saved_indexes_load_back_and_corrupt_ones_count_as_missing(tmp_path):
+    filename = str(tmp_path / "membership.idx")
+    index = build_membership_index([("a", ["r1", "r2"]), ("b", ["r2"])])
+    save_membership_index(index, filename, {"files": {"a": [1, 2]}})
+    loaded, metadata = load_membership_index(filename)
+    assert get_entries(loaded) == get_entries(index)
+    assert loaded["sources"] == ["a", "b"]
+    assert metadata == {"files": {"a": [1, 2]}}
+
+    raw = (tmp_path / "membership.idx").read_bytes()
+    (tmp_path / "membership.idx").write_bytes(raw[:-1])
+    assert load_membership_index(filename) == (None, None)
+    (tmp_path / "membership.idx").write_bytes(raw.replace(b'"count"', b'"cuont"'))
+    assert load_membership_index(filename) == (None, None)
+    (tmp_path / "membership.idx").write_bytes(raw.replace(b"{", b"[", 1))
+    assert load_membership_index(filename) == (None, None)
+    assert load_membership_index(str(tmp_path / "missing.idx")) == (None, None)
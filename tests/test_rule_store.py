@@ -0,0 +1,109 @@
+from filter_query import compile_pattern_query
+import rule_store
+from rule_store import RuleStore
+
+
+# Get the text of the rules of a stored list, in list order
+def get_lines(store, key):
+    return [store.get_rule(rule_id) for rule_id in store.lists[key][1]]
+
+
+def test_lines_are_interned_once_across_lists():
+    store = RuleStore()
+    first = store.add_list("a", 1, [b"||ads.com^", b"! comment", b"||ads.com^", b"##.banner"])
+    second = store.add_list("b", 1, [b"##.banner", b"||tracker.net^"])
+    assert len(store) == 4
+    assert first[0] == first[2]
+    assert first[3] == second[0]
+    assert get_lines(store, "a") == ["||ads.com^", "! comment", "||ads.com^", "##.banner"]
+    assert get_lines(store, "b") == ["##.banner", "||tracker.net^"]
+
+
+def test_stored_lists_are_only_returned_for_their_version():
+    store = RuleStore()
+    ids = store.add_list("a", (1, 10), [b"x"])
+    assert store.get_list("a", (1, 10)) is ids
+    assert store.get_list("a", (2, 10)) is None
+    assert store.get_list("b", (1, 10)) is None
+
+
+def test_removing_lists_compacts_the_unreferenced_rules():
+    store = RuleStore()
+    store.add_list("a", 1, [b"a1", b"a2", b"a3", b"shared"])
+    store.add_list("b", 1, [b"shared", b"b1"])
+    store.remove_list("a")
+    assert len(store) == 2
+    assert get_lines(store, "b") == ["shared", "b1"]
+    assert store.find_substring(b"a1") == {}
+
+
+def test_retain_lists_drops_the_other_lists():
+    store = RuleStore()
+    store.add_list("a", 1, [b"a1", b"a2", b"a3"])
+    store.add_list("b", 1, [b"b1"])
+    store.add_list("c", 1, [b"c1"])
+    store.retain_lists({"b", "c"})
+    assert sorted(store.lists) == ["b", "c"]
+    assert len(store) == 2
+    assert get_lines(store, "c") == ["c1"]
+
+
+def test_replacing_a_list_keeps_the_store_consistent():
+    store = RuleStore()
+    store.add_list("a", 1, [b"old1", b"old2", b"old3", b"kept"])
+    store.add_list("a", 2, [b"kept", b"new"])
+    assert get_lines(store, "a") == ["kept", "new"]
+    assert store.count_referenced() == len(store) == 2
+    # Interning again after compaction still finds the existing rules
+    assert list(store.intern([b"new", b"other"]))[0] == store.lists["a"][1][1]
+
+
+def test_find_searches_each_rule_once_and_select_keeps_list_order():
+    store = RuleStore()
+    store.add_list("a", 1, [b"##.Banner", b"! banner comment", b"||ads.com^", b"##.banner-2"])
+    store.add_list("b", 1, [b"##.banner-2", b"##.Banner"])
+    found = store.find_substring(b"banner")
+    assert sorted(found.values()) == [b"##.Banner", b"##.banner-2"]
+    assert [store.get_rule(rule_id) for rule_id in store.select("b", found)] == ["##.banner-2", "##.Banner"]
+    found = store.find(compile_pattern_query("ads OR re:-2$"))
+    assert [store.get_rule(rule_id) for rule_id in store.select("a", found)] == ["||ads.com^", "##.banner-2"]
+
+
+def test_overlap_counts_shared_and_distinct_rules():
+    store = RuleStore()
+    store.add_list("a", 1, [b"! title", b"r1", b"r2", b"r2", b"shared"])
+    store.add_list("b", 1, [b"shared", b"r3"])
+    overlap = store.get_overlap(["a", "b"])
+    assert overlap["lines"] == {"a": 4, "b": 2}
+    assert overlap["rules"] == {"a": 3, "b": 2}
+    assert overlap["only"] == {"a": 2, "b": 1}
+    assert overlap["shared"] == {("a", "b"): 1}
+    assert overlap["distinct"] == 4
+
+
+def test_lines_with_colliding_hashes_stay_apart(monkeypatch):
+    # Every line of the same length gets the same hash
+    monkeypatch.setattr(rule_store, "hash", len, raising=False)
+    store = RuleStore()
+    store.add_list("a", 1, [b"||aa.com^", b"||bb.com^", b"||aa.com^"])
+    store.add_list("b", 1, [b"||cc.com^", b"||bb.com^", b"||ab.com/"])
+    assert len(store) == 4
+    assert get_lines(store, "a") == ["||aa.com^", "||bb.com^", "||aa.com^"]
+    assert get_lines(store, "b") == ["||cc.com^", "||bb.com^", "||ab.com/"]
+    assert store.lists["a"][1][1] == store.lists["b"][1][1]
+    store.remove_list("a")
+    store.compact()
+    assert get_lines(store, "b") == ["||cc.com^", "||bb.com^", "||ab.com/"]
+    assert sorted(store.find_substring(b"bb").values()) == [b"||bb.com^"]
+
+
+def test_substrings_fold_case_like_str_lower():
+    # "\u0130" (capital I with dot) and "\u212a" (Kelvin sign) lower to ASCII letters, bytes regexes do not fold them
+    istanbul = "\u0130stanbul##.ad".encode()
+    kelvin = "||\u212aelvin.com^".encode()
+    store = RuleStore()
+    store.add_list("a", 1, [istanbul, kelvin, "||\u00fcn\u00ef.com^".encode(), b"! istanbul"])
+    assert sorted(store.find_substring(b"i").values()) == sorted([istanbul, kelvin])
+    assert list(store.find_substring(b"kelvin").values()) == [kelvin]
+    assert store.find_substring(b"stanbul") == {0: istanbul}
+    assert store.find_substring(b"un") == {}
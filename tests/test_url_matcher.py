@@ -0,0 +1,63 @@
+from url_matcher import build_url_matcher, is_blocked, match_url
+
+
+# Check whether a URL is blocked by the rules of one list
+def check(lines, url, page_url=None, request_type=None):
+    matcher = build_url_matcher([("list", lines)])
+    return is_blocked([rule for rule, _ in match_url(matcher, url, page_url, request_type)])
+
+
+def test_host_and_path_rules_match_urls():
+    assert check(["||ads.example.com^"], "https://ads.example.com/banner.js")
+    assert check(["||example.com^"], "https://cdn.example.com/x")
+    assert not check(["||example.com^"], "https://example.community/x")
+    assert check(["/banner/*/ad.js"], "https://site.org/banner/123/ad.js")
+    assert not check(["|https://site.org/ad"], "http://other.org/?u=https://site.org/ad")
+    assert check(["/ad[0-9]+\\.js/"], "https://site.org/ad42.js")
+    assert not check(["! ||example.com^", "example.com##.ad"], "https://example.com/")
+
+
+def test_exceptions_unblock_unless_important():
+    assert not check(["||ads.example.com^", "@@||ads.example.com/ok.js"], "https://ads.example.com/ok.js")
+    assert not check(["||ads.example.com^", "@@||example.com^$document"], "https://ads.example.com/x")
+    assert check(["||ads.example.com^$important", "@@||ads.example.com^"], "https://ads.example.com/x")
+
+
+def test_cosmetic_and_modifier_exceptions_do_not_unblock():
+    for exception in ("@@||example.com^$generichide", "@@||example.com^$ghide", "@@||example.com^$elemhide",
+                      "@@||example.com^$removeparam", "@@||example.com^$csp"):
+        assert check(["||example.com^", exception], "https://example.com/x"), exception
+    assert not check(["||example.com^", "@@||example.com^$generichide,document"], "https://example.com/x")
+
+
+def test_modifier_rules_do_not_block():
+    assert not check(["||example.com^$removeparam=utm_source"], "https://example.com/?utm_source=x")
+    assert not check(["||example.com^$csp=script-src 'none'"], "https://example.com/")
+    assert not check(["||example.com^$badfilter"], "https://example.com/")
+    assert check(["||example.com^$redirect=noopjs"], "https://example.com/a.js")
+
+
+def test_party_and_type_options_are_checked_when_known():
+    lines = ["||tracker.net^$third-party,script"]
+    assert check(lines, "https://tracker.net/t.js", "https://news.com/", "script")
+    assert not check(lines, "https://tracker.net/t.js", "https://www.tracker.net/", "script")
+    assert not check(lines, "https://tracker.net/t.js", "https://news.com/", "image")
+    assert check(lines, "https://tracker.net/t.js")
+    assert not check(["||tracker.net^$~1p"], "https://tracker.net/", "https://tracker.net/")
+    assert check(["||tracker.net^$xhr"], "https://tracker.net/", request_type="xmlhttprequest")
+    assert not check(["||tracker.net^$domain=a.com|~b.a.com"], "https://tracker.net/", "https://b.a.com/")
+    assert check(["||tracker.net^$domain=a.com|~b.a.com"], "https://tracker.net/", "https://c.a.com/")
+
+
+def test_urls_are_tested_against_the_selected_lists(engine, serve_catalog):
+    catalog = serve_catalog({"Ads": ["||ads.example.com^", "@@||ads.example.com/ok.js"], "Other": ["||other.net^"]})
+    results = list(engine.iter_url_matches(catalog, ["https://ads.example.com/x.js", "https://ads.example.com/ok.js", "https://other.net/"], ["uuid-0"]))
+    assert [(url, blocked) for url, blocked, _ in results] == [
+        ("https://ads.example.com/x.js", True),
+        ("https://ads.example.com/ok.js", False),
+        ("https://other.net/", False),
+    ]
+    assert results[0][2] == [("||ads.example.com^", "network", "Ads (Ads source)")]
+    # The matcher is reused while the lists stay the same
+    assert engine.load_url_matcher(catalog, ["uuid-0"]) is engine.load_url_matcher(catalog, ["uuid-0"])
+    assert engine.load_url_matcher(catalog, ["uuid-0", "uuid-1"])["rules"] == 3
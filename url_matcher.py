@@ -0,0 +1,242 @@
+import re
+from urllib.parse import urlsplit
+
+from filter_rules import COSMETIC_SEPARATOR, parse_options, parse_rule, resolve_option_name
+from rule_coverage import HOST_RULE, TYPE_OPTIONS, is_within_domains
+
+# Runs of characters URLs and patterns are tokenized into
+TOKEN = re.compile(r"[a-z0-9%]+")
+
+# Splits a pattern into the literal parts a matching URL must contain
+LITERAL_SEPARATOR = re.compile(r"[*^|]")
+
+# Runs of a pattern that are whole tokens, not next to a wildcard or other token characters, at least
+# two characters long since shorter tokens are too common in URLs to narrow the candidates
+PATTERN_TOKEN = re.compile(r"(?<![a-z0-9%*])[a-z0-9%]{2,}(?![a-z0-9%*])")
+
+# Tokens found in most URLs, a rule is only filed under one of them when it has no other token
+COMMON_TOKENS = {"http", "https", "www", "com", "net", "org", "js", "html", "php", "cdn", "static", "img", "images"}
+
+# Request types accepted when testing a URL, named as in rule options
+REQUEST_TYPES = sorted(TYPE_OPTIONS - {"popup", "object-subrequest"})
+
+# Options of rules that change a request rather than block it. Such a rule does not block a request,
+# and as an exception it only turns that change off.
+MODIFIER_OPTIONS = {"csp", "removeparam", "queryprune", "redirect-rule", "header", "permissions", "replace", "urltransform"}
+
+# Options of exceptions that only turn off element hiding, generic rules or a redirect on a page,
+# not the blocking of the request, unless the exception is also a $document one
+PARTIAL_EXCEPTION_OPTIONS = MODIFIER_OPTIONS | {"generichide", "elemhide", "specifichide", "genericblock", "redirect"}
+
+# Regex for the ^ separator: any character that is not a letter, digit or one of _-.%, or the end of the URL
+SEPARATOR = r"(?:[^\w\-.%]|$)"
+
+# Regex for the || anchor: the scheme and any subdomains in front of the pattern's host
+HOST_ANCHOR = r"^[a-z][a-z0-9+.-]*://(?:[^/?#]*\.)?"
+
+
+# A network rule in a URL matcher, its regex is only compiled once a URL reaches it
+class MatcherRule:
+    __slots__ = ("line", "kind", "pattern", "options", "effect", "source", "regex")
+
+    def __init__(self, line, kind, pattern, options, effect, source):
+        self.line = line
+        self.kind = kind
+        self.pattern = pattern
+        self.options = options  # (name, value) pairs with aliases resolved, negated names start with ~
+        self.effect = effect  # "block", "allow" or None for rules that do not decide whether a request is blocked
+        self.source = source  # Source number in the matcher
+        self.regex = None
+
+
+# Translate an adblock pattern into a regex, or return the body of a /regex/ pattern
+def compile_pattern(pattern, match_case=False):
+    flags = 0 if match_case else re.IGNORECASE
+    if len(pattern) > 2 and pattern.startswith("/") and pattern.endswith("/"):
+        return re.compile(pattern[1:-1], flags)
+
+    prefix = ""
+    if pattern.startswith("||"):
+        prefix = HOST_ANCHOR
+        pattern = pattern[2:]
+    elif pattern.startswith("|"):
+        prefix = "^"
+        pattern = pattern[1:]
+    suffix = ""
+    if pattern.endswith("|"):
+        suffix = "$"
+        pattern = pattern[:-1]
+
+    parts = []
+    for character in pattern:
+        if character == "*":
+            parts.append(".*")
+        elif character == "^":
+            parts.append(SEPARATOR)
+        else:
+            parts.append(re.escape(character))
+    return re.compile(prefix + "".join(parts) + suffix, flags)
+
+
+# Get the tokens of a pattern that every matching URL must contain as whole tokens.
+# A run at an unanchored end of the pattern may only be part of a URL token, like one next to a wildcard.
+def get_pattern_tokens(pattern):
+    if pattern.startswith("/") and pattern.endswith("/"):
+        return []
+    start = "" if pattern.startswith("|") else "*"
+    end = "" if pattern.endswith("|") else "*"
+    return PATTERN_TOKEN.findall(start + pattern.strip("|").lower() + end)
+
+
+# Resolve option aliases, so $3p and $third-party or $xhr and $xmlhttprequest are checked the same way
+def normalize_options(options):
+    return tuple((resolve_option_name(name), value) for name, value in options)
+
+
+# Get what a matching rule does to a request: "block", "allow" for an exception letting it through,
+# or None for modifier rules and exceptions that only turn off cosmetic filtering or a modifier
+def get_rule_effect(kind, options):
+    names = {name for name, _ in options}
+    if kind == "exception":
+        if names & PARTIAL_EXCEPTION_OPTIONS and "document" not in names:
+            return None
+        return "allow"
+    if names & MODIFIER_OPTIONS:
+        return None
+    return "block"
+
+
+# Build a URL matcher from (source, lines) pairs. Each network rule is filed under the one of its tokens
+# that has the fewest rules so far, so a URL only checks the rules filed under its own tokens.
+def build_url_matcher(sources):
+    matcher = {"sources": [], "rules": 0, "tokens": {}, "untokenized": []}
+    tokens = matcher["tokens"]
+    # Lists repeat the same few option strings, rules sharing one share its parsed options too
+    option_cache = {None: ()}
+    effect_cache = {}
+    for source_number, (source, lines) in enumerate(sources):
+        matcher["sources"].append(source)
+        for line in lines:
+            line = line.strip()
+            # Most rules are plain host rules, which need no full parse
+            match = HOST_RULE.match(line)
+            if match is not None:
+                exception, _, option_text = match.groups()
+                kind = "exception" if exception else "network"
+                pattern = line[2:] if exception else line
+                if option_text is not None:
+                    pattern = pattern[:-len(option_text) - 1]
+                if option_text not in option_cache:
+                    option_cache[option_text] = normalize_options(parse_options(option_text))
+                options = option_cache[option_text]
+            elif COSMETIC_SEPARATOR.search(line):
+                continue  # Cosmetic rules and their exceptions are not about URLs
+            else:
+                rule = parse_rule(line)
+                if rule is None:
+                    continue
+                kind, pattern, options = rule.kind, rule.pattern, normalize_options(rule.options)
+            if any(name == "badfilter" for name, _ in options):
+                continue
+            if (kind, options) not in effect_cache:
+                effect_cache[kind, options] = get_rule_effect(kind, options)
+
+            matcher_rule = MatcherRule(line, kind, pattern, options, effect_cache[kind, options], source_number)
+            token = None
+            best = None
+            for candidate in get_pattern_tokens(pattern):
+                rank = (candidate in COMMON_TOKENS, len(tokens.get(candidate, ())), -len(candidate))
+                if best is None or rank < best:
+                    token, best = candidate, rank
+            if token is None:
+                matcher["untokenized"].append(matcher_rule)
+            elif best[1]:
+                tokens[token].append(matcher_rule)
+            else:
+                tokens[token] = [matcher_rule]
+            matcher["rules"] += 1
+    return matcher
+
+
+# Get the host of a URL in lower case, or an empty string
+def get_host(url):
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+# Get the last two labels of a host, a rough stand-in for its registrable domain
+def get_base_domain(host):
+    return ".".join(host.split(".")[-2:])
+
+
+# Check the options of a rule against what is known about the request. Conditions on the page or the
+# request type are only checked when the page URL or request type is given.
+def options_match(options, page_host, request_type, host):
+    types = set()
+    not_types = set()
+    for name, value in options:
+        bare_name = name.lstrip("~")
+        if bare_name in TYPE_OPTIONS:
+            (not_types if name.startswith("~") else types).add(bare_name)
+        elif bare_name == "third-party" and page_host:
+            third_party = get_base_domain(host) != get_base_domain(page_host)
+            if third_party == name.startswith("~"):
+                return False
+        elif name == "domain" and value and page_host:
+            domains = [domain.strip().lower() for domain in value.split("|") if domain.strip()]
+            included = [domain for domain in domains if not domain.startswith("~")]
+            excluded = [domain[1:] for domain in domains if domain.startswith("~")]
+            if included and not is_within_domains(page_host, included):
+                return False
+            if is_within_domains(page_host, excluded):
+                return False
+    if request_type:
+        if types and request_type not in types:
+            return False
+        if request_type in not_types:
+            return False
+    return True
+
+
+# Check one candidate rule against a URL. Most candidates lack one of the literal parts of their
+# pattern and are ruled out before a regex is compiled for them.
+def rule_matches(rule, url, lowered_url, page_host, request_type, host):
+    if rule.regex is None:
+        pattern = rule.pattern
+        if not (pattern.startswith("/") and pattern.endswith("/")):
+            if any(part not in lowered_url for part in LITERAL_SEPARATOR.split(pattern.lower()) if part):
+                return False
+        try:
+            rule.regex = compile_pattern(pattern, any(name == "match-case" for name, _ in rule.options))
+        except re.error:
+            rule.regex = False  # An invalid /regex/ rule never matches
+    return bool(rule.regex) and rule.regex.search(url) is not None and options_match(rule.options, page_host, request_type, host)
+
+
+# Get the rules matching a URL as (rule, source) pairs, checking only the rules filed under the URL's tokens
+# and the few rules that have no token to file them under
+def match_url(matcher, url, page_url=None, request_type=None):
+    host = get_host(url)
+    page_host = get_host(page_url) if page_url else ""
+    lowered_url = url.lower()
+    candidates = list(matcher["untokenized"])
+    for token in set(TOKEN.findall(lowered_url)):
+        candidates.extend(matcher["tokens"].get(token, ()))
+    return [
+        (rule, matcher["sources"][rule.source])
+        for rule in candidates
+        if rule_matches(rule, url, lowered_url, page_host, request_type, host)
+    ]
+
+
+# Check whether matching rules block a request: a blocking rule matches and no exception letting the request
+# through does, unless the blocking rule is $important. Modifier rules and cosmetic exceptions do not count.
+def is_blocked(rules):
+    blocking = [rule for rule in rules if rule.effect == "block"]
+    if not blocking:
+        return False
+    if any(rule.effect == "allow" for rule in rules):
+        return any(name == "important" for rule in blocking for name, _ in rule.options)
+    return True